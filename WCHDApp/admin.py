@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Fund, Line, Dept, Item, Employee, People, ActivityList, Payroll, PayPeriod, Grant, BudgetActions, Carryover, Benefits, Variable, Testing, GrantLine, Expense, Revenue
+from .models import Fund, Line, Dept, Item, Employee, People, ActivityList, Payroll, PayPeriod, Grant, BudgetActions, Carryover, Benefits, Variable, Testing, GrantLine, Expense, Revenue, Job, ImportBatch
 
 
 class PeopleAdmin(admin.ModelAdmin):
@@ -10,6 +10,13 @@ class ExpenseAdmin(admin.ModelAdmin):
 
 class GrantAdmin(admin.ModelAdmin):
     list_display = ("grant_id", "grant_name")
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "status", "progress", "user", "created", "finished")
+    list_filter = ("kind", "status")
+
+class ImportBatchAdmin(admin.ModelAdmin):
+    list_display = ("id", "source", "fileName", "rows", "user", "created", "reversedAt")
 # Register your models here.
 
 admin.site.register(Fund)
@@ -29,6 +36,8 @@ admin.site.register(Benefits)
 admin.site.register(Variable)
 admin.site.register(Expense, ExpenseAdmin)
 admin.site.register(Revenue)
+admin.site.register(Job, JobAdmin)
+admin.site.register(ImportBatch, ImportBatchAdmin)
 
 
 
@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_save, post_delete
 
 
 class WchdappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'WCHDApp'
+
+    def ready(self):
+        #Every table a report can read moves its data version when rows are saved or deleted
+        from .models import markSavedTable, unversionedModels
+        for model in self.get_models():
+            if model.__name__ not in unversionedModels:
+                post_save.connect(markSavedTable, sender=model, dispatch_uid=f"dataVersion-save-{model.__name__}")
+                post_delete.connect(markSavedTable, sender=model, dispatch_uid=f"dataVersion-delete-{model.__name__}")
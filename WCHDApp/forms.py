@@ -36,17 +36,20 @@ class InputSelect(forms.Form):
     
     table = forms.ChoiceField(choices=modelsDict, label="Select Table", required=True)
     file = forms.FileField(
-        label="Upload CSV File",
+        label="Upload CSV or Excel File",
         required=True,
-        widget=forms.ClearableFileInput(attrs={'accept': '.csv'})
+        widget=forms.ClearableFileInput(attrs={'accept': '.csv,.xlsx'})
     )
+    #Runs every check on the file and returns a report of the bad rows without importing anything
+    dryRun = forms.BooleanField(label="Check only (dry run)", required=False)
 
 class FileInput(forms.Form):
     file = forms.FileField(
-        label="Upload CSV File",
+        label="Upload CSV or Excel File",
         required=True,
-        widget=forms.ClearableFileInput(attrs={'accept': '.csv'})
+        widget=forms.ClearableFileInput(attrs={'accept': '.csv,.xlsx'})
     )
+    dryRun = forms.BooleanField(label="Check only (dry run)", required=False)
 
 class ExportSelect(forms.Form):
     #Pulling models
@@ -57,6 +60,8 @@ class ExportSelect(forms.Form):
     
     table = forms.ChoiceField(choices=modelsDict, label="Select Table", required=True)
     fileName = forms.CharField(max_length=20, label="File Name (do not include .csv)", required=True)
+    #Adds the calculated columns tableView shows (Budget Remaining, the Benefits figures...)
+    computed = forms.BooleanField(label="Include calculated columns", required=False)
 
     
 
@@ -0,0 +1,727 @@
+import logging
+import os
+import pandas as pd
+from datetime import date, datetime, time
+from decimal import Decimal, InvalidOperation
+from django.core.exceptions import ValidationError
+from django.core.management.color import no_style
+from django.db import connection, models, transaction
+from django.db.models import F, Value, prefetch_related_objects
+from django.db.models.functions import Concat, Lower, Trim
+from openpyxl import load_workbook
+from .models import Employee, ActivityList, People, PayPeriod, Payroll, Expense, ImportBatch, markChanged
+from .money import toMoney, formatMoney
+
+logger = logging.getLogger(__name__)
+
+#Bulk CSV/.xlsx import used by the imports view, plus the Clockify payroll import
+#Columns are converted a whole column at a time, every foreign key column is looked up with one query
+#and the rows are written with bulk_create/bulk_update in batches instead of a query or two per row
+#Uploads are read chunkSize rows at a time and each chunk is committed on its own,
+#so memory stays the same for a 10k or a 2M row file
+#checkCSV and checkClockify are dry runs, they go through every check for the whole file and write nothing
+
+batchSize = 1000
+chunkSize = 5000
+
+#Running balance counters are kept by Expense/Revenue posts and the import batch is set by the import, never imported
+skippedFields = ["line_budget_spent", "line_total_income", "importBatch"]
+
+#These models build their IDs, check budgets or move balances when they save, so their rows still go through save()
+#Everything else (Item, People, Employee...) is written in bulk
+savedPerRow = ["Fund", "Line", "GrantLine", "Expense", "Revenue"]
+
+trueValues = {"true": True, "1": True, "yes": True, "false": False, "0": False, "no": False}
+
+
+def importFields(model):
+    #Every column the CSV has to have. Foreign keys use the id column name (fund_id, line_id...)
+    return [field for field in model._meta.concrete_fields if field.name not in skippedFields]
+
+
+def readColumns(file, model):
+    #Matches the CSV header to the model, ignoring case and order so grantline_id and grantLine_id both work
+    #Columns that are never imported (skippedFields) are ignored, so a table's own export can be imported again
+    fields = importFields(model)
+    ignored = {
+        name.lower()
+        for field in model._meta.concrete_fields if field.name in skippedFields
+        for name in (field.name, field.attname)
+    }
+    header = {str(column).strip().lower(): column for column in file.columns}
+    missing = [field.attname for field in fields if field.attname.lower() not in header]
+    expected = {field.attname.lower() for field in fields} | ignored
+    unexpected = [column for name, column in header.items() if name not in expected]
+    if missing or unexpected:
+        problems = []
+        if missing:
+            problems.append(f"Missing columns: {', '.join(missing)}")
+        if unexpected:
+            problems.append(f"Unexpected columns: {', '.join(str(column) for column in unexpected)}")
+        raise ValidationError(f"Bad File. {'. '.join(problems)}")
+    return {field: header[field.attname.lower()] for field in fields}
+
+
+def toDecimal(value):
+    try:
+        return Decimal(str(value).strip().replace(",", "").replace("$", ""))
+    except InvalidOperation:
+        return None
+
+
+def convertColumn(column, field):
+    #Converts one raw text column to the python type of the field. Unreadable cells come back empty
+    if field.is_relation:
+        field = field.target_field
+    blank = column.isna() | (column.astype(str).str.strip() == "")
+    if isinstance(field, models.DecimalField):
+        converted = column.map(toDecimal, na_action="ignore")
+    elif isinstance(field, models.IntegerField):
+        converted = pd.to_numeric(column, errors="coerce")
+        #Values like 1.5 cant be cast to Int64, they are blanked so they get reported like any other bad cell
+        converted = converted.where(converted % 1 == 0).astype("Int64")
+    elif isinstance(field, models.DateTimeField):
+        converted = pd.to_datetime(column, errors="coerce", format="mixed")
+    elif isinstance(field, models.DateField):
+        converted = pd.to_datetime(column, errors="coerce", format="mixed").dt.date
+    elif isinstance(field, models.BooleanField):
+        converted = column.astype(str).str.strip().str.lower().map(trueValues)
+    else:
+        converted = column.astype(object).where(~blank, None if field.null else "")
+        return converted, column.index[:0]
+
+    converted = converted.astype(object).where(converted.notna() & ~blank, None)
+    badRows = column.index[~blank & converted.isna()]
+    return converted, badRows
+
+
+def rowNumber(index):
+    #Row numbers as they show up in a spreadsheet, the header is row 1
+    return index + 2
+
+
+def rowErrorMessages(errors):
+    #Row problems are kept as (row, column, problem) so a dry run can hand them back as a report
+    return [f"Row {row}: {column}: {problem}" for row, column, problem in errors]
+
+
+def buildObjects(model, frame, errors):
+    #Turns a frame of raw text into unsaved model instances. Every problem found is added to errors
+    columns = readColumns(frame, model)
+    values = {}
+    for field, column in columns.items():
+        converted, badRows = convertColumn(frame[column], field)
+        for index in badRows:
+            errors.append((rowNumber(index), field.verbose_name, f"'{frame.at[index, column]}' is not a valid value"))
+        values[field] = converted
+
+    #One query per foreign key column for every distinct key in it
+    related = {}
+    for field, column in values.items():
+        if not field.is_relation:
+            continue
+        found = field.related_model._default_manager.in_bulk(list(set(column.dropna())))
+        missing = column.notna() & ~column.isin(list(found))
+        for index, key in column[missing].items():
+            errors.append((rowNumber(index), field.verbose_name, f"No {field.related_model._meta.verbose_name} with ID {key}"))
+        related[field] = found
+
+    objects = []
+    rows = zip(*[column.tolist() for column in values.values()])
+    for row in rows:
+        obj = model()
+        for field, value in zip(values, row):
+            if field.is_relation:
+                setattr(obj, field.name, related[field].get(value))
+            else:
+                setattr(obj, field.attname, value)
+        objects.append(obj)
+    return objects
+
+
+def validateObjects(objects, frame, errors):
+    #Field level checks only. Foreign keys were already checked in bulk and full_clean would query each one again
+    #Rows that already have a problem are skipped so a bad cell isnt reported twice
+    badRows = {row for row, column, problem in errors}
+    for index, obj in zip(frame.index, objects):
+        if rowNumber(index) in badRows:
+            continue
+        exclude = [field.name for field in obj._meta.concrete_fields if field.is_relation]
+        if obj._meta.pk.name not in exclude and obj.pk is None:
+            exclude.append(obj._meta.pk.name)
+        try:
+            obj.clean_fields(exclude=exclude)
+        except ValidationError as e:
+            for field, messages in e.message_dict.items():
+                label = obj._meta.get_field(field).verbose_name
+                errors.append((rowNumber(index), label, " ".join(messages)))
+
+
+def isTagged(model):
+    #Models whose imported rows remember their ImportBatch
+    return any(field.name == "importBatch" for field in model._meta.concrete_fields)
+
+
+def saveBatch(batch):
+    #The batch is only saved when the first chunk is written, inside that chunk's transaction,
+    #so a file that fails before anything is written leaves no batch behind
+    if batch.pk is None:
+        batch.save()
+
+
+def countBatchRows(batch, created):
+    ImportBatch.objects.filter(pk=batch.pk).update(rows=F("rows") + created)
+
+
+def newBatch(source, file, user, job):
+    return ImportBatch(source=source, fileName=os.path.basename(getattr(file, "name", "") or ""), user=user, job=job)
+
+
+def loadExisting(model, objects):
+    #Finds which rows are already in the table. Those rows keep their running counters and the batch that created them,
+    #none of which are in the file, so they are copied onto the objects and the objects are marked as existing
+    keptFields = [field.attname for field in model._meta.concrete_fields if field.name in skippedFields]
+    keys = [obj.pk for obj in objects if obj.pk is not None]
+    existing = {}
+    for start in range(0, len(keys), batchSize):
+        for row in model._default_manager.filter(pk__in=keys[start:start + batchSize]).values("pk", *keptFields):
+            existing[row.pop("pk")] = row
+    for obj in objects:
+        if obj.pk in existing:
+            for attname, value in existing[obj.pk].items():
+                setattr(obj, attname, value)
+            obj._state.adding = False
+    return existing
+
+
+def writeObjects(model, objects, batch=None):
+    #Splits the rows into new and existing by primary key, then writes them in batches
+    #New rows are tagged with batch, rows that already existed keep the batch that created them
+    existing = loadExisting(model, objects)
+    newObjects = [obj for obj in objects if obj.pk not in existing]
+    oldObjects = [obj for obj in objects if obj.pk in existing]
+    if batch:
+        saveBatch(batch)
+        for obj in newObjects:
+            obj.importBatch = batch
+
+    updateFields = [field.name for field in importFields(model) if not field.primary_key]
+    if model.__name__ in savedPerRow:
+        #The counters are only copied so clean() checks against them, update_fields leaves them to the UPDATEs that move them
+        for obj in oldObjects:
+            obj.save(update_fields=updateFields)
+        for obj in newObjects:
+            obj.save()
+        return len(newObjects), len(oldObjects)
+
+    if model.__name__ == "Item":
+        for obj in newObjects:
+            obj.fillFromLine()
+
+    model._default_manager.bulk_create(newObjects, batch_size=batchSize)
+    markChanged(model.__name__)
+    if any(obj.pk is not None for obj in newObjects):
+        resetSequence(model)
+    if oldObjects and updateFields:
+        model._default_manager.bulk_update(oldObjects, updateFields, batch_size=batchSize)
+    return len(newObjects), len(oldObjects)
+
+
+def resetSequence(model):
+    #Rows inserted with their own IDs dont move the ID sequence, so the next normal save would reuse one of them
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), [model]):
+            cursor.execute(sql)
+
+
+def isWorkbook(file):
+    #.xlsx files are zip archives, so they are told apart from CSV by their first bytes instead of the file name
+    start = file.read(4)
+    file.seek(0)
+    return start == b"PK\x03\x04"
+
+
+def cellText(value):
+    #Excel cells come back typed, they are turned back into the text a CSV export of the sheet would have
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, datetime):
+        if value.time() == time():
+            return value.strftime("%m/%d/%Y")
+        return value.strftime("%m/%d/%Y %H:%M:%S")
+    if isinstance(value, date):
+        return value.strftime("%m/%d/%Y")
+    if isinstance(value, time):
+        #Same 12 hour format as Clockify's CSV export so both files give the same expense IDs
+        return value.strftime("%I:%M:%S %p")
+    #Every number is a float in Excel, whole ones are written without the .0 so IDs and zip codes keep their digits
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def readWorkbookChunks(file, columns=None):
+    #Streams the first sheet of an .xlsx file with openpyxl's read only mode, so only one row is in memory
+    #at a time plus the chunk being built. Yields the same text frames as read_csv does for a CSV
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        sheetRows = workbook.active.iter_rows(values_only=True)
+        header = list(next(sheetRows, ()))
+        while header and header[-1] is None:
+            header.pop()
+        header = [cellText(column) for column in header]
+        if columns:
+            missing = [column for column in columns if column not in header]
+            if missing:
+                raise ValidationError(f"Bad File. Missing columns: {', '.join(missing)}")
+
+        records = []
+        indexes = []
+        #Sheet row 2 is index 0, same as the first data row of a CSV
+        for index, values in enumerate(sheetRows):
+            values = [cellText(value) for value in values[:len(header)]]
+            if not any(value not in (None, "") for value in values):
+                continue
+            records.append(values + [None] * (len(header) - len(values)))
+            indexes.append(index)
+            if len(records) == chunkSize:
+                yield workbookFrame(records, indexes, header, columns)
+                records, indexes = [], []
+        if records:
+            yield workbookFrame(records, indexes, header, columns)
+    finally:
+        workbook.close()
+
+
+def workbookFrame(records, indexes, header, columns):
+    frame = pd.DataFrame(records, columns=header, index=indexes, dtype=object)
+    if columns:
+        frame = frame[columns]
+    return frame.where(frame.notna() & (frame != ""), None)
+
+
+def readChunks(file, columns=None):
+    #Everything is read as text so money and IDs keep their exact digits, the column conversions pick the real types
+    #The row index keeps counting across chunks so error messages still point at the right spreadsheet row
+    #Uploads can be CSV or .xlsx, both come out as the same frames so they go through the same checks and writes
+    if isWorkbook(file):
+        return readWorkbookChunks(file, columns)
+    if columns:
+        #read_csv raises a plain ValueError for a missing usecols column, so the header is checked first
+        header = list(pd.read_csv(file, dtype=str, nrows=0).columns)
+        file.seek(0)
+        missing = [column for column in columns if column not in header]
+        if missing:
+            raise ValidationError(f"Bad File. Missing columns: {', '.join(missing)}")
+    return pd.read_csv(file, dtype=str, keep_default_na=False, na_values=[""], chunksize=chunkSize, usecols=columns)
+
+
+def importCSV(model, file, progress=None, user=None, job=None):
+    #Each chunk is validated and written in its own transaction. If a chunk fails the chunks before it stay imported
+    #progress is called with the running total after every committed chunk
+    #Expense, Revenue and Payroll rows are tagged with an ImportBatch so the import can be reversed later
+    result = {"rows": 0, "created": 0, "updated": 0}
+    batch = newBatch(model.__name__, file, user, job) if isTagged(model) else None
+    for frame in readChunks(file):
+        errors = []
+        objects = buildObjects(model, frame, errors)
+        validateObjects(objects, frame, errors)
+        if errors:
+            raise ValidationError(rowErrorMessages(errors))
+        with transaction.atomic():
+            created, updated = writeObjects(model, objects, batch)
+            if batch:
+                countBatchRows(batch, created)
+        result["rows"] += len(objects)
+        result["created"] += created
+        result["updated"] += updated
+        logger.info("%s import: %d rows written", model.__name__, result["rows"])
+        if progress:
+            progress(result["rows"])
+    return result
+
+
+#Related rows the model clean() methods read, fetched for a whole chunk at once during a dry run
+cleanPrefetch = {
+    "Expense": ["item__line__fund", "grantLine"],
+    "Revenue": ["item__line__fund", "grantLine"],
+    "Item": ["line__fund"],
+}
+
+
+def cleanObjects(objects, frame, errors):
+    #The model checks save() would run (budgets, balances, grant limits), without saving
+    #Rows that already have a problem are skipped. Returns the objects that passed
+    badRows = {row for row, column, problem in errors}
+    passed = []
+    for index, obj in zip(frame.index, objects):
+        if rowNumber(index) in badRows:
+            continue
+        try:
+            #The fields were checked by validateObjects, so only clean() and the constraints run here
+            #Uniqueness is left to the unique indexes like the saves do
+            obj.full_clean(exclude=[field.name for field in obj._meta.concrete_fields], validate_unique=False)
+        except ValidationError as e:
+            for field, messages in e.message_dict.items():
+                label = "" if field == "__all__" else obj._meta.get_field(field).verbose_name
+                errors.append((rowNumber(index), label, " ".join(messages)))
+            continue
+        passed.append((rowNumber(index), obj))
+    return passed
+
+
+def checkFileLimits(rows, spent, overLimit, errors, column=None):
+    #Each row was checked against the balances on its own, this adds up what the new expenses in the file
+    #would spend together per line, grant line and fund. The row that first goes over gets the error
+    #column is the file column the error points at, the amount field unless the file has no amount column (Clockify)
+    for row, expense in rows:
+        if not isinstance(expense, Expense) or not expense._state.adding:
+            continue
+        line = expense.line
+        limits = [
+            (("line", line.pk), f"Line {line}", line.budgetRemaining, "remaining"),
+            (("fund", line.fund_id), f"Fund {line.fund}", line.fund.fund_cash_balance, "cash balance"),
+        ]
+        if expense.grantLine:
+            limits.append(
+                (("grantLine", expense.grantLine_id), f"Grant Line {expense.grantLine}", expense.grantLine.budgetRemaining, "remaining")
+            )
+        for key, label, limit, limitName in limits:
+            spent[key] = spent.get(key, 0) + expense.amount
+            if key not in overLimit and spent[key] > limit:
+                overLimit.add(key)
+                errors.append((
+                    row,
+                    column or expense._meta.get_field("amount").verbose_name,
+                    f"Brings {label} to {formatMoney(spent[key])}, more than its {formatMoney(limit)} {limitName}",
+                ))
+
+
+def checkCSV(model, file, progress=None):
+    #Dry run of importCSV. Same conversions, lookups, field and model checks for every chunk, nothing is written
+    #Expenses are also added up across the whole file so rows that only go over the budget together are reported
+    errors = []
+    rows = 0
+    spent = {}
+    overLimit = set()
+    for frame in readChunks(file):
+        objects = buildObjects(model, frame, errors)
+        validateObjects(objects, frame, errors)
+        loadExisting(model, objects)
+        prefetch_related_objects(objects, *cleanPrefetch.get(model.__name__, []))
+        checkFileLimits(cleanObjects(objects, frame, errors), spent, overLimit, errors)
+        rows += len(frame)
+        if progress:
+            progress(rows)
+    #In row order, the model and file wide checks run after the cell checks of the same chunk
+    errors.sort(key=lambda error: error[0])
+    return {"rows": rows, "errors": errors}
+
+
+#Clockify column names and the Payroll fields they fill in
+clockifyFields = {
+    "Project": "ActivityList",
+    "User": "employee",
+    "Start Date": "beg_date",
+    "End Date": "end_date",
+    "Billable Amount (USD)": "pay_amount",
+    "Duration (decimal)": "hours",
+}
+
+#Every column the Clockify import reads
+clockifyColumns = list(clockifyFields) + ["Start Time"]
+
+
+def clockifyRows(frame, periods, errors):
+    #Turns one chunk of the Clockify export into dicts of Payroll fields
+    #Rows with a bad date, number or no pay period are left out and added to errors
+    frame = frame.dropna(how="all")
+    rows = []
+    for index, record in zip(frame.index, frame.to_dict("records")):
+        row = {"row": rowNumber(index)}
+        problems = []
+        for column, fieldName in clockifyFields.items():
+            value = record.get(column)
+            if fieldName in ("beg_date", "end_date"):
+                try:
+                    value = datetime.strptime(value, "%m/%d/%Y").date()
+                except (TypeError, ValueError):
+                    problems.append((row["row"], column, f"'{value}' is not a date like 01/31/2025"))
+                    continue
+                period = periods.find(value)
+                if period:
+                    row["payperiod"] = period
+            elif fieldName in ("hours", "pay_amount"):
+                value = toDecimal(value)
+                if value is None:
+                    problems.append((row["row"], column, f"'{record.get(column)}' is not a number"))
+            row[fieldName] = value
+        if not problems and "payperiod" not in row:
+            problems.append((row["row"], "End Date", "No payperiod for this date range"))
+        if not isinstance(record.get("Start Time"), str):
+            problems.append((row["row"], "Start Time", "Missing start time"))
+        else:
+            row["startTime"] = record["Start Time"].split(" ")[0]
+        if problems:
+            errors.extend(problems)
+        else:
+            rows.append(row)
+    return rows
+
+
+def normalizeName(name):
+    #Names from Clockify are matched ignoring case and extra spaces
+    return " ".join(str(name).split()).lower()
+
+
+def lookupMap(queryset, nameExpression, names):
+    #One query for every object whose normalized name is in names. Names that match more than one object are returned separately
+    found = {}
+    repeated = set()
+    rows = queryset.annotate(lookupName=Lower(Trim(nameExpression))).filter(lookupName__in=list(names))
+    for obj in rows:
+        key = normalizeName(obj.lookupName)
+        if key in found:
+            repeated.add(key)
+        found[key] = obj
+    return found, repeated
+
+
+def lookupClockifyNames(file, user, periods):
+    #Reads the whole file once before anything posts: every distinct name is looked up once and the dates,
+    #numbers and pay periods of every row are checked, their problems come back as rowErrors
+    employeeNames = {}
+    programs = {}
+    rowErrors = []
+    for frame in readChunks(file, clockifyColumns):
+        for name in frame["User"].dropna():
+            employeeNames.setdefault(normalizeName(name), name)
+        for program in frame["Project"].dropna():
+            programs.setdefault(normalizeName(program), program)
+        clockifyRows(frame, periods, rowErrors)
+    file.seek(0)
+
+    employees, repeatedEmployees = lookupMap(
+        Employee.objects.select_related("payItem__line__fund", "specialPayItem__line__fund"),
+        Concat("first_name", Value(" "), "surname"),
+        employeeNames,
+    )
+    activities, repeatedActivities = lookupMap(
+        ActivityList.objects.select_related("item__line__fund"), "program", programs
+    )
+    #The People record paid for a payroll line carries the employee's full name
+    peopleNames = {normalizeName(employee): str(employee) for employee in employees.values()}
+    people, repeatedPeople = lookupMap(People.objects.all(), "name", peopleNames)
+
+    return {
+        "employee": employees,
+        "ActivityList": activities,
+        "people": people,
+        "poster": Employee.objects.filter(user=user).first(),
+        "repeated": {"employee": repeatedEmployees, "ActivityList": repeatedActivities, "people": repeatedPeople},
+        "fileNames": {"employee": employeeNames, "ActivityList": programs, "people": peopleNames},
+        "rowErrors": rowErrors,
+    }
+
+
+#Name lookups reported on, with the label used in the messages
+nameLabels = {"employee": "employee", "ActivityList": "activity", "people": "People object"}
+
+
+def nameProblem(names, field, key):
+    if key not in names[field]:
+        return "No {} named {}"
+    if key in names["repeated"][field]:
+        return "More than one {} named {}"
+    return None
+
+
+def resolveClockifyNames(file, user, periods):
+    #Every name that cant be matched and every bad row is reported together before anything is posted
+    names = lookupClockifyNames(file, user, periods)
+    errors = {}
+    for field, label in nameLabels.items():
+        for key, name in names["fileNames"][field].items():
+            problem = nameProblem(names, field, key)
+            if problem:
+                errors.setdefault(field, []).append(problem.format(label, name))
+    if names["poster"] is None:
+        errors.setdefault("employee", []).append("No employee with signed in user")
+    if errors:
+        raise ValidationError(errors)
+    if names["rowErrors"]:
+        raise ValidationError(rowErrorMessages(names["rowErrors"]))
+    return names
+
+
+def clockifyRowNameProblems(line, names):
+    #Per row version of the checks in resolveClockifyNames, used by the dry run report
+    problems = []
+    for field, column in (("employee", "User"), ("ActivityList", "Project")):
+        problem = nameProblem(names, field, normalizeName(line[field]))
+        if problem:
+            problems.append((line["row"], column, problem.format(nameLabels[field], line[field])))
+    if not problems:
+        employee = names["employee"][normalizeName(line["employee"])]
+        problem = nameProblem(names, "people", normalizeName(employee))
+        if problem:
+            problems.append((line["row"], "User", problem.format(nameLabels["people"], employee)))
+    return problems
+
+
+def clockifyExpense(line, names, postingDate):
+    #Builds the unsaved expense for one Clockify row and swaps the names in the row for their objects
+    if "payperiod" not in line:
+        raise ValidationError({"payperiod": "No payperiod for this date range"})
+    for field in ("employee", "ActivityList"):
+        line[field] = names[field].get(normalizeName(line[field]))
+        if line[field] is None:
+            raise ValidationError({field: "Every row needs a User and a Project"})
+
+    activity = line["ActivityList"]
+    payType = activity.payType
+    if payType == "special":
+        item = line["employee"].specialPayItem
+    elif payType == "admin":
+        item = line["employee"].payItem
+    else:
+        item = activity.item
+
+    payRate = line["employee"].pay_rate
+    hours = Decimal(str(line["hours"]))
+    amount = toMoney(payRate * hours)
+    employee = names["poster"]
+    paidEmployee = line["employee"]
+    people = names["people"][normalizeName(paidEmployee)]
+
+    #Need a full id in order to tell if we are trying to reenter lines
+    expenseFullID = f"{paidEmployee.employee_id}-{activity.ActivityList_id}-{line['beg_date']}-{line.pop('startTime')}"
+    expense = Expense(
+        item=item,
+        amount=amount,
+        people=people,
+        warrant=1,
+        comment="Payroll",
+        ActivityList=activity,
+        line=item.line,
+        employee=employee,
+        expenseFullID=expenseFullID,
+    )
+    #Whether or not we entered a posting date
+    if postingDate:
+        expense.date = postingDate
+    return expense
+
+
+#Fields that make two payroll lines the same line, what update_or_create used to match on
+payrollFields = ["beg_date", "end_date", "employee_id", "ActivityList_id", "hours", "pay_amount", "payperiod_id"]
+
+
+def payrollKey(values):
+    return tuple(
+        toMoney(values[field]) if field in ("hours", "pay_amount") else values[field]
+        for field in payrollFields
+    )
+
+
+def postClockifyChunk(rows, names, postingDate, batch):
+    #Posts the chunk's expenses as one batch and adds the payroll lines that arent already recorded
+    #Returns how many expense and payroll rows were created
+    saveBatch(batch)
+    expenses = [clockifyExpense(line, names, postingDate) for line in rows]
+    for expense in expenses:
+        expense.importBatch = batch
+    posted = Expense.objects.postBatch(expenses)
+
+    payrolls = [
+        Payroll(
+            beg_date=line["beg_date"],
+            end_date=line["end_date"],
+            employee=line["employee"],
+            ActivityList=line["ActivityList"],
+            hours=toMoney(line["hours"]),
+            pay_amount=toMoney(line["pay_amount"]),
+            payperiod=line["payperiod"],
+            importBatch=batch,
+        )
+        for line in rows
+    ]
+    existing = Payroll.objects.filter(
+        payperiod__in={payroll.payperiod_id for payroll in payrolls},
+        employee__in={payroll.employee_id for payroll in payrolls},
+    ).values(*payrollFields)
+    recorded = {payrollKey(values) for values in existing}
+    newPayrolls = []
+    for payroll in payrolls:
+        key = payrollKey(payroll.__dict__)
+        if key not in recorded:
+            recorded.add(key)
+            newPayrolls.append(payroll)
+    Payroll.objects.bulk_create(newPayrolls, batch_size=batchSize)
+    markChanged("Payroll")
+    return len(posted) + len(newPayrolls)
+
+
+def importClockify(file, user, postingDate="", progress=None, job=None):
+    #Names and rows are checked for the whole file up front, so a bad row anywhere fails the import before anything posts
+    #Then like importCSV each chunk of the Clockify export is posted in its own transaction
+    #Every expense and payroll row posted is tagged with one ImportBatch, ImportBatch.reverse takes the whole payroll back out
+    periods = PayPeriod.objects.index()
+    names = resolveClockifyNames(file, user, periods)
+    batch = newBatch("Clockify", file, user, job)
+    rowsDone = 0
+    for frame in readChunks(file):
+        #Already checked by resolveClockifyNames, there are no row errors left to collect
+        rows = clockifyRows(frame, periods, [])
+        with transaction.atomic():
+            created = postClockifyChunk(rows, names, postingDate, batch)
+            countBatchRows(batch, created)
+        rowsDone += len(rows)
+        logger.info("Clockify import: %d rows posted", rowsDone)
+        if progress:
+            progress(rowsDone)
+    return rowsDone
+
+
+def checkClockify(file, user, progress=None):
+    #Dry run of importClockify. Names, dates, pay periods and the line and fund budgets are checked for the
+    #whole file in bulk and every problem is returned by row. Nothing is written
+    periods = PayPeriod.objects.index()
+    names = lookupClockifyNames(file, user, periods)
+    errors = list(names["rowErrors"])
+    if names["poster"] is None:
+        errors.append(("", "User", "No employee with signed in user"))
+
+    #Running totals of what the file would spend per line and fund, the row that first goes over gets the error
+    spent = {}
+    overLimit = set()
+    seen = set()
+    rowsChecked = 0
+    for frame in readChunks(file):
+        rows = []
+        #The row errors were collected by lookupClockifyNames
+        for line in clockifyRows(frame, periods, []):
+            problems = clockifyRowNameProblems(line, names)
+            errors.extend(problems)
+            if not problems:
+                rows.append((line["row"], clockifyExpense(line, names, "")))
+
+        posted = set(
+            Expense.objects.filter(
+                expenseFullID__in=[expense.expenseFullID for row, expense in rows]
+            ).values_list("expenseFullID", flat=True)
+        )
+        #Rows already posted or repeated in the file are skipped by the import, so they dont count towards the limits
+        newRows = []
+        for row, expense in rows:
+            if expense.expenseFullID not in posted and expense.expenseFullID not in seen:
+                seen.add(expense.expenseFullID)
+                newRows.append((row, expense))
+        checkFileLimits(newRows, spent, overLimit, errors, "Duration (decimal)")
+
+        rowsChecked += len(frame)
+        if progress:
+            progress(rowsChecked)
+    #In row order like checkCSV, problems with the whole file (no row) first
+    errors.sort(key=lambda error: (error[0] != "", error[0]))
+    return {"rows": rowsChecked, "errors": errors}
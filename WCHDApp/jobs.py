@@ -0,0 +1,112 @@
+import csv
+import logging
+from io import StringIO
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from .models import Job
+from .importer import importCSV, importClockify, checkCSV, checkClockify
+from .reports import tablePdf, reconcileWorkbook
+from .reportcache import tablePdfPath, cachedBytes
+
+logger = logging.getLogger(__name__)
+
+#What each kind of Job does. The views only queue the job (queueJob), manage.py runjobs calls runJob for it
+#Handlers raise ValidationError for problems the user can fix, the message is shown on the job page
+
+
+#How many problems the status page shows, the downloaded report has all of them
+shownProblems = 100
+
+
+def saveProblemReport(job, result):
+    #Dry run result: the problems as a CSV download plus the first few on the job page
+    errors = result["errors"]
+    if not errors:
+        job.message = f"Checked {result['rows']} rows, no problems found. Nothing was imported."
+        return
+    job.message = f"Checked {result['rows']} rows and found {len(errors)} problems. Nothing was imported."
+    stream = StringIO()
+    writer = csv.writer(stream)
+    writer.writerow(["Row", "Column", "Problem"])
+    writer.writerows(errors)
+    job.result.save("importProblems.csv", ContentFile(stream.getvalue().encode()), save=False)
+    job.params["problems"] = [list(error) for error in errors[:shownProblems]]
+
+
+def runTableImport(job):
+    model = apps.get_model("WCHDApp", job.params["table"])
+    with job.upload.open("rb") as file:
+        if job.params.get("dryRun"):
+            saveProblemReport(job, checkCSV(model, file, job.reportProgress))
+            return
+        result = importCSV(model, file, job.reportProgress, job.user, job)
+    job.message = f"Imported {result['rows']} rows ({result['created']} new, {result['updated']} updated)."
+
+
+def runClockifyImport(job):
+    with job.upload.open("rb") as file:
+        if job.params.get("dryRun"):
+            saveProblemReport(job, checkClockify(file, job.user, job.reportProgress))
+            return
+        rows = importClockify(file, job.user, job.params.get("date", ""), job.reportProgress, job)
+    job.message = f"Posted {rows} rows"
+
+
+def runReconcile(job):
+    with job.upload.open("rb") as firstFile, job.secondUpload.open("rb") as secondFile:
+        workbook = reconcileWorkbook(firstFile, secondFile)
+    job.result.save("reconciliation.xlsx", ContentFile(workbook), save=False)
+
+
+def runPdfReport(job):
+    tableName = job.params["table"]
+    pdf = cachedBytes(tablePdfPath(tableName), lambda: tablePdf(tableName))
+    job.result.save(f"{tableName}.pdf", ContentFile(pdf), save=False)
+
+
+jobHandlers = {
+    "tableImport": runTableImport,
+    "clockifyImport": runClockifyImport,
+    "reconcile": runReconcile,
+    "pdfReport": runPdfReport,
+}
+
+
+def runJob(job):
+    #Runs a job the worker already claimed and records how it ended
+    logger.info("Starting %s", job)
+    try:
+        jobHandlers[job.kind](job)
+        job.status = "done"
+    except ValidationError as e:
+        job.status = "failed"
+        job.message = " ".join(e.messages)
+    except Exception as e:
+        logger.exception("%s crashed", job)
+        job.status = "failed"
+        job.message = f"Something went wrong: {e}"
+    if job.status == "failed" and job.progress and job.kind in ("tableImport", "clockifyImport") and not job.params.get("dryRun"):
+        job.message = f"{job.message} ({job.progress} rows before this were already imported)"
+
+    #The uploads are only needed while the job runs
+    job.upload.delete(save=False)
+    job.secondUpload.delete(save=False)
+    job.finished = timezone.now()
+    job.save()
+    logger.info("Finished %s in %.1fs", job, (job.finished - job.started).total_seconds())
+    return job
+
+
+def queueJob(**fields):
+    #Queues a job for manage.py runjobs. Deployments without a worker (JOB_WORKER off, like the Render blueprint)
+    #run it here in the request instead so it doesnt sit queued forever, the status page then shows it finished
+    job = Job.objects.create(**fields)
+    if not settings.JOB_WORKER:
+        job.status = "running"
+        job.started = timezone.now()
+        job.save(update_fields=["status", "started"])
+        runJob(job)
+    return job
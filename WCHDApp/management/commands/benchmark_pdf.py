@@ -0,0 +1,47 @@
+import time
+from datetime import date
+from decimal import Decimal
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import models
+from WCHDApp.reports import buildPdf, pdfColumns
+
+
+class Command(BaseCommand):
+    help = "Times the PDF table report for growing row counts. Uses made up rows, nothing is read or written in the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--table", default="Expense", help="Model whose columns the made up rows copy"
+        )
+        parser.add_argument(
+            "--rows", type=int, nargs="+", default=[1000, 5000, 10000, 25000, 50000], help="Row counts to time"
+        )
+
+    def handle(self, *args, **options):
+        model = apps.get_model("WCHDApp", options["table"])
+        columns = pdfColumns(model)
+        self.stdout.write(f"{'Rows':>8} {'Seconds':>9} {'ms/row':>8} {'KB':>8}")
+        for count in options["rows"]:
+            start = time.perf_counter()
+            pdf = buildPdf("Benchmark", model.__name__, columns, self.fakeRows(model, count), ["Benchmark"])
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f"{count:>8} {elapsed:>9.2f} {elapsed * 1000 / count:>8.3f} {len(pdf) // 1024:>8}")
+
+    def fakeRows(self, model, count):
+        #A value of the right type for every column, generated as the report asks for them like a database iterator would
+        fields = [field.target_field if field.is_relation else field for field in model._meta.concrete_fields]
+        for i in range(count):
+            row = []
+            for field in fields:
+                if isinstance(field, models.DecimalField):
+                    row.append(Decimal(i) / 100)
+                elif isinstance(field, models.DateField):
+                    row.append(date(2025, 1, 1))
+                elif isinstance(field, models.BooleanField):
+                    row.append(i % 2 == 0)
+                elif isinstance(field, (models.CharField, models.TextField)):
+                    row.append(f"{field.name} {i}")
+                else:
+                    row.append(i)
+            yield row
@@ -0,0 +1,63 @@
+import logging
+import os
+import shutil
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from WCHDApp.reports import standardReports, pastDayReports
+from WCHDApp.reportcache import prebuiltFolder, prebuiltDays, writeFile
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Builds the standard report set into a dated folder for the Reports page. Meant to run nightly (cron) after the office closes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--date",
+            help="Day to build the set for as YYYY-MM-DD, defaults to today. For an earlier day only the Daily Transactions report is built",
+        )
+        parser.add_argument(
+            "--keep", type=int, default=31, help="How many days of sets to keep, older folders are removed"
+        )
+
+    def handle(self, *args, **options):
+        day = timezone.localdate()
+        if options["date"]:
+            try:
+                day = parse_date(options["date"])
+            except ValueError:
+                day = None
+            if not day:
+                raise CommandError(f"'{options['date']}' is not a date, use YYYY-MM-DD")
+
+        reports = standardReports
+        if day < timezone.localdate():
+            #The summaries show todays balances, saved under an earlier day they would be labelled with the wrong date
+            reports = [report for report in standardReports if report[0] in pastDayReports]
+        folder = prebuiltFolder(day)
+        started = time.perf_counter()
+        #One failed report doesnt stop the rest, the page just lists what was built
+        failed = []
+        for name, label, builder in reports:
+            reportStarted = time.perf_counter()
+            try:
+                data = builder(day)
+            except Exception:
+                logger.exception("Building %s for %s failed", label, day)
+                failed.append(label)
+                continue
+            writeFile(os.path.join(folder, f"{name}.pdf"), data)
+            seconds = time.perf_counter() - reportStarted
+            logger.info("Built %s for %s in %.2fs (%d bytes)", label, day, seconds, len(data))
+
+        for oldDay in prebuiltDays()[options["keep"]:]:
+            shutil.rmtree(prebuiltFolder(oldDay), ignore_errors=True)
+
+        seconds = time.perf_counter() - started
+        logger.info("Built the report set for %s in %.2fs", day, seconds)
+        if failed:
+            raise CommandError(f"Could not build {', '.join(failed)}, see the log")
+        self.stdout.write(self.style.SUCCESS(f"Built {len(reports)} reports in {folder} in {seconds:.2f}s"))
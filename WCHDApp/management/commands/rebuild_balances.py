@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from WCHDApp.models import Line, GrantLine
+
+
+class Command(BaseCommand):
+    help = "Recalculates the spent/income counters on Lines and Grant Lines from the Expense and Revenue tables"
+
+    def handle(self, *args, **options):
+        #One UPDATE per table, all or nothing so a failed rebuild never leaves half the counters reset
+        with transaction.atomic():
+            lineCount = Line.objects.all().rebuild_balances()
+            grantLineCount = GrantLine.objects.all().rebuild_balances()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt balances for {lineCount} lines and {grantLineCount} grant lines"
+            )
+        )
@@ -0,0 +1,39 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from WCHDApp.models import Job
+from WCHDApp.jobs import runJob
+
+
+class Command(BaseCommand):
+    help = "Runs queued imports, reconciles and reports from the Jobs table. Keeps polling until stopped"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval", type=float, default=2, help="Seconds to wait when there is nothing queued"
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Run everything queued right now and exit"
+        )
+        parser.add_argument(
+            "--stale-after", type=float, default=360,
+            help="Minutes a job can be running before it is failed as left behind by a worker that died",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Waiting for jobs")
+        try:
+            while True:
+                #Long sleeps can leave a dead database connection behind
+                close_old_connections()
+                job = Job.objects.claimNext(timedelta(minutes=options["stale_after"]))
+                if job:
+                    runJob(job)
+                    self.stdout.write(f"{job}: {job.message}")
+                elif options["once"]:
+                    return
+                else:
+                    time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopped")
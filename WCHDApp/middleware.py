@@ -0,0 +1,58 @@
+import logging
+import time
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class QueryStats:
+    #Wraps every SQL call made on the connection while a request is being handled
+    def __init__(self):
+        self.count = 0
+        self.sqlTime = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.sqlTime += time.perf_counter() - start
+
+
+class QueryBudgetMiddleware:
+    #Records how many queries each view runs, how long they took and how long the whole view took
+    #Shows up as the X-Query-Count and Server-Timing headers (visible in the browser dev tools) and a log line
+    #Streamed responses (CSV exports, PDFs) run most of their queries while the body is sent, after the headers
+    #are already set, so they get no headers and their log line only covers the view up to the first byte
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = QueryStats()
+        start = time.perf_counter()
+        with connection.execute_wrapper(stats):
+            response = self.get_response(request)
+        totalTime = (time.perf_counter() - start) * 1000
+        sqlTime = stats.sqlTime * 1000
+
+        match = getattr(request, "resolver_match", None)
+        viewName = match.url_name if match and match.url_name else request.path
+
+        if not response.streaming:
+            response["X-Query-Count"] = str(stats.count)
+            response["Server-Timing"] = (
+                f'sql;dur={sqlTime:.1f};desc="{stats.count} queries", '
+                f"view;dur={totalTime - sqlTime:.1f}, total;dur={totalTime:.1f}"
+            )
+        logger.info(
+            "%s %s%s queries=%d sql=%.1fms render=%.1fms total=%.1fms",
+            request.method,
+            viewName,
+            " (streamed, body not counted)" if response.streaming else "",
+            stats.count,
+            sqlTime,
+            totalTime - sqlTime,
+            totalTime,
+        )
+        return response
@@ -0,0 +1,66 @@
+# Generated by Django 5.1.6 on 2026-10-17 01:06
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fillBalances(apps, schema_editor):
+    #Backfilling the new counters from the existing expenses and revenues
+    Line = apps.get_model('WCHDApp', 'Line')
+    GrantLine = apps.get_model('WCHDApp', 'GrantLine')
+    Expense = apps.get_model('WCHDApp', 'Expense')
+    Revenue = apps.get_model('WCHDApp', 'Revenue')
+    moneyField = models.DecimalField(max_digits=15, decimal_places=2)
+
+    def total(model, lineField):
+        rows = (
+            model.objects.filter(**{lineField: OuterRef('pk')})
+            .order_by()
+            .values(lineField)
+            .annotate(total=Sum('amount'))
+            .values('total')
+        )
+        return Coalesce(Subquery(rows, output_field=moneyField), Value(Decimal('0')), output_field=moneyField)
+
+    Line.objects.update(
+        line_budget_spent=total(Expense, 'line'),
+        line_total_income=total(Revenue, 'line'),
+    )
+    GrantLine.objects.update(
+        line_budget_spent=total(Expense, 'grantLine'),
+        line_total_income=total(Revenue, 'grantLine'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WCHDApp', '0144_alter_employee_city_alter_employee_dob_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='grantline',
+            name='line_budget_spent',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=15, verbose_name='Budget Spent'),
+        ),
+        migrations.AddField(
+            model_name='grantline',
+            name='line_total_income',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=15, verbose_name='Total Income'),
+        ),
+        migrations.AddField(
+            model_name='line',
+            name='line_budget_spent',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=15, verbose_name='Budget Spent'),
+        ),
+        migrations.AddField(
+            model_name='line',
+            name='line_total_income',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=15, verbose_name='Total Income'),
+        ),
+        migrations.RunPython(fillBalances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.6 on 2026-10-17 02:10
+
+from django.db import migrations
+from django.db.models import Count
+
+
+def makeFullIDsUnique(apps, schema_editor):
+    #Older rows all got the same default ID, keep the first of each and add the row id to the rest
+    Expense = apps.get_model('WCHDApp', 'Expense')
+    repeated = (
+        Expense.objects.values('expenseFullID')
+        .annotate(copies=Count('id'))
+        .filter(copies__gt=1)
+        .values_list('expenseFullID', flat=True)
+    )
+    for fullID in list(repeated):
+        copies = Expense.objects.filter(expenseFullID=fullID).order_by('id').values_list('id', flat=True)
+        for expenseID in list(copies)[1:]:
+            suffix = f"-{expenseID}"
+            Expense.objects.filter(pk=expenseID).update(expenseFullID=fullID[:50 - len(suffix)] + suffix)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WCHDApp', '0145_grantline_line_budget_spent_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(makeFullIDsUnique, migrations.RunPython.noop),
+    ]
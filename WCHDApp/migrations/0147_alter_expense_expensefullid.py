@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-17 02:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WCHDApp', '0146_expense_unique_fullids'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='expense',
+            name='expenseFullID',
+            field=models.CharField(max_length=50, unique=True, verbose_name='Expense Full ID'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.6 on 2026-10-17 03:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WCHDApp', '0147_alter_expense_expensefullid'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('tableImport', 'Table Import'), ('clockifyImport', 'Clockify Payroll Import'), ('reconcile', 'Reconcile'), ('pdfReport', 'PDF Report')], max_length=20, verbose_name='Kind')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10, verbose_name='Status')),
+                ('params', models.JSONField(blank=True, default=dict, verbose_name='Parameters')),
+                ('upload', models.FileField(blank=True, upload_to='jobs/uploads/', verbose_name='Upload')),
+                ('secondUpload', models.FileField(blank=True, upload_to='jobs/uploads/', verbose_name='Second Upload')),
+                ('result', models.FileField(blank=True, upload_to='jobs/results/', verbose_name='Result')),
+                ('progress', models.IntegerField(default=0, verbose_name='Rows Done')),
+                ('message', models.TextField(blank=True, verbose_name='Message')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Created')),
+                ('started', models.DateTimeField(blank=True, null=True, verbose_name='Started')),
+                ('finished', models.DateTimeField(blank=True, null=True, verbose_name='Finished')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'db_table': 'Jobs',
+                'indexes': [models.Index(fields=['status', 'created'], name='Jobs_status_643692_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.6 on 2026-10-17 04:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WCHDApp', '0148_job'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=50, verbose_name='Source')),
+                ('fileName', models.CharField(blank=True, max_length=255, verbose_name='File Name')),
+                ('rows', models.IntegerField(default=0, verbose_name='Rows Created')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Created')),
+                ('reversedAt', models.DateTimeField(blank=True, null=True, verbose_name='Reversed')),
+                ('job', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='importBatch', to='WCHDApp.job', verbose_name='Job')),
+                ('reversedBy', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Reversed By')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'db_table': 'ImportBatch',
+            },
+        ),
+        migrations.AddField(
+            model_name='expense',
+            name='importBatch',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='WCHDApp.importbatch', verbose_name='Import Batch'),
+        ),
+        migrations.AddField(
+            model_name='payroll',
+            name='importBatch',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='WCHDApp.importbatch', verbose_name='Import Batch'),
+        ),
+        migrations.AddField(
+            model_name='revenue',
+            name='importBatch',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='WCHDApp.importbatch', verbose_name='Import Batch'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-17 01:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WCHDApp', '0149_importbatch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('table', models.CharField(max_length=50, primary_key=True, serialize=False, verbose_name='Table')),
+                ('version', models.BigIntegerField(default=0, verbose_name='Version')),
+            ],
+            options={
+                'db_table': 'DataVersions',
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.6 on 2026-10-17 01:39
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WCHDApp', '0150_dataversion'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='expense',
+            name='date',
+            field=models.DateField(db_index=True, default=django.utils.timezone.now, editable=False, verbose_name='Date'),
+        ),
+        migrations.AlterField(
+            model_name='revenue',
+            name='date',
+            field=models.DateField(auto_now_add=True, db_index=True, verbose_name='Date'),
+        ),
+    ]
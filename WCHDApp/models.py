@@ -1,9 +1,18 @@
 from django.db import models, transaction
+from django.db.models import Sum, Count, F, Q, OuterRef, Subquery, Value, ExpressionWrapper
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from djmoney.models.fields import MoneyField
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
-from datetime import datetime
+from datetime import datetime, timedelta
+from bisect import bisect_right
+from contextvars import ContextVar
+from decimal import Decimal
 from django.utils import timezone
+from django.utils.functional import cached_property
+from .money import toMoney, formatMoney
 
 
 class FundSource(models.TextChoices):
@@ -35,6 +44,44 @@ class Dept(models.Model):
         db_table = "Departments"
 
 
+class FundQuerySet(models.QuerySet):
+    def with_budget_totals(self):
+        #Budgeted, remaining and available for every fund from one grouped query over its lines
+        #Spent comes from the running counters on the expense lines
+        moneyField = models.DecimalField(max_digits=15, decimal_places=2)
+        zero = Value(Decimal("0"))
+        isExpense = Q(lines__lineType="Expense")
+        isRevenue = Q(lines__lineType="Revenue")
+        return self.annotate(
+            budgetedTotal=Coalesce(
+                Sum("lines__line_budgeted"), zero, output_field=moneyField
+            ),
+            expenseBudgeted=Coalesce(
+                Sum("lines__line_budgeted", filter=isExpense),
+                zero,
+                output_field=moneyField,
+            ),
+            revenueBudgeted=Coalesce(
+                Sum("lines__line_budgeted", filter=isRevenue),
+                zero,
+                output_field=moneyField,
+            ),
+            spentTotal=Coalesce(
+                Sum("lines__line_budget_spent", filter=isExpense),
+                zero,
+                output_field=moneyField,
+            ),
+        ).annotate(
+            remainingTotal=ExpressionWrapper(
+                F("budgetedTotal") - F("spentTotal"), output_field=moneyField
+            ),
+            availableTotal=ExpressionWrapper(
+                F("fund_cash_balance") - F("expenseBudgeted") + F("revenueBudgeted"),
+                output_field=moneyField,
+            ),
+        )
+
+
 class Fund(models.Model):
     SOFChoices = [("local", "Local"), ("state", "State"), ("federal", "Federal")]
     fund_id = models.CharField(max_length=20, primary_key=True, verbose_name="Fund ID")
@@ -55,47 +102,30 @@ class Fund(models.Model):
     )
     # mac_elig = models.BooleanField(blank=False, verbose_name="MACE")
 
+    objects = FundQuerySet.as_manager()
+
+    #Uses the values from Fund.objects.with_budget_totals() when the fund was loaded with it
+    #Otherwise runs the same aggregate for just this fund
+    def budgetTotals(self):
+        if hasattr(self, "budgetedTotal"):
+            return self
+        return Fund.objects.with_budget_totals().get(pk=self.pk)
+
     @property
     def calcRemaining(self):
-        lines = self.lines.filter(lineType="Expense")
-        total = 0
-        for line in lines:
-            total += float(line.budgetSpent)
-        remaining = float(self.budgeted) - total
-        return f"{remaining:.2f}"
+        return toMoney(self.budgetTotals().remainingTotal)
 
     @property
     def budgeted(self):
-        lines = self.lines.filter(fund__fund_id=self.fund_id)
-        total = 0
-        for line in lines:
-            total += float(line.line_budgeted)
-
-        return f"{total:.2f}"
+        return toMoney(self.budgetTotals().budgetedTotal)
 
     @property
     def remainingToBudget(self):
-        total = float(self.fund_cash_balance) - float(self.budgeted)
-
-        return f"{total:.2f}"
+        return toMoney(self.fund_cash_balance - self.budgetTotals().budgetedTotal)
 
     @property
     def totalAvailable(self):
-        total = float(self.fund_cash_balance)
-        expenseLines = Line.objects.filter(
-            fund__fund_id=self.fund_id, lineType="Expense"
-        )
-        revenueLines = Line.objects.filter(
-            fund__fund_id=self.fund_id, lineType="Revenue"
-        )
-
-        for line in expenseLines:
-            total -= float(line.line_budgeted)
-
-        for line in revenueLines:
-            total += float(line.line_budgeted)
-
-        return f"{total:.2f}"
+        return toMoney(self.budgetTotals().availableTotal)
 
     def save(self, *args, **kwargs):
         # Check if this is the first time calling save on this object
@@ -117,6 +147,148 @@ class Fund(models.Model):
         db_table = "Funds"
 
 
+def lineTotalSubquery(model, lineField):
+    #Sum of amount per line as a correlated subquery, used to rebuild the running balance counters
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{lineField: OuterRef("pk")})
+            .order_by()
+            .values(lineField)
+            .annotate(total=Sum("amount"))
+            .values("total"),
+            output_field=models.DecimalField(max_digits=15, decimal_places=2),
+        ),
+        Value(Decimal("0")),
+        output_field=models.DecimalField(max_digits=15, decimal_places=2),
+    )
+
+
+def shiftBalances(counter, lineID, grantLineID, amount):
+    #Moves a running balance counter on a line and its grant line with an UPDATE so concurrent posts dont overwrite each other
+    #Either ID can be None when only one of them moves, like the grant line totals of a batch
+    if lineID:
+        Line.objects.filter(pk=lineID).update(**{counter: F(counter) + amount})
+        markChanged("Line")
+    if grantLineID:
+        GrantLine.objects.filter(pk=grantLineID).update(
+            **{counter: F(counter) + amount}
+        )
+        markChanged("GrantLine")
+
+
+def withoutCounters(model):
+    #Fields a save of an existing line writes. The running counters only move through shiftBalances, a line
+    #loaded before a post and saved after it would otherwise write the old totals back over the new ones
+    return [
+        field.name for field in model._meta.concrete_fields
+        if not field.primary_key and field.name not in ("line_budget_spent", "line_total_income")
+    ]
+
+
+def lockedIfAtomic(queryset):
+    #select_for_update only works inside a transaction. Model saves run clean() inside one, form validation does not
+    if transaction.get_connection().in_atomic_block:
+        return queryset.select_for_update()
+    return queryset
+
+
+def shiftFundBalance(fundID, amount):
+    #Single UPDATE ... SET fund_cash_balance = fund_cash_balance + amount, so the database does the math
+    #and two cashiers posting to the same fund cant overwrite each other
+    Fund.objects.filter(pk=fundID).update(
+        fund_cash_balance=F("fund_cash_balance") + amount
+    )
+    markChanged("Fund")
+
+
+def lockForPosting(line, grantLine=None):
+    #Row locks on the fund, line and grant line (always in that order) for the budget checks in clean()
+    #Held until the posting transaction commits, which is only the clean plus a few UPDATEs
+    line.fund = Fund.objects.select_for_update().get(pk=line.fund_id)
+    lockedLine = Line.objects.select_for_update().only(
+        "line_budgeted", "line_budget_spent", "line_total_income"
+    ).get(pk=line.pk)
+    line.line_budget_spent = lockedLine.line_budget_spent
+    line.line_total_income = lockedLine.line_total_income
+    if grantLine:
+        lockedGrantLine = GrantLine.objects.select_for_update().only(
+            "line_budgeted", "line_budget_spent", "line_total_income"
+        ).get(pk=grantLine.pk)
+        grantLine.line_budget_spent = lockedGrantLine.line_budget_spent
+        grantLine.line_total_income = lockedGrantLine.line_total_income
+
+
+class LineQuerySet(models.QuerySet):
+    def with_rollups(self):
+        #Adds spentTotal, incomeTotal and remainingTotal to every line, read from the running balance counters
+        return self.annotate(
+            spentTotal=F("line_budget_spent"),
+            incomeTotal=F("line_total_income"),
+            remainingTotal=ExpressionWrapper(
+                F("line_budgeted") - F("line_budget_spent"),
+                output_field=models.DecimalField(max_digits=15, decimal_places=2),
+            ),
+        )
+
+    def rebuild_balances(self):
+        #Recalculates the counters from the Expense and Revenue tables in a single UPDATE
+        markChanged("Line")
+        return self.update(
+            line_budget_spent=lineTotalSubquery(Expense, "line"),
+            line_total_income=lineTotalSubquery(Revenue, "line"),
+        )
+
+
+class GrantQuerySet(models.QuerySet):
+    def with_stats(self):
+        #Budgeted, spent, remaining and received for every grant from one grouped query over its grant lines
+        moneyField = models.DecimalField(max_digits=15, decimal_places=2)
+        zero = Value(Decimal("0"))
+        return self.annotate(
+            budgetedTotal=Coalesce(
+                Sum("grantline__line_budgeted"), zero, output_field=moneyField
+            ),
+            spentTotal=Coalesce(
+                Sum("grantline__line_budget_spent"), zero, output_field=moneyField
+            ),
+            receivedTotal=Coalesce(
+                Sum(
+                    "grantline__line_total_income",
+                    filter=Q(grantline__lineType="Revenue"),
+                ),
+                zero,
+                output_field=moneyField,
+            ),
+        ).annotate(
+            remainingTotal=ExpressionWrapper(
+                F("budgetedTotal") - F("spentTotal"), output_field=moneyField
+            ),
+            unbudgetedTotal=ExpressionWrapper(
+                F("award_amount") - F("budgetedTotal"), output_field=moneyField
+            ),
+        )
+
+
+class GrantLineQuerySet(models.QuerySet):
+    def with_rollups(self):
+        #Same annotations as Line.objects.with_rollups() so grant lines can share the stats code
+        return self.annotate(
+            spentTotal=F("line_budget_spent"),
+            incomeTotal=F("line_total_income"),
+            remainingTotal=ExpressionWrapper(
+                F("line_budgeted") - F("line_budget_spent"),
+                output_field=models.DecimalField(max_digits=15, decimal_places=2),
+            ),
+        )
+
+    def rebuild_balances(self):
+        markChanged("GrantLine")
+        return self.update(
+            line_budget_spent=lineTotalSubquery(Expense, "grantLine"),
+            line_total_income=lineTotalSubquery(Revenue, "grantLine"),
+        )
+
+
 class Line(models.Model):
     line_id = models.CharField(primary_key=True, max_length=20, verbose_name="Line ID")
     fund = models.ForeignKey(
@@ -129,8 +301,21 @@ class Line(models.Model):
     )
     # line_budget_remaining = models.DecimalField(max_digits=15, decimal_places=2, verbose_name="Budget Remaining")
     # line_encumbered = models.DecimalField(max_digits=15, decimal_places=2, verbose_name="Encumbered")
-    # line_budget_spent = models.DecimalField(max_digits=15, decimal_places=2, verbose_name="Budget Spent", default=0)
-    # line_total_income = models.DecimalField(max_digits=15, decimal_places=2, verbose_name="Total Income", default=0)
+    # Running totals kept up to date by Expense/Revenue saves and deletes. manage.py rebuild_balances recalculates them
+    line_budget_spent = models.DecimalField(
+        max_digits=15,
+        decimal_places=2,
+        default=0,
+        editable=False,
+        verbose_name="Budget Spent",
+    )
+    line_total_income = models.DecimalField(
+        max_digits=15,
+        decimal_places=2,
+        default=0,
+        editable=False,
+        verbose_name="Total Income",
+    )
     dept = models.ForeignKey(
         Dept, on_delete=models.CASCADE, null=True, blank=True, verbose_name="Department"
     )
@@ -142,41 +327,50 @@ class Line(models.Model):
         verbose_name="Line Type",
     )
 
+    objects = LineQuerySet.as_manager()
+
     @property
     def budgetSpent(self):
-        expenses = Expense.objects.filter(line__line_id=self.line_id)
-        total = 0
-        for expense in expenses:
-            total += expense.amount
-
-        return f"{total:.2f}"
+        return toMoney(self.line_budget_spent)
 
     @property
     def budgetRemaining(self):
-        remaining = float(self.line_budgeted) - float(self.budgetSpent)
-
-        return f"{remaining:.2f}"
+        return toMoney(self.line_budgeted - self.line_budget_spent)
 
     @property
     def totalIncome(self):
-        revenues = Revenue.objects.filter(line__line_id=self.line_id)
-        total = 0
-        for revenue in revenues:
-            total += revenue.amount
-
-        return f"{total:.2f}"
+        return toMoney(self.line_total_income)
 
     def clean(self):
-        total = self.fund.fund_cash_balance
-        expenseLines = Line.objects.filter(fund=self.fund, lineType="Expense")
-        for line in expenseLines:
-            if line.line_id != self.line_id:
-                total -= line.line_budgeted
-
-        revenueLines = Line.objects.filter(fund=self.fund, lineType="Revenue")
-        for line in revenueLines:
-            if line.line_id != self.line_id:
-                total += line.line_budgeted
+        fund = lockedIfAtomic(Fund.objects.filter(pk=self.fund_id)).get()
+        if not self._state.adding:
+            #The spent check below needs the counter as it is now, not as it was when this line was loaded
+            current = lockedIfAtomic(Line.objects.filter(pk=self.pk)).values("line_budget_spent", "line_total_income").first()
+            if current:
+                self.line_budget_spent = current["line_budget_spent"]
+                self.line_total_income = current["line_total_income"]
+        #Budgets of the other lines in the fund split by type, in one query
+        others = (
+            Line.objects.filter(fund_id=self.fund_id)
+            .exclude(pk=self.line_id)
+            .aggregate(
+                expenseBudgeted=Coalesce(
+                    Sum("line_budgeted", filter=Q(lineType="Expense")),
+                    Value(Decimal("0")),
+                    output_field=models.DecimalField(max_digits=15, decimal_places=2),
+                ),
+                revenueBudgeted=Coalesce(
+                    Sum("line_budgeted", filter=Q(lineType="Revenue")),
+                    Value(Decimal("0")),
+                    output_field=models.DecimalField(max_digits=15, decimal_places=2),
+                ),
+            )
+        )
+        total = (
+            fund.fund_cash_balance
+            - others["expenseBudgeted"]
+            + others["revenueBudgeted"]
+        )
 
         if self.lineType == "Expense":
             total -= self.line_budgeted
@@ -184,14 +378,13 @@ class Line(models.Model):
                 raise ValidationError(
                     {"line_budgeted": "Not enough remaining balance in fund"}
                 )
-            if float(self.budgetSpent) > float(self.line_budgeted):
+            if self.line_budget_spent > self.line_budgeted:
                 raise ValidationError(
                     {"line_budgeted": "Expense have already exceeded that budget"}
                 )
 
         if self.lineType == "Revenue":
             total += self.line_budgeted
-            print(total)
             if total < 0:
                 raise ValidationError(
                     {
@@ -210,8 +403,11 @@ class Line(models.Model):
             self.line_id = fullID
             self.fund_year = self.fund.fund_id.split("-")[0]
 
-        self.full_clean()
+        #Cleaning inside the transaction so clean() can lock the fund while it checks the budgets
         with transaction.atomic():
+            self.full_clean()
+            if not creating and "update_fields" not in kwargs:
+                kwargs["update_fields"] = withoutCounters(Line)
             super().save(*args, **kwargs)
 
     def __str__(self):
@@ -235,14 +431,18 @@ class Item(models.Model):
     fee_based = models.BooleanField(verbose_name="Fee Based")
     month = models.IntegerField(verbose_name="Month")
 
+    #Fund details always come from the line. Also used by the bulk importer which skips save()
+    def fillFromLine(self):
+        self.fund = self.line.fund
+        self.fund_type = self.line.fund.sof
+        self.fund_year = self.line.fund_year
+
     def save(self, *args, **kwargs):
         # Check if this is the first time calling save on this object
         creating = self._state.adding
 
         if creating:
-            self.fund = self.line.fund
-            self.fund_type = self.line.fund.sof
-            self.fund_year = self.line.fund_year
+            self.fillFromLine()
 
         self.full_clean()
         with transaction.atomic():
@@ -418,6 +618,32 @@ class ActivityList(models.Model):
         db_table = "Activity List"
 
 
+class PayPeriodIndex:
+    #Pay periods sorted by start date so a date can be matched to its period with a binary search
+    #Load it once (PayPeriod.objects.index()) and reuse it for every date instead of scanning all periods each time
+    def __init__(self, periods):
+        self.periods = sorted(periods, key=lambda period: period.periodStart)
+        self.starts = [period.periodStart for period in self.periods]
+
+    def find(self, date):
+        #Latest period starting on or before the date, as long as the date is not past its end
+        position = bisect_right(self.starts, date) - 1
+        if position < 0:
+            return None
+        period = self.periods[position]
+        if date <= period.periodEnd:
+            return period
+        return None
+
+    def __len__(self):
+        return len(self.periods)
+
+
+class PayPeriodQuerySet(models.QuerySet):
+    def index(self):
+        return PayPeriodIndex(self)
+
+
 class PayPeriod(models.Model):
     payperiod_id = models.CharField(
         max_length=7, primary_key=True, verbose_name="Pay Period"
@@ -425,6 +651,8 @@ class PayPeriod(models.Model):
     periodStart = models.DateField(verbose_name="Period Start")
     periodEnd = models.DateField(verbose_name="Periond End")
 
+    objects = PayPeriodQuerySet.as_manager()
+
     def __str__(self):
         return (
             "Pay Period "
@@ -460,6 +688,15 @@ class Payroll(models.Model):
     payperiod = models.ForeignKey(
         PayPeriod, on_delete=models.PROTECT, verbose_name="Pay Period"
     )
+    #The import that created this row, see ImportBatch.reverse
+    importBatch = models.ForeignKey(
+        "ImportBatch",
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        editable=False,
+        verbose_name="Import Batch",
+    )
     # I think all of these will be properties instead
     # vacation_used = models.DecimalField(max_digits=6, decimal_places=2, verbose_name="Vacation Used")
     # sick_used = models.DecimalField(max_digits=6, decimal_places=2, verbose_name="Sick Used")
@@ -500,24 +737,22 @@ class Grant(models.Model):
     # Used to tell if a grant is allowed more than one revenue lines
     maxRevenueLines = models.IntegerField(default=1)
 
+    objects = GrantQuerySet.as_manager()
+
+    #Uses the values from Grant.objects.with_stats() when the grant was loaded with it
+    #Otherwise runs the same aggregate for just this grant
+    def stats(self):
+        if hasattr(self, "budgetedTotal"):
+            return self
+        return Grant.objects.with_stats().get(pk=self.pk)
+
     @property
     def grantAwardAmountRemaining(self):
-        grantLines = GrantLine.objects.filter(grant__grant_id=self.grant_id)
-        total = 0
-        for line in grantLines:
-            total += line.line_budgeted
-        totalRemaining = self.award_amount - total
-        return totalRemaining
+        return toMoney(self.stats().unbudgetedTotal)
 
     @property
     def recieved(self):
-        grantLines = GrantLine.objects.filter(
-            grant__grant_id=self.grant_id, lineType="Revenue"
-        )
-        total = 0
-        for line in grantLines:
-            total += float(line.totalIncome)
-        return total
+        return toMoney(self.stats().receivedTotal)
 
     def __str__(self):
         return f"({self.grant_id}) {self.grant_name}"
@@ -536,8 +771,21 @@ class GrantLine(models.Model):
     )
     # line_budget_remaining = models.DecimalField(max_digits=15, decimal_places=2, verbose_name="Remaining")
     # line_encumbered = models.DecimalField(max_digits=15, decimal_places=2, verbose_name="Encumbered")
-    # line_budget_spent = models.DecimalField(max_digits=15, decimal_places=2, verbose_name="Budget Spent")
-    # line_total_income = models.DecimalField(max_digits=15, decimal_places=2, verbose_name="Total Income")
+    # Running totals kept up to date by Expense/Revenue saves and deletes. manage.py rebuild_balances recalculates them
+    line_budget_spent = models.DecimalField(
+        max_digits=15,
+        decimal_places=2,
+        default=0,
+        editable=False,
+        verbose_name="Budget Spent",
+    )
+    line_total_income = models.DecimalField(
+        max_digits=15,
+        decimal_places=2,
+        default=0,
+        editable=False,
+        verbose_name="Total Income",
+    )
     # cofund = models.CharField(max_length=3, verbose_name="CoFund")
     # gen_ledger = models.IntegerField(blank=False, verbose_name="General Ledger")
     # county_code = models.CharField(max_length = 4, verbose_name="County Code")
@@ -546,42 +794,38 @@ class GrantLine(models.Model):
         verbose_name="Line Type",
     )
 
+    objects = GrantLineQuerySet.as_manager()
+
     @property
     def budgetSpent(self):
-        expenses = Expense.objects.filter(grantLine__grantline_id=self.grantline_id)
-        total = 0
-        for expense in expenses:
-            total += expense.amount
-
-        return f"{total:.2f}"
+        return toMoney(self.line_budget_spent)
 
     @property
     def budgetRemaining(self):
-        remaining = float(self.line_budgeted) - float(self.budgetSpent)
-
-        return f"{remaining:.2f}"
+        return toMoney(self.line_budgeted - self.line_budget_spent)
 
     @property
     def totalIncome(self):
-        revenues = Revenue.objects.filter(grantLine__grantline_id=self.grantline_id)
-        total = 0
-        for revenue in revenues:
-            total += revenue.amount
-
-        return f"{total:.2f}"
+        return toMoney(self.line_total_income)
 
     def clean(self):
-        lines = GrantLine.objects.filter(grant=self.grant)
-        total = 0
-        revenueLines = 0
-        for line in lines:
-            if line.grantline_id != self.grantline_id:
-                total += line.line_budgeted
-                if line.lineType == "Revenue":
-                    revenueLines += 1
-        totalSum = total + self.line_budgeted
-
-        if (revenueLines >= self.grant.maxRevenueLines) and (
+        grant = lockedIfAtomic(Grant.objects.filter(pk=self.grant_id)).get()
+        #Budget total and revenue line count of the other lines in the grant, in one query
+        others = (
+            GrantLine.objects.filter(grant_id=self.grant_id)
+            .exclude(pk=self.grantline_id)
+            .aggregate(
+                total=Coalesce(
+                    Sum("line_budgeted"),
+                    Value(Decimal("0")),
+                    output_field=models.DecimalField(max_digits=15, decimal_places=2),
+                ),
+                revenueLines=Count("pk", filter=Q(lineType="Revenue")),
+            )
+        )
+        totalSum = others["total"] + self.line_budgeted
+
+        if (others["revenueLines"] >= grant.maxRevenueLines) and (
             self.lineType == "Revenue"
         ):
             raise ValidationError(
@@ -590,7 +834,7 @@ class GrantLine(models.Model):
                 }
             )
 
-        if self.grant.award_amount < totalSum:
+        if grant.award_amount < totalSum:
             raise ValidationError(
                 {"line_budgeted": "Budgeted is more than is left in Grant Award"}
             )
@@ -599,8 +843,11 @@ class GrantLine(models.Model):
         # Check if this is the first time calling save on this object
         creating = self._state.adding
 
-        self.full_clean()
+        #Cleaning inside the transaction so clean() can lock the grant while it checks the budgets
         with transaction.atomic():
+            self.full_clean()
+            if not creating and "update_fields" not in kwargs:
+                kwargs["update_fields"] = withoutCounters(GrantLine)
             super().save(*args, **kwargs)
 
     def __str__(self):
@@ -714,130 +961,113 @@ class Benefits(models.Model):
         max_length=10, choices=LifeInsurance.choices, verbose_name="Life Insurance Rate"
     )
 
-    @property
+    #cached_property so the chained values (holiday, total_hrly, total_comp...) only get worked out once per row
+    @cached_property
     def pers(self):
-        value = round((float(self.employee.pay_rate) * 0.14), 2)
-        return f"{value:.2f}"
+        return toMoney(self.employee.pay_rate * Decimal("0.14"))
 
-    @property
+    @cached_property
     def medicare(self):
-        value = round(float(self.employee.pay_rate) * 0.0145, 2)
-        return f"{value:.2f}"
+        return toMoney(self.employee.pay_rate * Decimal("0.0145"))
 
     # CHECK WHERE TO GET HOURS FROM
-    @property
+    @cached_property
     def wc(self):
-        value = round(0.22 / float(self.hrs_per_pay), 2)
-        return f"{value:.2f}"
+        return toMoney(Decimal("0.22") / self.hrs_per_pay)
 
-    @property
+    @cached_property
     def plar(self):
         yos = self.employee.yos
-        factor = 0.03875
+        factor = Decimal("0.03875")
         if yos >= 8 and yos < 15:
-            factor = 0.0575
+            factor = Decimal("0.0575")
         elif yos >= 15 and yos < 25:
-            factor = 0.0775
+            factor = Decimal("0.0775")
         elif yos >= 25:
-            factor = 0.096
-        value = round(float(yos) * factor, 2)
-        return f"{value:.2f}"
+            factor = Decimal("0.096")
+        #Years of service can have more than two decimals, only the result is rounded to cents
+        return toMoney(Decimal(str(yos)) * factor)
 
-    @property
+    @cached_property
     def vacation(self):
         if self.vac_elig:
-            value = round(float(self.plar) * float(self.employee.pay_rate), 2)
-        else:
-            value = 0
-        return f"{value:.2f}"
+            return toMoney(self.plar * self.employee.pay_rate)
+        return toMoney(0)
 
-    @property
+    @cached_property
     def sick(self):
-        value = round(float(self.employee.pay_rate) * 0.0575, 2)
-        return f"{value:.2f}"
+        return toMoney(self.employee.pay_rate * Decimal("0.0575"))
 
-    @property
+    @cached_property
     def holiday(self):
-        value = round(
-            (
-                96
-                * (
-                    float(self.employee.pay_rate)
-                    + float(self.pers)
-                    + float(self.medicare)
-                    + float(self.wc)
-                )
-            )
-            / (float(self.hrs_per_pay) * 26),
-            2,
+        return toMoney(
+            (96 * (self.employee.pay_rate + self.pers + self.medicare + self.wc))
+            / (self.hrs_per_pay * 26)
         )
-        return f"{value:.2f}"
 
-    @property
+    @cached_property
     def total_hrly(self):
-        value = (
-            float(self.employee.pay_rate)
-            + float(self.pers)
-            + float(self.medicare)
-            + float(self.wc)
-            + float(self.vacation)
-            + float(self.sick)
-            + float(self.holiday)
+        return toMoney(
+            self.employee.pay_rate
+            + self.pers
+            + self.medicare
+            + self.wc
+            + self.vacation
+            + self.sick
+            + self.holiday
         )
-        return f"{value:.2f}"
 
-    @property
+    @cached_property
     def percent_leave(self):
-        value = (
-            (float(self.vacation) + float(self.sick) + float(self.holiday))
-            / float(self.total_hrly)
-        ) * float(100)
-        return f"{value:.2f}"
+        return toMoney(
+            ((self.vacation + self.sick + self.holiday) / self.total_hrly) * 100
+        )
 
-    @property
+    @cached_property
     def monthly_hours(self):
-        value = round(float(self.hrs_per_pay) * 4, 2)
-        return f"{value:.2f}"
+        return toMoney(self.hrs_per_pay * 4)
 
-    @property
+    @cached_property
     def board_share_hrly(self):
-        if float(self.monthly_hours) > 0:
-            value = round(float(self.board_ins_share) / float(self.monthly_hours), 2)
-        else:
-            value = 0
-        return f"{value:.2f}"
+        if self.monthly_hours > 0:
+            return toMoney(self.board_ins_share / self.monthly_hours)
+        return toMoney(0)
+
+    #Both life insurance rates from one query. Exports look them up once and set the same dict on every row
+    @cached_property
+    def insuranceRates(self):
+        return dict(
+            Variable.objects.filter(
+                name__in=["insuranceRate1", "insuranceRate2"]
+            ).values_list("name", "value")
+        )
 
-    @property
+    @cached_property
     def life_hourly(self):
         rate = self.life_rate
         if rate == LifeInsurance.ineligible:
             factor = 0
         elif rate == LifeInsurance.rate1:
-            factor = Variable.objects.get(name="insuranceRate1").value
+            factor = self.insuranceRates["insuranceRate1"]
         elif rate == LifeInsurance.rate2:
-            factor = Variable.objects.get(name="insuranceRate2").value
+            factor = self.insuranceRates["insuranceRate2"]
 
-        value = float(factor) / float(self.monthly_hours)
-        return f"{value:.2f}"
+        return toMoney(factor / self.monthly_hours)
 
-    @property
+    @cached_property
     def salary(self):
-        value = round(float(self.employee.pay_rate) * float(self.hrs_per_pay), 2)
-        return f"{value:.2f}"
+        return toMoney(self.employee.pay_rate * self.hrs_per_pay)
 
-    @property
+    @cached_property
     def fringes(self):
-        value = round(
-            ((float(self.pers) + float(self.medicare)) * float(self.hrs_per_pay) * 26)
-            + (float(self.board_ins_share) * 12),
-            2,
+        return toMoney(
+            ((self.pers + self.medicare) * self.hrs_per_pay * 26)
+            + (self.board_ins_share * 12)
         )
-        return f"{value:.2f}"
 
-    @property
+    @cached_property
     def total_comp(self):
-        value = round(float(self.salary) + float(self.fringes), 2)
-        return f"{value:.2f}"
+        return toMoney(self.salary + self.fringes)
 
     def __str__(self):
         return self.employee
@@ -859,7 +1089,8 @@ class paymentType(models.TextChoices):
 
 class Revenue(models.Model):
     item = models.ForeignKey(Item, on_delete=models.CASCADE, verbose_name="Item")
-    date = models.DateField(auto_now_add=True, verbose_name="Date")
+    #Indexed for the daily report and the dashboard, see reports.dailyActivity
+    date = models.DateField(auto_now_add=True, db_index=True, verbose_name="Date")
     people = models.ForeignKey(People, on_delete=models.PROTECT, verbose_name="People")
     amount = models.DecimalField(max_digits=20, decimal_places=2, verbose_name="Amount")
     payType = models.CharField(
@@ -882,6 +1113,14 @@ class Revenue(models.Model):
         null=True,
         verbose_name="Grant Line",
     )
+    importBatch = models.ForeignKey(
+        "ImportBatch",
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        editable=False,
+        verbose_name="Import Batch",
+    )
 
     def clean(self):
         if self.grantLine:
@@ -897,10 +1136,34 @@ class Revenue(models.Model):
 
         self.full_clean()
         with transaction.atomic():
-            fund = self.line.fund
+            previous = None
+            if not creating:
+                previous = (
+                    Revenue.objects.filter(pk=self.pk)
+                    .values("line_id", "line__fund_id", "grantLine_id", "amount")
+                    .first()
+                )
             super().save(*args, **kwargs)
-            fund.fund_cash_balance += self.amount
-            fund.save()
+
+            #Revenue only adds money so there is nothing to check and no lock needed
+            if previous:
+                shiftFundBalance(previous["line__fund_id"], -previous["amount"])
+            shiftFundBalance(self.line.fund_id, self.amount)
+
+            #Moving the running income totals, taking back the old amount if this is an edit
+            if previous:
+                shiftBalances(
+                    "line_total_income",
+                    previous["line_id"],
+                    previous["grantLine_id"],
+                    -previous["amount"],
+                )
+            shiftBalances(
+                "line_total_income", self.line_id, self.grantLine_id, self.amount
+            )
+            self.line.refresh_from_db(fields=["line_total_income"])
+            if self.grantLine:
+                self.grantLine.refresh_from_db(fields=["line_total_income"])
 
     def __str__(self):
         return f"{self.people} - {self.line} - {self.date} - ${self.amount}"
@@ -909,9 +1172,97 @@ class Revenue(models.Model):
         db_table = "Revenue"
 
 
+class ExpenseQuerySet(models.QuerySet):
+    def postBatch(self, expenses):
+        #Posts a set of expenses together instead of one save() each. The set is checked against the line, grant line
+        #and fund limits as a group, inserted in bulk, then each fund, line and grant line gets one summed balance UPDATE
+        #Expenses whose expenseFullID is already posted (or repeats in the set) are skipped. Returns the ones posted
+        expenses = list(expenses)
+        for expense in expenses:
+            expense.line = expense.item.line
+            if expense.expenseFullID == "":
+                expense.expenseFullID = expense.defaultFullID()
+
+        with transaction.atomic():
+            #Same lock order as lockForPosting (funds, then lines, then grant lines) so batches and single posts cant deadlock
+            funds = {
+                fund.pk: fund
+                for fund in Fund.objects.select_for_update()
+                .filter(pk__in={expense.line.fund_id for expense in expenses})
+                .order_by("pk")
+            }
+            lines = {
+                line.pk: line
+                for line in Line.objects.select_for_update()
+                .filter(pk__in={expense.line_id for expense in expenses})
+                .order_by("pk")
+            }
+            grantLines = {
+                grantLine.pk: grantLine
+                for grantLine in GrantLine.objects.select_for_update()
+                .filter(pk__in={expense.grantLine_id for expense in expenses if expense.grantLine_id})
+                .order_by("pk")
+            }
+
+            #With the funds locked no other post can add these IDs until we commit, so one query is enough
+            posted = set(
+                self.filter(
+                    expenseFullID__in=[expense.expenseFullID for expense in expenses]
+                ).values_list("expenseFullID", flat=True)
+            )
+            newExpenses = []
+            for expense in expenses:
+                if expense.expenseFullID not in posted:
+                    posted.add(expense.expenseFullID)
+                    newExpenses.append(expense)
+
+            errors = []
+            fundTotals = {}
+            lineTotals = {}
+            grantLineTotals = {}
+            relations = [field.name for field in Expense._meta.concrete_fields if field.is_relation]
+            for expense in newExpenses:
+                try:
+                    expense.clean_fields(exclude=relations + ["expenseFullID"])
+                except ValidationError as e:
+                    errors.extend(e.messages)
+                    continue
+                fundTotals[expense.line.fund_id] = fundTotals.get(expense.line.fund_id, 0) + expense.amount
+                lineTotals[expense.line_id] = lineTotals.get(expense.line_id, 0) + expense.amount
+                if expense.grantLine_id:
+                    grantLineTotals[expense.grantLine_id] = grantLineTotals.get(expense.grantLine_id, 0) + expense.amount
+
+            for grantLineID, total in grantLineTotals.items():
+                grantLine = grantLines[grantLineID]
+                if total > grantLine.budgetRemaining:
+                    errors.append(f"Expenses for {grantLine} total {formatMoney(total)}, more than the {formatMoney(grantLine.budgetRemaining)} remaining in the Grant Line")
+            for lineID, total in lineTotals.items():
+                line = lines[lineID]
+                if total > line.budgetRemaining:
+                    errors.append(f"Expenses for {line} total {formatMoney(total)}, more than the {formatMoney(line.budgetRemaining)} remaining in the Line")
+            for fundID, total in fundTotals.items():
+                fund = funds[fundID]
+                if total > fund.fund_cash_balance:
+                    errors.append(f"Expenses for {fund} total {formatMoney(total)}, more than the {formatMoney(fund.fund_cash_balance)} cash balance in the Fund")
+            if errors:
+                raise ValidationError({"amount": errors})
+
+            #The check above already skipped duplicates. If something still posts the same ID without locking the fund,
+            #the unique index raises and the whole batch rolls back, so the balances only move for rows that were stored
+            self.bulk_create(newExpenses, batch_size=1000)
+            markChanged("Expense")
+            for fundID, total in fundTotals.items():
+                shiftFundBalance(fundID, -total)
+            for lineID, total in lineTotals.items():
+                shiftBalances("line_budget_spent", lineID, None, total)
+            for grantLineID, total in grantLineTotals.items():
+                shiftBalances("line_budget_spent", None, grantLineID, total)
+        return newExpenses
+
+
 class Expense(models.Model):
     item = models.ForeignKey(Item, on_delete=models.CASCADE, verbose_name="Item")
-    date = models.DateField(default=timezone.now, verbose_name="Date", editable=False)
+    date = models.DateField(default=timezone.now, db_index=True, verbose_name="Date", editable=False)
     people = models.ForeignKey(People, on_delete=models.PROTECT, verbose_name="People")
     amount = models.DecimalField(max_digits=20, decimal_places=2, verbose_name="Amount")
     warrant = models.IntegerField(verbose_name="Warrant")
@@ -933,27 +1284,47 @@ class Expense(models.Model):
     )
 
     # Field to use to see if we have duplicates when importing form excel
-    expenseFullID = models.CharField(max_length=50, verbose_name="Expense Full ID")
+    # Unique so re-importing a payroll can never post the same line twice
+    expenseFullID = models.CharField(
+        max_length=50, unique=True, verbose_name="Expense Full ID"
+    )
+    importBatch = models.ForeignKey(
+        "ImportBatch",
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        editable=False,
+        verbose_name="Import Batch",
+    )
+
+    objects = ExpenseQuerySet.as_manager()
 
     def clean(self):
         line = self.item.line
         self.line = line
         fund = line.fund
         if self.grantLine:
-            if float(self.amount) > float(self.grantLine.budgetRemaining):
+            if self.amount > self.grantLine.budgetRemaining:
                 raise ValidationError(
                     {"amount": "Amount is greater than remaining budget in Grant Line"}
                 )
-        if float(self.amount) > float(self.line.budgetRemaining):
+        if self.amount > self.line.budgetRemaining:
             raise ValidationError(
                 {"amount": "Amount is greater than remaining budget in Line"}
             )
 
-        if float(self.amount) > float(fund.fund_cash_balance):
+        if self.amount > fund.fund_cash_balance:
             raise ValidationError(
                 {"amount": "Amount is greater than remaining cash balance in Fund"}
             )
 
+    def defaultFullID(self):
+        #Down to the microsecond so two entries in the same minute dont share an ID
+        timeNow = datetime.now().time()
+        timeNow = timeNow.strftime("%H:%M:%S.%f")
+        date = datetime.now().date()
+        return f"{self.employee.employee_id}-{self.ActivityList.ActivityList_id}-{date.isoformat()}-{timeNow}"
+
     def save(self, *args, **kwargs):
         # Check if this is the first time calling save on this object
         creating = self._state.adding
@@ -962,18 +1333,40 @@ class Expense(models.Model):
             self.line = self.item.line
             print(f"Full ID: {self.expenseFullID}")
             if self.expenseFullID == "":
-                timeNow = datetime.now().time()
-                timeNow = timeNow.strftime("%H:%M")
-                date = datetime.now().date()
-                fullID = f"{self.employee.employee_id}-{self.ActivityList.ActivityList_id}-{date.isoformat()}-{timeNow}"
-                self.expenseFullID = fullID
+                self.expenseFullID = self.defaultFullID()
 
-        self.full_clean()
         with transaction.atomic():
-            fund = self.line.fund
+            #Checking the budgets against locked rows so a concurrent post cant spend the same money
+            lockForPosting(self.item.line, self.grantLine)
+            #The unique index on expenseFullID does the duplicate check without a query per save
+            self.full_clean(validate_unique=False)
+            previous = None
+            if not creating:
+                previous = (
+                    Expense.objects.filter(pk=self.pk)
+                    .values("line_id", "line__fund_id", "grantLine_id", "amount")
+                    .first()
+                )
             super().save(*args, **kwargs)
-            fund.fund_cash_balance -= self.amount
-            fund.save()
+
+            if previous:
+                shiftFundBalance(previous["line__fund_id"], previous["amount"])
+            shiftFundBalance(self.line.fund_id, -self.amount)
+
+            #Moving the running spent totals, taking back the old amount if this is an edit
+            if previous:
+                shiftBalances(
+                    "line_budget_spent",
+                    previous["line_id"],
+                    previous["grantLine_id"],
+                    -previous["amount"],
+                )
+            shiftBalances(
+                "line_budget_spent", self.line_id, self.grantLine_id, self.amount
+            )
+            self.line.refresh_from_db(fields=["line_budget_spent"])
+            if self.grantLine:
+                self.grantLine.refresh_from_db(fields=["line_budget_spent"])
 
     def __str__(self):
         return f"{self.people} - {self.line} - {self.date} - ${self.amount}"
@@ -982,6 +1375,38 @@ class Expense(models.Model):
         db_table = "Expense"
 
 
+#The ImportBatch being reversed, its rows are skipped by the signals below, see ImportBatch.reverse
+reversingBatch = ContextVar("reversingBatch", default=None)
+
+
+#Signals instead of delete() overrides so queryset deletes and cascades from Item also update the counters
+#A deleted expense gives its money back to the fund, a deleted revenue takes it back out
+@receiver(post_delete, sender=Expense)
+def removeExpenseBalance(sender, instance, **kwargs):
+    if instance.importBatch_id and instance.importBatch_id == reversingBatch.get():
+        return
+    Fund.objects.filter(lines=instance.line_id).update(
+        fund_cash_balance=F("fund_cash_balance") + instance.amount
+    )
+    markChanged("Fund")
+    shiftBalances(
+        "line_budget_spent", instance.line_id, instance.grantLine_id, -instance.amount
+    )
+
+
+@receiver(post_delete, sender=Revenue)
+def removeRevenueBalance(sender, instance, **kwargs):
+    if instance.importBatch_id and instance.importBatch_id == reversingBatch.get():
+        return
+    Fund.objects.filter(lines=instance.line_id).update(
+        fund_cash_balance=F("fund_cash_balance") - instance.amount
+    )
+    markChanged("Fund")
+    shiftBalances(
+        "line_total_income", instance.line_id, instance.grantLine_id, -instance.amount
+    )
+
+
 class AccessControl(models.Model):
     title = models.CharField(max_length=100)
 
@@ -989,6 +1414,234 @@ class AccessControl(models.Model):
         permissions = [("has_full_access", "Has full access to all views")]
 
 
+#How long a job can be running before it is taken as abandoned by a worker that died, see manage.py runjobs --stale-after
+staleJobTimeout = timedelta(hours=6)
+
+
+class JobQuerySet(models.QuerySet):
+    def failStale(self, timeout=staleJobTimeout):
+        #A worker that dies mid-job leaves it running forever and its status page never finishes
+        #They are failed instead of queued again, imports commit chunk by chunk so running one again could post rows twice
+        now = timezone.now()
+        return self.filter(status="running", started__lt=now - timeout).update(
+            status="failed",
+            finished=now,
+            message="The job worker stopped before this job finished. Check what was imported before trying again.",
+        )
+
+    def claimNext(self, staleAfter=staleJobTimeout):
+        #Takes the oldest queued job and marks it running. skip_locked lets several workers share the table
+        self.failStale(staleAfter)
+        with transaction.atomic():
+            job = (
+                self.select_for_update(skip_locked=True)
+                .filter(status="queued")
+                .order_by("created")
+                .first()
+            )
+            if job:
+                job.status = "running"
+                job.started = timezone.now()
+                job.save(update_fields=["status", "started"])
+        return job
+
+
+class Job(models.Model):
+    #Long imports, reconciles and reports queued by the views and run by manage.py runjobs
+    kindChoices = [
+        ("tableImport", "Table Import"),
+        ("clockifyImport", "Clockify Payroll Import"),
+        ("reconcile", "Reconcile"),
+        ("pdfReport", "PDF Report"),
+    ]
+    statusChoices = [
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    ]
+    kind = models.CharField(max_length=20, choices=kindChoices, verbose_name="Kind")
+    status = models.CharField(
+        max_length=10, choices=statusChoices, default="queued", verbose_name="Status"
+    )
+    params = models.JSONField(default=dict, blank=True, verbose_name="Parameters")
+    upload = models.FileField(upload_to="jobs/uploads/", blank=True, verbose_name="Upload")
+    secondUpload = models.FileField(
+        upload_to="jobs/uploads/", blank=True, verbose_name="Second Upload"
+    )
+    result = models.FileField(upload_to="jobs/results/", blank=True, verbose_name="Result")
+    progress = models.IntegerField(default=0, verbose_name="Rows Done")
+    message = models.TextField(blank=True, verbose_name="Message")
+    user = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="User"
+    )
+    created = models.DateTimeField(auto_now_add=True, verbose_name="Created")
+    started = models.DateTimeField(null=True, blank=True, verbose_name="Started")
+    finished = models.DateTimeField(null=True, blank=True, verbose_name="Finished")
+
+    objects = JobQuerySet.as_manager()
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    def reportProgress(self, rows):
+        #Called by the importers after each committed chunk, the status page polls this
+        self.progress = rows
+        Job.objects.filter(pk=self.pk).update(progress=rows)
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.pk} ({self.get_status_display()})"
+
+    class Meta:
+        db_table = "Jobs"
+        indexes = [models.Index(fields=["status", "created"])]
+
+
+def summedBy(queryset, key):
+    #{key: total amount} with one GROUP BY query
+    return {
+        values[key]: values["total"]
+        for values in queryset.values(key).annotate(total=Sum("amount")).order_by()
+        if values[key] is not None
+    }
+
+
+class ImportBatch(models.Model):
+    #One per import. Every Expense, Revenue and Payroll row an import creates points at its batch so the
+    #whole import can be undone at once
+    source = models.CharField(max_length=50, verbose_name="Source")
+    fileName = models.CharField(max_length=255, blank=True, verbose_name="File Name")
+    rows = models.IntegerField(default=0, verbose_name="Rows Created")
+    user = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="User"
+    )
+    job = models.OneToOneField(
+        Job,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="importBatch",
+        verbose_name="Job",
+    )
+    created = models.DateTimeField(auto_now_add=True, verbose_name="Created")
+    reversedAt = models.DateTimeField(null=True, blank=True, verbose_name="Reversed")
+    reversedBy = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+        verbose_name="Reversed By",
+    )
+
+    def reverse(self, user=None):
+        #Deletes every row the batch created in one transaction. The balances they moved are put back with one
+        #summed UPDATE per fund, line and grant line instead of one per row, so a big payroll comes out as fast as it went in
+        with transaction.atomic():
+            batch = ImportBatch.objects.select_for_update().get(pk=self.pk)
+            if batch.reversedAt:
+                raise ValidationError("This import was already reversed")
+            expenses = Expense.objects.filter(importBatch=batch)
+            revenues = Revenue.objects.filter(importBatch=batch)
+
+            #Expenses took money out of the fund and revenue put it in
+            fundChanges = summedBy(expenses, "line__fund_id")
+            for fundID, total in summedBy(revenues, "line__fund_id").items():
+                fundChanges[fundID] = fundChanges.get(fundID, 0) - total
+            lineSpent = summedBy(expenses, "line_id")
+            lineIncome = summedBy(revenues, "line_id")
+            grantLineSpent = summedBy(expenses, "grantLine_id")
+            grantLineIncome = summedBy(revenues, "grantLine_id")
+
+            #Same lock order as posting so a reversal and a post cant deadlock
+            list(Fund.objects.select_for_update().filter(pk__in=fundChanges).order_by("pk"))
+            list(Line.objects.select_for_update().filter(pk__in=set(lineSpent) | set(lineIncome)).order_by("pk"))
+            list(GrantLine.objects.select_for_update().filter(pk__in=set(grantLineSpent) | set(grantLineIncome)).order_by("pk"))
+
+            for fundID, total in fundChanges.items():
+                shiftFundBalance(fundID, total)
+            for counter, lineTotals, grantLineTotals in [
+                ("line_budget_spent", lineSpent, grantLineSpent),
+                ("line_total_income", lineIncome, grantLineIncome),
+            ]:
+                for lineID, total in lineTotals.items():
+                    shiftBalances(counter, lineID, None, -total)
+                for grantLineID, total in grantLineTotals.items():
+                    shiftBalances(counter, None, grantLineID, -total)
+
+            #The balances were already put back above, the post_delete signals would move them a second time
+            #with an UPDATE per row. reversingBatch tells them to skip this batch's rows
+            payrolls = Payroll.objects.filter(importBatch=batch)
+            token = reversingBatch.set(batch.pk)
+            try:
+                deleted = {
+                    name: queryset.delete()[1].get(queryset.model._meta.label, 0)
+                    for name, queryset in [("expenses", expenses), ("revenues", revenues), ("payrolls", payrolls)]
+                }
+            finally:
+                reversingBatch.reset(token)
+            markChanged("Expense", "Revenue", "Payroll")
+
+            batch.reversedAt = timezone.now()
+            batch.reversedBy = user
+            batch.save(update_fields=["reversedAt", "reversedBy"])
+        self.reversedAt = batch.reversedAt
+        self.reversedBy = batch.reversedBy
+        return deleted
+
+    def __str__(self):
+        return f"{self.source} import #{self.pk}"
+
+    class Meta:
+        db_table = "ImportBatch"
+
+
+class DataVersion(models.Model):
+    #A stamp per table that moves forward after every committed write to it. Cached reports are keyed by the stamps
+    #of the tables they read, so a change to any of them means the old copy is never used again (see reportcache.py)
+    table = models.CharField(max_length=50, primary_key=True, verbose_name="Table")
+    version = models.BigIntegerField(default=0, verbose_name="Version")
+
+    class Meta:
+        db_table = "DataVersions"
+
+
+#Bookkeeping tables no report reads, saving them doesnt move any stamp
+unversionedModels = ["Job", "ImportBatch", "DataVersion", "AccessControl"]
+
+
+def saveDataVersions():
+    connection = transaction.get_connection()
+    tables = getattr(connection, "changedTables", None)
+    if not tables:
+        return
+    connection.changedTables = set()
+    DataVersion.objects.bulk_create(
+        [DataVersion(table=table) for table in tables], ignore_conflicts=True
+    )
+    DataVersion.objects.filter(table__in=tables).update(version=F("version") + 1)
+
+
+def markChanged(*tables):
+    #Changed tables are collected on the connection and stamped once after the transaction commits,
+    #so a 5,000 row import moves each stamp once and posting transactions never wait on a stamp row lock
+    #A rolled back transaction leaves its tables in the set, the next commit stamps them too which is harmless
+    connection = transaction.get_connection()
+    if getattr(connection, "changedTables", None) is None:
+        connection.changedTables = set()
+    connection.changedTables.update(tables)
+    #One callback per transaction however many rows it writes. Django drops a callback from run_on_commit when its
+    #transaction or savepoint rolls back, so checking the pending list (instead of a flag of our own) cant lose a stamp
+    if not any(callback[1] is saveDataVersions for callback in connection.run_on_commit):
+        transaction.on_commit(saveDataVersions)
+
+
+#Connected to every other model of the app in apps.py. Bulk writes and UPDATEs dont send signals, they call markChanged themselves
+def markSavedTable(sender, **kwargs):
+    markChanged(sender.__name__)
+
+
 """
 class Clockify(models.Model):
     ActivityList = models.ForeignKey(ActivityList, on_delete=models.PROTECT)
@@ -0,0 +1,44 @@
+from decimal import Decimal, ROUND_HALF_UP
+from django.db.models import QuerySet, Sum
+
+#Money stays a Decimal from the database to the template, only the money filter turns it into text
+
+CENT = Decimal("0.01")
+ZERO = Decimal("0.00")
+
+
+def toMoney(value):
+    #Rounds to cents. Floats go through str so we dont pick up binary rounding errors
+    if value is None or value == "":
+        return ZERO
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value))
+    return value.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def sumMoney(values):
+    #Sums any iterable of amounts (list, generator, pandas column) without going through float
+    total = ZERO
+    for value in values:
+        if value is None or value == "":
+            continue
+        total += value if isinstance(value, Decimal) else Decimal(str(value))
+    return toMoney(total)
+
+
+def sumColumn(rows, field):
+    #Totals one column of a queryset, a DataFrame, or a list of dicts/objects
+    #Querysets are summed by the database so the rows never get loaded
+    if isinstance(rows, QuerySet):
+        return toMoney(rows.aggregate(total=Sum(field))["total"])
+    if hasattr(rows, "columns"):
+        return sumMoney(rows[field])
+    return sumMoney(
+        row[field] if isinstance(row, dict) else getattr(row, field) for row in rows
+    )
+
+
+def formatMoney(value):
+    if value is None or value == "":
+        return ""
+    return f"${toMoney(value):,.2f}"
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import tempfile
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from .models import DataVersion
+from .reports import standardReports
+
+#Finished reports and exports are kept as files named after what they were built from: the kind of report,
+#its parameters and the data version of every table it reads. Any save or delete on one of those tables moves
+#its version (see models.markChanged), so the next request looks for a new name and builds the report again
+#Nothing has to be cleared on a write, a new copy replaces the older ones of the same report when it is saved
+
+#The tables the calculated export columns read besides the table itself, see reports.annotatedProperties
+computedSources = {
+    "Fund": ["Line"],
+    "Grant": ["GrantLine"],
+    "Payroll": ["Employee"],
+    "Testing": ["Fund"],
+    "Benefits": ["Employee", "Variable"],
+}
+
+countyPayrollSources = ["Payroll", "ActivityList", "Employee", "Item", "Line"]
+
+dailySources = ["Expense", "Revenue", "Line", "People"]
+
+
+def cacheRoot():
+    return getattr(settings, "REPORT_CACHE_ROOT", os.path.join(settings.MEDIA_ROOT, "reportCache"))
+
+
+def digest(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def exportSources(tableName, computed=False):
+    return [tableName] + (computedSources.get(tableName, []) if computed else [])
+
+
+def reportPath(kind, params, tables, extension, day=None):
+    #The versions are read before the report is built, if a write lands while it is building the file
+    #is saved under the old versions and never served again
+    #Reports that print the day they were made pass it as day. It goes in with the versions rather than the params,
+    #so tomorrow's copy has the same name prefix and removeOlderCopies clears out today's
+    versions = dict(DataVersion.objects.filter(table__in=tables).values_list("table", "version"))
+    stamp = [(table, versions.get(table, 0)) for table in sorted(tables)] + [day]
+    return os.path.join(cacheRoot(), f"{kind}-{digest(params)}-{digest(stamp)}.{extension}")
+
+
+def tablePdfPath(tableName):
+    return reportPath("tablePdf", {"table": tableName}, [tableName], "pdf", timezone.localdate())
+
+
+def cachedFile(path):
+    return path if os.path.exists(path) else None
+
+
+def removeOlderCopies(path):
+    prefix = os.path.basename(path).rsplit("-", 1)[0] + "-"
+    folder = os.path.dirname(path)
+    for name in os.listdir(folder):
+        if name.startswith(prefix) and name != os.path.basename(path):
+            try:
+                os.remove(os.path.join(folder, name))
+            except FileNotFoundError:
+                pass
+
+
+def openTemp(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    handle, tempPath = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+    #mkstemp makes the file private, the web and worker containers may run as different users
+    os.chmod(tempPath, 0o644)
+    return os.fdopen(handle, "wb"), tempPath
+
+
+def writeFile(path, data):
+    file, tempPath = openTemp(path)
+    with file:
+        file.write(data)
+    #Renamed into place so a request never serves half a file
+    os.replace(tempPath, path)
+
+
+def saveBytes(path, data):
+    writeFile(path, data)
+    removeOlderCopies(path)
+    return data
+
+
+def cachedBytes(path, build):
+    #Returns the saved copy, or builds it and saves it for the next request
+    if cachedFile(path):
+        with open(path, "rb") as file:
+            return file.read()
+    return saveBytes(path, build())
+
+
+def savedStream(path, pieces):
+    #Passes a streamed report through to the response and writes it to the cache as it goes
+    #The copy is only kept if the whole report was sent, a cancelled download leaves nothing behind
+    file, tempPath = openTemp(path)
+    finished = False
+    try:
+        with file:
+            for piece in pieces:
+                data = piece.encode() if isinstance(piece, str) else piece
+                file.write(data)
+                yield data
+        finished = True
+    finally:
+        if finished:
+            os.replace(tempPath, path)
+            removeOlderCopies(path)
+        elif os.path.exists(tempPath):
+            os.remove(tempPath)
+
+
+#The nightly set from manage.py build_reports, one folder per day named YYYY-MM-DD
+def prebuiltRoot():
+    return getattr(settings, "PREBUILT_REPORTS_ROOT", os.path.join(settings.MEDIA_ROOT, "prebuiltReports"))
+
+
+def prebuiltFolder(day):
+    return os.path.join(prebuiltRoot(), day.isoformat())
+
+
+def prebuiltDays():
+    #Newest first, anything in the folder that isnt a date is ignored
+    if not os.path.isdir(prebuiltRoot()):
+        return []
+    days = []
+    for name in os.listdir(prebuiltRoot()):
+        try:
+            day = parse_date(name)
+        except ValueError:
+            day = None
+        if day:
+            days.append(day)
+    return sorted(days, reverse=True)
+
+
+def prebuiltFile(day, name):
+    #Only the standard report names are looked up so the URL cant point anywhere else on disk
+    if name not in [fileName for fileName, label, builder in standardReports]:
+        return None
+    return cachedFile(os.path.join(prebuiltFolder(day), f"{name}.pdf"))
+
+
+def prebuiltReports(days=14):
+    #[(day, [(name, label), ...]), ...] for the Reports page, only the reports that were actually built
+    listing = []
+    for day in prebuiltDays()[:days]:
+        built = [(name, label) for name, label, builder in standardReports if prebuiltFile(day, name)]
+        if built:
+            listing.append((day, built))
+    return listing
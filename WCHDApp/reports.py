@@ -0,0 +1,531 @@
+from django.apps import apps
+from django.db import models
+from django.db.models import CharField, Count, F, Sum, Case, When, Value
+from django.utils import timezone
+from reportlab.lib.pagesizes import letter, landscape
+from reportlab.lib import colors
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, LongTable, TableStyle, PageBreak
+from openpyxl import load_workbook
+from openpyxl.styles import PatternFill
+from decimal import Decimal
+from io import BytesIO, StringIO
+import csv
+import pandas as pd
+from itertools import chain
+from .models import Benefits, Payroll, ActivityList, Employee, Expense, Revenue, Fund, Grant
+from .money import toMoney, formatMoney, sumColumn
+
+#Builds the files behind the report, export and reconcile pages. They return bytes so they can run
+#inside a request or in the background job worker (see jobs.py)
+
+#Rows fetched per database round trip, and written per piece of a streamed CSV
+exportChunkSize = 2000
+
+#Any property that we define in models need to go here so tableView and exports can include them
+calculatedProperties = {
+    "Testing": [("fundBalanceMinus3", "Fund Balance Minus 3")],
+    "Benefits": [("pers", "Public Employee Retirement System"), ("medicare", "Medicare"),("wc", "Workers Comp"), ("plar", "Paid Leave Accumulation Rate"), ("vacation", "Vacation"), ("sick", "Sick Leave"), ("holiday", "Holiday Leave"), ("total_hrly", "Total Hourly Cost"), ("percent_leave", "Percent Leave"), ("monthly_hours", "Monthly Hours"), ("board_share_hrly", "Board Share Hourly"), ("life_hourly", "Life Hourly"), ("salary", "Salary"), ("fringes", "Fringes"), ("total_comp", "Total Compensation")],
+    "Payroll": [("pay_rate", "Pay Rate")],
+    "Fund":[("calcRemaining", "Remaining"), ("budgeted", "Budgeted")],
+    "Line": [("budgetRemaining", "Budget Remaining")],
+    "GrantLine": [("budgetRemaining", "Budget Remaining")],
+    "Grant": [("grantAwardAmountRemaining", "Grant Award Amount Remaining"),( "recieved","Recieved")]
+}
+
+
+def annotatedProperties(queryset, tableName):
+    #The same numbers as the calculated properties, worked out by the database in the export query
+    #Returns the annotated queryset and which annotation holds each property
+    if tableName == "Fund":
+        return queryset.with_budget_totals(), {"calcRemaining": "remainingTotal", "budgeted": "budgetedTotal"}
+    if tableName in ("Line", "GrantLine"):
+        return queryset.with_rollups(), {"budgetRemaining": "remainingTotal"}
+    if tableName == "Grant":
+        return queryset.with_stats(), {"grantAwardAmountRemaining": "unbudgetedTotal", "recieved": "receivedTotal"}
+    if tableName == "Payroll":
+        return queryset.annotate(payRate=F("employee__pay_rate")), {"pay_rate": "payRate"}
+    if tableName == "Testing":
+        return queryset.annotate(balanceMinus3=F("fund__fund_cash_balance") - 3), {"fundBalanceMinus3": "balanceMinus3"}
+    return queryset, {}
+
+
+def propertyRows(queryset, columns, properties):
+    #For properties that chain Python math (Benefits) the rows are loaded as instances with their foreign keys joined
+    #and the properties run on each one. Anything they look up is shared so the export still costs no query per row
+    queryset = queryset.select_related(*[
+        field.name for field in queryset.model._meta.concrete_fields if field.is_relation
+    ])
+    shared = {}
+    for obj in queryset.iterator(chunk_size=exportChunkSize):
+        if isinstance(obj, Benefits):
+            if "insuranceRates" not in shared:
+                shared["insuranceRates"] = obj.insuranceRates
+            obj.insuranceRates = shared["insuranceRates"]
+        yield [getattr(obj, column) for column in columns] + [getattr(obj, name) for name in properties]
+
+
+def tableCsv(model, computed=False):
+    #Yields a CSV of the whole table a few thousand rows at a time for a StreamingHttpResponse
+    #Rows come from values_list().iterator() so neither model instances nor the whole table are ever held in memory
+    #computed adds the table's calculatedProperties as extra columns after the fields
+    columns = [field.attname for field in model._meta.concrete_fields]
+    properties = [name for name, label in calculatedProperties.get(model.__name__, [])] if computed else []
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns + properties)
+    #The header goes out before the query runs so the download starts straight away
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+
+    queryset = model._default_manager.order_by("pk")
+    annotations = {}
+    if properties:
+        queryset, annotations = annotatedProperties(queryset, model.__name__)
+    if all(name in annotations for name in properties):
+        rows = queryset.values_list(
+            *columns, *[annotations[name] for name in properties]
+        ).iterator(chunk_size=exportChunkSize)
+        if properties:
+            #Rounded to cents like the properties are
+            rows = (row[:len(columns)] + tuple(toMoney(value) for value in row[len(columns):]) for row in rows)
+    else:
+        rows = propertyRows(queryset, columns, properties)
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % exportChunkSize == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+#PDF table reports. Rows are laid out a page at a time, each page is its own small LongTable, so a big table costs
+#the same per row as a small one instead of reportlab splitting one huge Table again and again
+#manage.py benchmark_pdf times it for growing row counts
+pdfMargin = 36
+pdfRowPadding = 6
+
+
+def pdfColumns(model):
+    #(attname, header, relative width) for every column, the width comes from the field type and size
+    columns = []
+    for field in model._meta.concrete_fields:
+        target = field.target_field if field.is_relation else field
+        if isinstance(target, models.BooleanField):
+            width = 5
+        elif isinstance(target, models.DecimalField):
+            #Room for the commas and cents of formatted money
+            width = target.max_digits + target.max_digits // 3 + 2
+        elif isinstance(target, models.DateTimeField):
+            width = 17
+        elif isinstance(target, models.DateField):
+            width = 10
+        elif isinstance(target, (models.IntegerField, models.AutoField)):
+            width = 8
+        elif isinstance(target, models.CharField):
+            width = min(target.max_length or 30, 30)
+        else:
+            width = 30
+        label = str(field.verbose_name)
+        columns.append((field.attname, label, max(width, min(len(label), 14))))
+    return columns
+
+
+def pdfCell(value, maxChars):
+    if value is None:
+        return ""
+    if isinstance(value, Decimal):
+        text = f"{value:,.2f}"
+    else:
+        text = str(value)
+    if len(text) > maxChars:
+        text = text[:max(maxChars - 1, 1)] + "…"
+    return text
+
+
+def pdfTotals(model):
+    #Real totals for the end of the report, every money column and the row count from one aggregate query
+    moneyFields = [field for field in model._meta.concrete_fields if isinstance(field, models.DecimalField)]
+    totals = model._default_manager.aggregate(
+        rowCount=Count("pk"), **{field.attname: Sum(field.attname) for field in moneyFields}
+    )
+    lines = [f"<b>Rows:</b> {totals['rowCount']:,}"]
+    for field in moneyFields:
+        lines.append(f"<b>Total {field.verbose_name}:</b> {formatMoney(totals[field.attname] or 0)}")
+    return lines
+
+
+def tablePdf(tableName):
+    model = apps.get_model('WCHDApp', tableName)
+    columns = pdfColumns(model)
+    rows = model._default_manager.order_by("pk").values_list(
+        *[attname for attname, label, width in columns]
+    ).iterator(chunk_size=exportChunkSize)
+    title = "Washington County Health Department"
+    subtitle = f"{str(model._meta.verbose_name_plural).title()} as of {timezone.localdate():%m/%d/%Y}"
+    return buildPdf(title, subtitle, columns, rows, pdfTotals(model))
+
+
+def buildPdf(title, subtitle, columns, rows, totals):
+    #Lays rows out a page at a time. Rows are consumed as they come so they can be a database iterator
+    buffer = BytesIO()
+
+    #Wide tables get the page turned sideways
+    pagesize = landscape(letter) if len(columns) > 6 else letter
+    doc = SimpleDocTemplate(
+        buffer, pagesize=pagesize,
+        leftMargin=pdfMargin, rightMargin=pdfMargin, topMargin=pdfMargin, bottomMargin=pdfMargin,
+    )
+    elements = []
+    styles = getSampleStyleSheet()
+
+    title_style = ParagraphStyle(
+        "TitleStyle",
+        parent=styles["Title"],
+        fontSize=16,
+        spaceAfter=11,
+        fontName="Helvetica-Bold"
+    )
+
+    subtitle_style = ParagraphStyle(
+        "SubtitleStyle",
+        parent=styles["Normal"],
+        fontSize=11,
+        textColor=colors.black,
+        spaceAfter=6,
+        fontName="Helvetica-Oblique"
+    )
+
+    intro = [
+        Spacer(1, 12),
+        Paragraph(title, title_style),
+        Paragraph(subtitle, subtitle_style),
+        Spacer(1, 12),
+    ]
+    elements.extend(intro)
+
+    #Widths shared out in proportion to each column's size, text that doesnt fit is cut short so every row is one line high
+    fontSize = 7 if len(columns) > 10 else 8
+    usableWidth = doc.width - 12
+    totalWeight = sum(width for attname, label, width in columns)
+    colWidths = [usableWidth * width / totalWeight for attname, label, width in columns]
+    maxChars = [max(int(width / (fontSize * 0.55)), 3) for width in colWidths]
+    header = [pdfCell(label, chars) for (attname, label, width), chars in zip(columns, maxChars)]
+
+    #Frames pad 6 points on each side, one spare row is left in case the estimate is a little off
+    rowHeight = fontSize + pdfRowPadding
+    usableHeight = doc.height - 12
+    introHeight = sum(
+        flowable.wrap(doc.width, doc.height)[1] + flowable.getSpaceBefore() + flowable.getSpaceAfter()
+        for flowable in intro
+    )
+    rowsPerPage = int(usableHeight // rowHeight) - 2
+    firstPageRows = int((usableHeight - introHeight) // rowHeight) - 2
+
+    style = TableStyle([
+        ("BACKGROUND", (0, 0), (-1, 0), colors.darkgray),
+        ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
+        ("ALIGN", (0, 0), (-1, -1), "CENTER"),
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+        ("BACKGROUND", (0, 1), (-1, -1), colors.whitesmoke),
+        ("GRID", (0, 0), (-1, -1), 0.5, colors.black),
+        ("FONTSIZE", (0, 0), (-1, -1), fontSize),
+        ("TOPPADDING", (0, 0), (-1, -1), 1),
+        ("BOTTOMPADDING", (0, 0), (-1, -1), 1),
+    ])
+
+    def pageTable(pageRows):
+        #repeatRows keeps the header on top if a page piece ever has to split
+        return LongTable([header] + pageRows, colWidths=colWidths, rowHeights=rowHeight, repeatRows=1, style=style)
+
+    pageRows = []
+    pageSize = firstPageRows
+    for row in rows:
+        pageRows.append([pdfCell(value, chars) for value, chars in zip(row, maxChars)])
+        if len(pageRows) == pageSize:
+            elements.append(pageTable(pageRows))
+            elements.append(PageBreak())
+            pageRows = []
+            pageSize = rowsPerPage
+    if pageRows or not elements[len(intro):]:
+        elements.append(pageTable(pageRows))
+
+    # Totals (below table)
+    elements.append(Spacer(1, 12))
+    for line in totals:
+        elements.append(Paragraph(line, styles["Normal"]))
+
+    #Build PDF
+    doc.build(elements)
+
+    # Get the PDF value from buffer
+    pdf_data = buffer.getvalue()
+    buffer.close()
+    return pdf_data
+
+
+def dailyActivity(day=None):
+    #The day's expenses and revenue for the daily report and the dashboard
+    #Both tables are filtered on their indexed date column and totalled by the database in one grouped query each,
+    #by line (and payment type for revenue). The fund, line, payment type and overall totals are added up from those groups
+    day = day or timezone.localdate()
+    activity = {
+        "date": day,
+        "expenses": Expense.objects.filter(date=day),
+        "revenues": Revenue.objects.filter(date=day),
+        "expenseTotal": toMoney(0),
+        "revenueTotal": toMoney(0),
+        "expenseCount": 0,
+        "revenueCount": 0,
+        "byFund": {},
+        "byLine": {},
+        "byPayType": {},
+    }
+    grouped = [
+        ("expense", activity["expenses"].values("line_id", "line__fund_id")),
+        ("revenue", activity["revenues"].values("line_id", "line__fund_id", "payType")),
+    ]
+    for kind, groups in grouped:
+        for group in groups.annotate(total=Sum("amount"), rows=Count("pk")).order_by():
+            total = toMoney(group["total"])
+            activity[f"{kind}Total"] += total
+            activity[f"{kind}Count"] += group["rows"]
+            for key, value in [("byFund", group["line__fund_id"]), ("byLine", group["line_id"])]:
+                totals = activity[key].setdefault(value, {"expense": toMoney(0), "revenue": toMoney(0)})
+                totals[kind] += total
+            if kind == "revenue":
+                activity["byPayType"][group["payType"]] = activity["byPayType"].get(group["payType"], toMoney(0)) + total
+    for key in ("byFund", "byLine"):
+        activity[key] = dict(sorted(activity[key].items()))
+    return activity
+
+
+dailyColumns = [
+    ("type", "Type", 8),
+    ("fund", "Fund", 12),
+    ("line", "Line", 18),
+    ("people", "Customer/Vendor", 20),
+    ("payType", "Payment Type", 10),
+    ("number", "Warrant/Reference", 10),
+    ("amount", "Amount", 14),
+    ("comment", "Comment", 30),
+]
+
+
+def dailyPdf(day=None):
+    activity = dailyActivity(day)
+    rowFields = ["line__fund_id", "line_id", "people__name"]
+    expenses = (
+        ("Expense", fund, line, people, "", warrant, amount, comment)
+        for fund, line, people, warrant, amount, comment in activity["expenses"]
+        .order_by("pk").values_list(*rowFields, "warrant", "amount", "comment").iterator(chunk_size=exportChunkSize)
+    )
+    revenues = (
+        ("Revenue", fund, line, people, payType, reference, amount, comment)
+        for fund, line, people, payType, reference, amount, comment in activity["revenues"]
+        .order_by("pk").values_list(*rowFields, "payType", "reference", "amount", "comment").iterator(chunk_size=exportChunkSize)
+    )
+
+    totals = [
+        f"<b>Expenses:</b> {activity['expenseCount']:,} for {formatMoney(activity['expenseTotal'])}",
+        f"<b>Revenue:</b> {activity['revenueCount']:,} for {formatMoney(activity['revenueTotal'])}",
+    ]
+    for payType, total in sorted(activity["byPayType"].items()):
+        totals.append(f"<b>{payType} revenue:</b> {formatMoney(total)}")
+    for fund, total in activity["byFund"].items():
+        totals.append(
+            f"<b>Fund {fund}:</b> {formatMoney(total['expense'])} spent, {formatMoney(total['revenue'])} received"
+        )
+    for line, total in activity["byLine"].items():
+        totals.append(
+            f"<b>Line {line}:</b> {formatMoney(total['expense'])} spent, {formatMoney(total['revenue'])} received"
+        )
+    title = "Washington County Health Department"
+    subtitle = f"Daily Transactions for {activity['date']:%m/%d/%Y}"
+    return buildPdf(title, subtitle, dailyColumns, chain(expenses, revenues), totals)
+
+
+def summaryPdf(subtitle, columns, records, totalled):
+    #PDF of a short list of dicts (one per fund, grant or pay period) with the money columns in totalled summed at the end
+    rows = [
+        [toMoney(record[attname]) if attname in totalled else record[attname] for attname, label, width in columns]
+        for record in records
+    ]
+    totals = [f"<b>Rows:</b> {len(records):,}"]
+    for attname, label, width in columns:
+        if attname in totalled:
+            totals.append(f"<b>Total {label}:</b> {formatMoney(sumColumn(records, attname))}")
+    return buildPdf("Washington County Health Department", subtitle, columns, rows, totals)
+
+
+def fundSummaryPdf(day=None):
+    columns = [
+        ("fund_id", "Fund ID", 12),
+        ("fund_name", "Fund Name", 30),
+        ("fund_cash_balance", "Cash Balance", 14),
+        ("budgetedTotal", "Budgeted", 14),
+        ("spentTotal", "Spent", 14),
+        ("remainingTotal", "Remaining", 14),
+        ("availableTotal", "Available", 14),
+    ]
+    funds = list(Fund.objects.with_budget_totals().order_by("pk").values(*[attname for attname, label, width in columns]))
+    subtitle = f"Fund Summary as of {day or timezone.localdate():%m/%d/%Y}"
+    return summaryPdf(subtitle, columns, funds, [attname for attname, label, width in columns[2:]])
+
+
+def grantStatsPdf(day=None):
+    columns = [
+        ("grant_id", "Grant ID", 12),
+        ("grant_name", "Grant Name", 30),
+        ("award_amount", "Award Amount", 14),
+        ("budgetedTotal", "Budgeted", 14),
+        ("spentTotal", "Spent", 14),
+        ("remainingTotal", "Remaining", 14),
+        ("receivedTotal", "Received", 14),
+    ]
+    grants = list(Grant.objects.with_stats().order_by("pk").values(*[attname for attname, label, width in columns]))
+    subtitle = f"Grant Stats as of {day or timezone.localdate():%m/%d/%Y}"
+    return summaryPdf(subtitle, columns, grants, [attname for attname, label, width in columns[2:]])
+
+
+def payrollByPeriodPdf(day=None):
+    #Hours and pay for every pay period and fund from one grouped query, newest period first
+    columns = [
+        ("payperiod_id", "Pay Period", 10),
+        ("payperiod__periodStart", "Period Start", 10),
+        ("payperiod__periodEnd", "Period End", 10),
+        ("ActivityList__fund_id", "Fund", 12),
+        ("employees", "Employees", 8),
+        ("hours", "Hours", 10),
+        ("pay", "Pay", 14),
+    ]
+    periods = list(
+        Payroll.objects.values("payperiod_id", "payperiod__periodStart", "payperiod__periodEnd", "ActivityList__fund_id")
+        .annotate(employees=Count("employee", distinct=True), hours=Sum("hours"), pay=Sum("pay_amount"))
+        .order_by("-payperiod__periodStart", "ActivityList__fund_id")
+    )
+    subtitle = f"Payroll by Pay Period as of {day or timezone.localdate():%m/%d/%Y}"
+    return summaryPdf(subtitle, columns, periods, ["hours", "pay"])
+
+
+#The set manage.py build_reports renders every night for the Reports page, (file name, label, builder)
+#Each builder takes the day the set is built for
+standardReports = [
+    ("fundSummary", "Fund Summary", fundSummaryPdf),
+    ("grantStats", "Grant Stats", grantStatsPdf),
+    ("payrollByPeriod", "Payroll by Pay Period", payrollByPeriodPdf),
+    ("dailyTransactions", "Daily Transactions", dailyPdf),
+]
+
+#The standard reports that can be built for a past day. The rest read the balances as they are now,
+#so build_reports --date only makes these for an earlier day
+pastDayReports = ["dailyTransactions"]
+
+
+#Activities whose name has one of these words are paid under that paycode, everything else is regular pay
+paycodeKeywords = {
+    "SICK": "S-SICK",
+    "COMP": "C-COMPTIME",
+    "VAC": "V-VACATION",
+    "HOLIDAY": "H-HOLIDAY",
+}
+regularPaycode = "R-REGULAR PA"
+
+countyPayrollColumns = ["JobNumber", "Paycode", "Time Group/Description", "Hours", "HourlyRate", "Salary", "AccountDistribution"]
+
+
+def paycodeFor(program):
+    program = program.upper()
+    for keyword, paycode in paycodeKeywords.items():
+        if keyword in program:
+            return paycode
+    return regularPaycode
+
+
+def accountDistribution(line):
+    #Line IDs are YEAR-FUND-LINE (older ones FUND-LINE), the county wants FUND 50290 LINE
+    splitID = line.line_id.split("-")
+    fundID, lineID = splitID[-2], splitID[-1]
+    return f"{fundID}50290{lineID}"
+
+
+def countyPayrollRows(payperiodID):
+    #Hours per employee and paycode for the county payroll upload, in three queries for any number of employees
+    #The paycode is worked out once per activity, then the database totals the hours grouped by employee and paycode
+    payrolls = Payroll.objects.filter(payperiod_id=payperiodID)
+    activities = ActivityList.objects.filter(payroll__payperiod_id=payperiodID).distinct().values_list("pk", "program")
+    activitiesByPaycode = {}
+    for activityID, program in activities:
+        activitiesByPaycode.setdefault(paycodeFor(program), []).append(activityID)
+    paycode = Case(
+        *[When(ActivityList__in=activityIDs, then=Value(code)) for code, activityIDs in activitiesByPaycode.items()],
+        default=Value(regularPaycode),
+        output_field=CharField(),
+    )
+    totals = list(
+        payrolls.annotate(paycode=paycode)
+        .values("employee", "paycode")
+        .annotate(hours=Sum("hours"))
+        .order_by("paycode", "employee")
+    )
+
+    employees = Employee.objects.select_related("payItem__line").in_bulk({total["employee"] for total in totals})
+    rows = []
+    for total in totals:
+        employee = employees[total["employee"]]
+        rows.append({
+            "JobNumber": employee.employee_id,
+            "Paycode": total["paycode"],
+            "Time Group/Description": "",
+            "Hours": toMoney(total["hours"]),
+            "HourlyRate": employee.pay_rate,
+            "Salary": "",
+            "AccountDistribution": accountDistribution(employee.payItem.line),
+        })
+    return rows
+
+
+def reconcileWorkbook(firstFile, secondFile):
+    #Merges two CSV lists and highlights the rows that are only in one of them
+    df1 = pd.read_csv(firstFile)
+    df2 = pd.read_csv(secondFile)
+
+    columnList = list(df1.columns)
+    for i in range(len(columnList)):
+        columnList[i] = columnList[i].strip()
+    # Merge the two lists and remove duplicates
+    merged_df = pd.concat([df1, df2]).drop_duplicates()
+
+    # Identify common entries (entries in both list1 and list2)
+    common_entries = df1.merge(df2, on=columnList, how="inner")
+
+    # Write the merged data to an in memory Excel file, then load it back for formatting
+    mergedStream = BytesIO()
+    merged_df.to_excel(mergedStream, index=False)
+    mergedStream.seek(0)
+    wb = load_workbook(mergedStream)
+    ws = wb.active
+
+    # Define highlight style
+    highlight_fill = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
+
+    # Convert common entries into a set for fast lookup
+    rows = common_entries[columnList].apply(tuple, axis=1)
+    common_set = set(rows)
+
+    # Apply highlighting to rows that are NOT common (i.e., unique to either list1 or list2)
+    for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=1):
+        rowData = []
+        for column in row:
+            rowData.append(column.value)
+        rowTuple = tuple(rowData)
+        if rowTuple not in common_set:  # Highlight unique entries only
+            for cell in row:
+                cell.fill = highlight_fill
+
+    #Saveing to stream in file attachment format
+    outputStream = BytesIO()
+    wb.save(outputStream)
+    return outputStream.getvalue()
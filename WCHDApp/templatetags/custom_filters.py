@@ -1,4 +1,5 @@
 from django import template
+from WCHDApp.money import formatMoney
 
 register = template.Library()
 
@@ -10,8 +11,7 @@ def get_item(dictionary, key):
 def get_attr(obj, attr):
     return getattr(obj, attr, '')
 
+#The only place money gets turned into text, everything before this stays Decimal
 @register.filter
 def money(value):
-    if value is None or value == "":
-        return ""
-    return f"${float(value):,.2f}"
\ No newline at end of file
+    return formatMoney(value)
\ No newline at end of file
@@ -1,3 +1,1210 @@
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+import tempfile
+import shutil
+import os
+from django.conf import settings
+import csv
+import re
+from django.db import connection, connections, IntegrityError
+from django.db.models import Sum
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User, Permission
+from django.urls import reverse
+from django.utils.http import urlencode
+from decimal import Decimal
+from datetime import date, timedelta, time as timeOfDay
+from django.utils import timezone
+from threading import Thread
+from io import BytesIO, StringIO
+from openpyxl import Workbook
+from unittest import mock
+from django.core.exceptions import ValidationError
+import time
+import logging
+from .models import (
+    Dept,
+    Fund,
+    Line,
+    Item,
+    People,
+    Employee,
+    ActivityList,
+    Expense,
+    Revenue,
+    Grant,
+    GrantLine,
+    PayPeriod,
+    PayPeriodIndex,
+    Payroll,
+    Job,
+    ImportBatch,
+    Benefits,
+    Variable,
+    DataVersion,
+    ExpenseQuerySet,
+    markChanged,
+    saveDataVersions,
+)
+from .reports import tableCsv, countyPayrollRows, tablePdf, pdfTotals, pdfColumns, dailyActivity
+from .reportcache import tablePdfPath, cachedBytes, prebuiltFolder
+from .money import toMoney
+from .importer import importFields, importCSV, importClockify, resolveClockifyNames, checkCSV, checkClockify
 
 # Create your tests here.
+
+logger = logging.getLogger(__name__)
+
+
+def temporaryFolder(testCase):
+    #Made when the test needs it and removed again when it finishes
+    folder = tempfile.mkdtemp()
+    testCase.addCleanup(shutil.rmtree, folder, ignore_errors=True)
+    return folder
+
+
+def temporarySettings(testCase, *names):
+    #Points each folder setting at its own temporary folder for the rest of the test
+    folderSettings = override_settings(**{name: temporaryFolder(testCase) for name in names})
+    folderSettings.enable()
+    testCase.addCleanup(folderSettings.disable)
+
+
+def createFixtures(fundID, startingBalance, lineCount=1, expensesPerLine=0):
+    #Fund with an expense line per lineCount plus a revenue line, an item on each and everything an Expense needs
+    dept = Dept.objects.create(dept_name=fundID)
+    fund = Fund(
+        fund_id=fundID,
+        fund_name=f"{fundID} Fund",
+        year=2025,
+        fund_cash_balance=startingBalance,
+        sof="LOCAL",
+        dept=dept,
+    )
+    fund.save()
+
+    expenseItems = []
+    for i in range(lineCount):
+        line = Line(
+            line_id=f"EXP{i}",
+            fund=fund,
+            line_name=f"Expense Line {i}",
+            line_budgeted=Decimal("50000") / lineCount,
+            lineType="Expense",
+        )
+        line.save()
+        item = Item(
+            line=line,
+            item_name=f"Expense Item {i}",
+            line_item=str(i),
+            category=fundID,
+            fee_based=False,
+            month=1,
+        )
+        item.save()
+        expenseItems.append(item)
+
+    revenueLine = Line(
+        line_id="REV",
+        fund=fund,
+        line_name="Revenue Line",
+        line_budgeted=Decimal("1000"),
+        lineType="Revenue",
+    )
+    revenueLine.save()
+    revenueItem = Item(
+        line=revenueLine,
+        item_name="Revenue Item",
+        line_item="REV",
+        category=fundID,
+        fee_based=False,
+        month=1,
+    )
+    revenueItem.save()
+
+    user = User.objects.create(username=fundID)
+    people = People.objects.create(
+        name=f"{fundID} Vendor",
+        address="1 Main St",
+        city="Marietta",
+        state="OH",
+        zip_code="45750",
+        phone="740-000-0000",
+        email="vendor@example.com",
+    )
+    employee = Employee.objects.create(
+        employee_id=1,
+        first_name=fundID,
+        surname="Vendor",
+        hire_date=date(2020, 1, 1),
+        yos=5,
+        job_title="Cashier",
+        pay_rate=Decimal("20.00"),
+        adminPayFund=fund,
+        payItem=expenseItems[0],
+        specialPayItem=expenseItems[0],
+        specialFund=fund,
+        user=user,
+    )
+    activity = ActivityList.objects.create(
+        program=fundID,
+        dept=dept,
+        fund=fund,
+        item=expenseItems[0],
+        fphs="Admin",
+        payType="general",
+    )
+
+    for item in expenseItems:
+        for i in range(expensesPerLine):
+            Expense(
+                item=item,
+                people=people,
+                amount=Decimal("1.25"),
+                warrant=1,
+                comment=fundID,
+                ActivityList=activity,
+                employee=employee,
+                expenseFullID=f"{item.pk}-{i}",
+            ).save()
+
+    return {
+        "fund": fund,
+        "expenseItem": expenseItems[0],
+        "revenueItem": revenueItem,
+        "user": user,
+        "people": people,
+        "employee": employee,
+        "activity": activity,
+    }
+
+
+#Needs a database with real row locks (PostgreSQL), sqlite locks the whole file
+@skipUnlessDBFeature("has_select_for_update")
+class ConcurrentFundPostingTest(TransactionTestCase):
+    threads = 8
+    postsPerThread = 25
+    startingBalance = Decimal("100000.00")
+
+    def setUp(self):
+        fixtures = createFixtures("STRESS", self.startingBalance)
+        self.fund = fixtures["fund"]
+        self.expenseItem = fixtures["expenseItem"]
+        self.revenueItem = fixtures["revenueItem"]
+        self.people = fixtures["people"]
+        self.employee = fixtures["employee"]
+        self.activity = fixtures["activity"]
+
+    def post(self, threadNumber, errors):
+        try:
+            #Each thread gets its own instances like separate requests would
+            expenseItem = Item.objects.get(pk=self.expenseItem.pk)
+            revenueItem = Item.objects.get(pk=self.revenueItem.pk)
+            for i in range(self.postsPerThread):
+                Expense(
+                    item=expenseItem,
+                    people=self.people,
+                    amount=Decimal("1.25"),
+                    warrant=1,
+                    comment="Stress",
+                    ActivityList=self.activity,
+                    employee=self.employee,
+                    expenseFullID=f"stress-{threadNumber}-{i}",
+                ).save()
+                Revenue(
+                    item=revenueItem,
+                    people=self.people,
+                    amount=Decimal("0.75"),
+                    payType="Cash",
+                    reference=i,
+                    comment="Stress",
+                    ActivityList=self.activity,
+                    employee=self.employee,
+                ).save()
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connections.close_all()
+
+    def test_concurrent_posts_keep_exact_balance(self):
+        errors = []
+        workers = [
+            Thread(target=self.post, args=(n, errors)) for n in range(self.threads)
+        ]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(errors, [])
+        posts = self.threads * self.postsPerThread
+        expected = self.startingBalance - posts * Decimal("1.25") + posts * Decimal("0.75")
+        self.fund.refresh_from_db()
+        self.assertEqual(self.fund.fund_cash_balance, expected)
+        self.assertEqual(
+            Line.objects.get(pk="2025-STRESS-EXP0").line_budget_spent,
+            posts * Decimal("1.25"),
+        )
+        logger.debug("%d posts from %d threads in %.2fs (%.0f posts/s)", posts * 2, self.threads, elapsed, posts * 2 / elapsed)
+
+
+class BudgetLimitTest(TestCase):
+    #Line and GrantLine clean() check the budget against the locked fund or grant and the other lines in it
+    @classmethod
+    def setUpTestData(cls):
+        #60,000 cash with a 50,000 expense line and a 1,000 revenue line leaves 11,000 to budget
+        cls.fixtures = createFixtures("LIMIT", Decimal("60000.00"))
+        cls.fund = cls.fixtures["fund"]
+        cls.grant = Grant.objects.create(
+            grant_name="Limit Grant", fund=cls.fund, grant_year=2025, cfda="93.000", program_name="Limit",
+            award_amount=Decimal("10000"), pt_no="1", beg_date=date(2025, 1, 1), end_date=date(2025, 12, 31),
+            fsid="1", funder="ODH",
+        )
+
+    def newLine(self, budgeted):
+        return Line(line_id="NEW", fund=self.fund, line_name="New Line", line_budgeted=budgeted, lineType="Expense")
+
+    def newGrantLine(self, budgeted, lineType="Expense"):
+        return GrantLine(grant=self.grant, fund_year=2025, line_name="New", line_budgeted=budgeted, lineType=lineType)
+
+    def test_line_cant_budget_more_than_the_fund_has(self):
+        with self.assertRaises(ValidationError) as caught:
+            self.newLine(Decimal("11000.01")).save()
+        self.assertEqual(caught.exception.message_dict["line_budgeted"], ["Not enough remaining balance in fund"])
+        self.newLine(Decimal("11000.00")).save()
+
+    def test_editing_a_line_doesnt_count_its_own_budget_twice(self):
+        line = Line.objects.get(pk="2025-LIMIT-EXP0")
+        line.line_name = "Renamed"
+        line.save()
+        line.line_budgeted = Decimal("61000.00")
+        line.save()
+        line.line_budgeted = Decimal("61000.01")
+        with self.assertRaises(ValidationError):
+            line.save()
+        self.assertEqual(Line.objects.get(pk=line.pk).line_budgeted, Decimal("61000.00"))
+
+    def test_grant_lines_cant_budget_more_than_the_award(self):
+        first = self.newGrantLine(Decimal("6000"))
+        first.save()
+        with self.assertRaises(ValidationError) as caught:
+            self.newGrantLine(Decimal("4000.01")).save()
+        self.assertEqual(caught.exception.message_dict["line_budgeted"], ["Budgeted is more than is left in Grant Award"])
+
+        #The line being edited is left out of the total it is checked against
+        first.line_budgeted = Decimal("10000")
+        first.save()
+
+        self.newGrantLine(Decimal("0"), "Revenue").save()
+        with self.assertRaises(ValidationError) as caught:
+            self.newGrantLine(Decimal("0"), "Revenue").save()
+        self.assertIn("lineType", caught.exception.message_dict)
+
+
+class RunningCounterTest(TestCase):
+    #line_budget_spent and line_total_income are kept by the posts, they always have to match the rows
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixtures = createFixtures("COUNTER", Decimal("100000.00"), lineCount=2)
+        cls.items = list(Item.objects.filter(line__lineType="Expense").order_by("pk"))
+        grant = Grant.objects.create(
+            grant_name="Counter Grant", fund=cls.fixtures["fund"], grant_year=2025, cfda="93.000",
+            program_name="Counter", award_amount=Decimal("10000"), pt_no="1", beg_date=date(2025, 1, 1),
+            end_date=date(2025, 12, 31), fsid="1", funder="ODH",
+        )
+        cls.expenseGrantLine = GrantLine(
+            grant=grant, fund_year=2025, line_name="Expense", line_budgeted=Decimal("5000"), lineType="Expense"
+        )
+        cls.expenseGrantLine.save()
+        cls.revenueGrantLine = GrantLine(
+            grant=grant, fund_year=2025, line_name="Revenue", line_budgeted=Decimal("5000"), lineType="Revenue"
+        )
+        cls.revenueGrantLine.save()
+
+    def assertCountersMatchRows(self):
+        for model in (Line, GrantLine):
+            relation = "line" if model is Line else "grantLine"
+            for row in model.objects.all():
+                spent = Expense.objects.filter(**{relation: row}).aggregate(total=Sum("amount"))["total"]
+                income = Revenue.objects.filter(**{relation: row}).aggregate(total=Sum("amount"))["total"]
+                self.assertEqual(row.line_budget_spent, toMoney(spent), row)
+                self.assertEqual(row.line_total_income, toMoney(income), row)
+        fund = Fund.objects.get(pk=self.fixtures["fund"].pk)
+        expenses = Expense.objects.aggregate(total=Sum("amount"))["total"]
+        revenues = Revenue.objects.aggregate(total=Sum("amount"))["total"]
+        self.assertEqual(fund.fund_cash_balance, Decimal("100000.00") - toMoney(expenses) + toMoney(revenues))
+
+    def post(self):
+        expense = Expense(
+            item=self.items[0], people=self.fixtures["people"], amount=Decimal("100.00"), warrant=1, comment="Counter",
+            ActivityList=self.fixtures["activity"], employee=self.fixtures["employee"], grantLine=self.expenseGrantLine,
+        )
+        expense.save()
+        revenue = Revenue(
+            item=self.fixtures["revenueItem"], people=self.fixtures["people"], amount=Decimal("40.00"), payType="Cash",
+            reference=1, comment="Counter", ActivityList=self.fixtures["activity"], employee=self.fixtures["employee"],
+            grantLine=self.revenueGrantLine,
+        )
+        revenue.save()
+        return expense, revenue
+
+    def test_posting_editing_and_deleting_keep_the_counters(self):
+        expense, revenue = self.post()
+        self.assertCountersMatchRows()
+
+        #A new amount and a move to the other line take the old amount back from where it was
+        expense.amount = Decimal("25.00")
+        expense.item = self.items[1]
+        expense.save()
+        revenue.amount = Decimal("15.50")
+        revenue.save()
+        self.assertCountersMatchRows()
+        self.assertEqual(Line.objects.get(pk=self.items[0].line_id).line_budget_spent, 0)
+
+        expense.delete()
+        revenue.delete()
+        self.assertCountersMatchRows()
+
+    def test_saving_a_line_loaded_before_a_post_keeps_the_counters(self):
+        staleLine = Line.objects.get(pk=self.items[0].line_id)
+        staleGrantLine = GrantLine.objects.get(pk=self.expenseGrantLine.pk)
+        self.post()
+        staleLine.line_name = "Renamed"
+        staleLine.save()
+        staleGrantLine.line_name = "Renamed"
+        staleGrantLine.save()
+        self.assertCountersMatchRows()
+        self.assertEqual(Line.objects.get(pk=staleLine.pk).line_name, "Renamed")
+
+    def test_rebuild_balances_fixes_wrong_counters(self):
+        self.post()
+        Line.objects.update(line_budget_spent=Decimal("999.00"), line_total_income=Decimal("1.00"))
+        GrantLine.objects.update(line_budget_spent=Decimal("999.00"))
+        call_command("rebuild_balances", stdout=StringIO())
+        self.assertCountersMatchRows()
+
+
+class QueryBudgetMixin:
+    #Fails when a named url runs more queries than its budget, using the count from QueryBudgetMiddleware
+    def assertQueryBudget(self, urlName, budget, args=None, query=None):
+        url = reverse(urlName, args=args)
+        if query:
+            url += "?" + urlencode(query)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        queryCount = int(response["X-Query-Count"])
+        self.assertLessEqual(
+            queryCount, budget, f"{url} ran {queryCount} queries, budget is {budget}"
+        )
+        return response
+
+
+class ViewQueryBudgetTest(QueryBudgetMixin, TestCase):
+    #Enough rows that a query per row would blow every budget below
+    lineCount = 20
+
+    @classmethod
+    def setUpTestData(cls):
+        fixtures = createFixtures(
+            "BUDGET", Decimal("100000.00"), lineCount=cls.lineCount, expensesPerLine=3
+        )
+        cls.fund = fixtures["fund"]
+        user = fixtures["user"]
+        user.user_permissions.add(Permission.objects.get(codename="has_full_access"))
+
+        for i in range(cls.lineCount):
+            grant = Grant.objects.create(
+                grant_name=f"Grant {i}",
+                fund=cls.fund,
+                grant_year=2025,
+                cfda="93.000",
+                program_name="Budget",
+                award_amount=Decimal("10000"),
+                pt_no="1",
+                beg_date=date(2025, 1, 1),
+                end_date=date(2025, 12, 31),
+                fsid="1",
+                funder="ODH",
+            )
+            GrantLine(
+                grant=grant,
+                fund_year=2025,
+                line_name="Expense",
+                line_budgeted=Decimal("5000"),
+                lineType="Expense",
+            ).save()
+            GrantLine(
+                grant=grant,
+                fund_year=2025,
+                line_name="Revenue",
+                line_budgeted=Decimal("5000"),
+                lineType="Revenue",
+            ).save()
+        cls.grant = grant
+        cls.user = user
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_table_views(self):
+        for tableName in ["Fund", "Line", "Item", "Grant", "GrantLine", "Expense"]:
+            self.assertQueryBudget("tableView", 8, args=[tableName])
+
+    def test_line_and_item_views(self):
+        self.assertQueryBudget("lineView", 8)
+        self.assertQueryBudget("lineTableUpdate", 10, query={"fund": self.fund.pk})
+        self.assertQueryBudget("itemView", 8)
+        self.assertQueryBudget(
+            "viewByYearPartial", 10, query={"model": "Line", "yearDropdown": 2025}
+        )
+        self.assertQueryBudget(
+            "viewByYearPartial", 10, query={"model": "Fund", "yearDropdown": 2025}
+        )
+
+    def test_grant_views(self):
+        self.assertQueryBudget("grantStats", 8)
+        self.assertQueryBudget("grantBreakdown", 8, query={"grantID": self.grant.pk})
+        self.assertQueryBudget(
+            "grantLineTableUpdate", 10, query={"grant": self.grant.pk}
+        )
+
+
+class BulkImportTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        fixtures = createFixtures("IMPORT", Decimal("100000.00"))
+        cls.fund = fixtures["fund"]
+        cls.people = fixtures["people"]
+
+    def test_people_rows_are_created_and_updated(self):
+        rows = ["people_id,name,address,city,state,zip_code,phone,email,primary_contact,ein,account_number"]
+        rows.append(f"{self.people.pk},Renamed,1 Main St,Marietta,OH,45750,740-000-0000,a@example.com,,,")
+        for i in range(2500):
+            rows.append(f",Vendor {i},{i} Main St,Marietta,OH,45750,740-000-0000,v{i}@example.com,,,")
+        #sqlite caps how many rows fit in one insert, so allow for smaller batches than postgres uses
+        with CaptureQueriesContext(connection) as queries:
+            result = importCSV(People, StringIO("\n".join(rows)))
+        self.assertLess(len(queries), 50)
+
+        self.assertEqual(result, {"rows": 2501, "created": 2500, "updated": 1})
+        self.assertEqual(People.objects.count(), 2501)
+        self.people.refresh_from_db()
+        self.assertEqual(self.people.name, "Renamed")
+        self.assertIsNone(self.people.ein)
+
+    def test_reimported_line_keeps_its_running_counters(self):
+        line = Line.objects.get(pk="2025-IMPORT-EXP0")
+        Expense(
+            item=Item.objects.get(line=line), people=self.people, amount=Decimal("5.00"), warrant=1, comment="Posted",
+            ActivityList=ActivityList.objects.get(), employee=Employee.objects.get(),
+        ).save()
+        columns = [field.attname for field in importFields(Line)]
+        values = Line.objects.filter(pk=line.pk).values(*columns).get()
+        values["line_name"] = "Renamed Line"
+        rows = [",".join(columns), ",".join("" if values[column] is None else str(values[column]) for column in columns)]
+        self.assertEqual(importCSV(Line, StringIO("\n".join(rows)))["updated"], 1)
+
+        line.refresh_from_db()
+        self.assertEqual(line.line_name, "Renamed Line")
+        self.assertEqual(line.line_budget_spent, Decimal("5.00"))
+
+    def test_a_line_export_can_be_imported_again(self):
+        Expense(
+            item=Item.objects.get(line_id="2025-IMPORT-EXP0"), people=self.people, amount=Decimal("5.00"), warrant=1,
+            comment="Posted", ActivityList=ActivityList.objects.get(), employee=Employee.objects.get(),
+        ).save()
+        export = "".join(tableCsv(Line))
+        self.assertIn("line_budget_spent", export.splitlines()[0])
+        self.assertEqual(importCSV(Line, StringIO(export))["updated"], Line.objects.count())
+        self.assertEqual(Line.objects.get(pk="2025-IMPORT-EXP0").line_budget_spent, Decimal("5.00"))
+
+    def test_bad_header_names_the_columns(self):
+        rows = ["people_id,name,address,city,state,zip_code,phone,email,primary_contact,ein,nickname"]
+        with self.assertRaises(ValidationError) as caught:
+            importCSV(People, StringIO("\n".join(rows)))
+        self.assertEqual(
+            caught.exception.messages,
+            ["Bad File. Missing columns: account_number. Unexpected columns: nickname"],
+        )
+
+    def test_items_take_their_fund_from_the_line(self):
+        line = Line.objects.get(pk="2025-IMPORT-EXP0")
+        rows = ["item_id,fund_id,fund_type,line_id,fund_year,item_name,line_item,category,fee_based,month"]
+        for i in range(50):
+            rows.append(f",{self.fund.pk},LOCAL,{line.pk},1999,Item {i},{i},Bulk,False,{i % 12 + 1}")
+        importCSV(Item, StringIO("\n".join(rows)))
+
+        items = Item.objects.filter(category="Bulk")
+        self.assertEqual(items.count(), 50)
+        self.assertFalse(items.exclude(fund_year=line.fund_year).exists())
+        self.assertFalse(items.exclude(fund_type=self.fund.sof).exists())
+
+    def test_every_bad_row_is_reported_before_writing(self):
+        rows = ["item_id,fund_id,fund_type,line_id,fund_year,item_name,line_item,category,fee_based,month"]
+        rows.append(f",{self.fund.pk},LOCAL,NOPE,2025,Item,1,Bad,False,January")
+        rows.append(f",{self.fund.pk},LOCAL,MISSING,2025,Item,1,Bad,maybe,1")
+        with self.assertRaises(ValidationError) as caught:
+            importCSV(Item, StringIO("\n".join(rows)))
+
+        messages = caught.exception.messages
+        self.assertIn("Row 2: Month: 'January' is not a valid value", messages)
+        self.assertIn("Row 3: Fee Based: 'maybe' is not a valid value", messages)
+        self.assertIn("Row 2: Line: No line with ID NOPE", messages)
+        self.assertIn("Row 3: Line: No line with ID MISSING", messages)
+        self.assertFalse(Item.objects.filter(category="Bad").exists())
+
+    def test_xlsx_rows_go_through_the_same_import(self):
+        header = ["people_id", "name", "address", "city", "state", "zip_code", "phone", "email", "primary_contact", "ein", "account_number"]
+        rows = [[None, f"Sheet Vendor {i}", "1 Main St", "Marietta", "OH", 45750, "740-000-0000", "s@example.com", None, None, None] for i in range(3)]
+        #A blank row in the middle is skipped but still counted when rows are numbered
+        rows.insert(1, [None] * len(header))
+        rows.append([None, "", "1 Main St", "Marietta", "OH", 45750, "740-000-0000", "s@example.com", None, None, 12.5])
+        with mock.patch("WCHDApp.importer.chunkSize", 2):
+            result = checkCSV(People, workbookFile(header, rows))
+        self.assertEqual(result, {"rows": 4, "errors": [(6, "Name", "This field cannot be blank.")]})
+
+        result = importCSV(People, workbookFile(header, rows[:-1]))
+        self.assertEqual(result["created"], 3)
+        vendor = People.objects.get(name="Sheet Vendor 2")
+        self.assertEqual(vendor.zip_code, "45750")
+
+    def test_dry_run_reports_problems_without_writing(self):
+        rows = ["item_id,fund_id,fund_type,line_id,fund_year,item_name,line_item,category,fee_based,month"]
+        rows.append(f",{self.fund.pk},LOCAL,2025-IMPORT-EXP0,2025,Item,1,Checked,False,1")
+        rows.append(f",{self.fund.pk},LOCAL,NOPE,2025,Item,1,Checked,maybe,1")
+        rows.append(f",{self.fund.pk},LOCAL,2025-IMPORT-EXP0,2025,Item,1,Checked,False,1.5")
+        result = checkCSV(Item, StringIO("\n".join(rows)))
+
+        self.assertEqual(result["rows"], 3)
+        self.assertEqual(
+            sorted(result["errors"]),
+            [
+                (3, "Fee Based", "'maybe' is not a valid value"),
+                (3, "Line", "No line with ID NOPE"),
+                (4, "Month", "'1.5' is not a valid value"),
+            ],
+        )
+        self.assertFalse(Item.objects.filter(category="Checked").exists())
+
+
+    def test_dry_run_runs_the_model_and_budget_checks(self):
+        line = Line.objects.get(pk="2025-IMPORT-EXP0")
+        item = Item.objects.get(line=line)
+        columns = [field.attname for field in importFields(Expense)]
+        rows = [",".join(columns)]
+        #The line has 50,000 budgeted, each of the first three rows fits on its own but not all together
+        for i, amount in enumerate(["20000.00", "20000.00", "20000.00", "60000.00"]):
+            values = {
+                "item_id": item.pk, "date": "2025-01-01", "people_id": self.people.pk, "amount": amount, "warrant": 1,
+                "comment": "Checked", "ActivityList_id": ActivityList.objects.get().pk, "line_id": line.pk,
+                "employee_id": Employee.objects.get().pk, "expenseFullID": f"checked-{i}",
+            }
+            rows.append(",".join(str(values.get(column, "")) for column in columns))
+        with CaptureQueriesContext(connection) as queries:
+            result = checkCSV(Expense, StringIO("\n".join(rows)))
+        #The related rows clean() reads are fetched once for the chunk, not once per row
+        self.assertLess(len(queries), 20)
+
+        self.assertEqual(
+            result["errors"],
+            [
+                (4, "Amount", "Brings Line (2025-IMPORT-EXP0) Expense Line 0 to $60,000.00, more than its $50,000.00 remaining"),
+                (5, "Amount", "Amount is greater than remaining budget in Line"),
+            ],
+        )
+        self.assertFalse(Expense.objects.filter(comment="Checked").exists())
+
+        columns = [field.attname for field in importFields(Line)]
+        values = Line.objects.filter(pk=line.pk).values(*columns).get()
+        values["line_budgeted"] = "500000.00"
+        rows = [",".join(columns), ",".join("" if values[column] is None else str(values[column]) for column in columns)]
+        result = checkCSV(Line, StringIO("\n".join(rows)))
+        self.assertEqual(result["errors"], [(2, "Budgeted", "Not enough remaining balance in fund")])
+
+
+def workbookFile(header, rows):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(header)
+    for row in rows:
+        sheet.append(row)
+    stream = BytesIO()
+    workbook.save(stream)
+    stream.seek(0)
+    return stream
+
+
+def clockifyCSV(rows):
+    header = "Project,User,Start Date,Start Time,End Date,Billable Amount (USD),Duration (decimal)"
+    return StringIO("\n".join([header] + rows))
+
+
+class ClockifyImportTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        fixtures = createFixtures("CLOCK", Decimal("100000.00"))
+        cls.user = fixtures["user"]
+        cls.fund = fixtures["fund"]
+        PayPeriod.objects.create(
+            payperiod_id="2025-01", periodStart=date(2025, 1, 1), periodEnd=date(2025, 1, 14)
+        )
+
+    def row(self, startTime, user="CLOCK Vendor", hours="1.50", project="CLOCK", day="01/06/2025"):
+        return f"{project},{user},{day},{startTime} AM,{day},30.00,{hours}"
+
+    def test_rows_post_expenses_and_payroll_once(self):
+        rows = [self.row(f"0{hour}:00:00", hours=f"{hour}.00") for hour in range(1, 4)]
+        self.assertEqual(importClockify(clockifyCSV(rows), self.user), 3)
+        #Same file again plus a repeated line, nothing new gets posted
+        importClockify(clockifyCSV(rows + rows[:1]), self.user)
+
+        self.assertEqual(Expense.objects.filter(comment="Payroll").count(), 3)
+        self.assertEqual(Payroll.objects.count(), 3)
+        self.fund.refresh_from_db()
+        self.assertEqual(self.fund.fund_cash_balance, Decimal("100000.00") - Decimal("120.00"))
+
+    def test_a_bad_row_in_a_later_chunk_posts_nothing(self):
+        rows = [self.row(f"0{hour}:00:00") for hour in range(1, 4)]
+        #No pay period covers this day
+        rows.append(self.row("05:00:00", day="03/01/2025"))
+        progress = []
+        with mock.patch("WCHDApp.importer.chunkSize", 2):
+            with self.assertRaises(ValidationError) as caught:
+                importClockify(clockifyCSV(rows), self.user, progress=progress.append)
+
+        self.assertEqual(caught.exception.messages, ["Row 5: End Date: No payperiod for this date range"])
+        self.assertEqual(progress, [])
+        self.assertFalse(Expense.objects.filter(comment="Payroll").exists())
+        self.assertFalse(Payroll.objects.exists())
+        self.assertFalse(ImportBatch.objects.exists())
+
+    def test_missing_columns_are_named(self):
+        file = StringIO("Project,Start Date\nClock,01/01/2025")
+        with self.assertRaises(ValidationError) as caught:
+            importClockify(file, self.user)
+        self.assertEqual(
+            caught.exception.messages,
+            ["Bad File. Missing columns: User, End Date, Billable Amount (USD), Duration (decimal), Start Time"],
+        )
+
+    def test_names_are_resolved_once_and_reported_together(self):
+        rows = [self.row(f"{hour:02}:00:00", user="  clock   VENDOR ") for hour in range(1, 13)]
+        rows.append(self.row("01:00:00", user="Nobody Here"))
+        rows.append(self.row("02:00:00", project="Missing Program"))
+        with self.assertRaises(ValidationError) as caught:
+            importClockify(clockifyCSV(rows), self.user)
+        self.assertEqual(
+            caught.exception.messages,
+            ["No employee named Nobody Here", "No activity named Missing Program"],
+        )
+        self.assertFalse(Expense.objects.filter(comment="Payroll").exists())
+
+        #Employee, activity, people and signed in employee are one query each no matter how many rows
+        periods = PayPeriod.objects.index()
+        with CaptureQueriesContext(connection) as queries:
+            names = resolveClockifyNames(clockifyCSV(rows[:12]), self.user, periods)
+        self.assertEqual(len(queries), 4)
+        self.assertEqual(names["employee"]["clock vendor"].surname, "Vendor")
+
+
+    def test_import_is_reversed_as_one_batch(self):
+        rows = [self.row(f"0{hour}:00:00", hours=f"{hour}.00") for hour in range(1, 4)]
+        with mock.patch("WCHDApp.importer.chunkSize", 2):
+            importClockify(clockifyCSV(rows), self.user)
+        batch = ImportBatch.objects.get()
+        self.assertEqual(batch.rows, 6)
+        self.assertEqual(Expense.objects.filter(importBatch=batch).count(), 3)
+
+        #Same number of statements for 3 rows or 5,000
+        with CaptureQueriesContext(connection) as queries:
+            deleted = batch.reverse(self.user)
+        self.assertLess(len(queries), 20)
+        self.assertEqual(deleted, {"expenses": 3, "revenues": 0, "payrolls": 3})
+        self.assertFalse(Payroll.objects.exists())
+        self.fund.refresh_from_db()
+        self.assertEqual(self.fund.fund_cash_balance, Decimal("100000.00"))
+        self.assertEqual(Line.objects.get(pk="2025-CLOCK-EXP0").line_budget_spent, 0)
+
+        with self.assertRaises(ValidationError):
+            batch.reverse(self.user)
+        #The same file can be posted again once it was reversed
+        self.assertEqual(importClockify(clockifyCSV(rows), self.user), 3)
+
+    def test_xlsx_export_posts_like_the_csv(self):
+        header = ["Project", "User", "Start Date", "Start Time", "End Date", "Billable Amount (USD)", "Duration (decimal)"]
+        day = date(2025, 1, 6)
+        rows = [["CLOCK", "CLOCK Vendor", day, timeOfDay(hour, 0), day, 30, 1.5] for hour in (1, 2)]
+        self.assertEqual(importClockify(workbookFile(header, rows), self.user), 2)
+        #The CSV export of the same rows is already posted
+        importClockify(clockifyCSV([self.row("01:00:00"), self.row("02:00:00")]), self.user)
+
+        self.assertEqual(Expense.objects.filter(comment="Payroll").count(), 2)
+        self.fund.refresh_from_db()
+        self.assertEqual(self.fund.fund_cash_balance, Decimal("100000.00") - Decimal("60.00"))
+
+    def test_dry_run_reports_rows_that_would_fail(self):
+        rows = [self.row("01:00:00"), self.row("02:00:00", user="Nobody Here")]
+        rows.append(self.row("03:00:00", day="03/01/2025"))
+        #Each row fits in the 50,000 line budget, the third one takes the total over it
+        rows += [self.row(f"0{hour}:00:00", hours="1000.00") for hour in range(4, 8)]
+        result = checkClockify(clockifyCSV(rows), self.user)
+
+        self.assertEqual(result["rows"], 7)
+        problems = {(row, column) for row, column, problem in result["errors"]}
+        self.assertEqual(problems, {(3, "User"), (4, "End Date"), (7, "Duration (decimal)")})
+        self.assertIn("more than its $50,000.00 remaining", result["errors"][-1][2])
+        self.assertFalse(Expense.objects.filter(comment="Payroll").exists())
+        self.assertFalse(Payroll.objects.exists())
+
+
+class PayPeriodIndexTest(SimpleTestCase):
+    def test_dates_find_the_period_that_contains_them(self):
+        periods = [
+            PayPeriod(payperiod_id=f"2025-{n:02}", periodStart=date(2025, 1, 1 + 14 * n), periodEnd=date(2025, 1, 14 + 14 * n))
+            for n in (1, 0)
+        ]
+        #A gap between the last period and this one
+        periods.append(PayPeriod(payperiod_id="2025-03", periodStart=date(2025, 2, 5), periodEnd=date(2025, 2, 18)))
+        index = PayPeriodIndex(periods)
+
+        self.assertEqual(index.find(date(2025, 1, 1)).payperiod_id, "2025-00")
+        self.assertEqual(index.find(date(2025, 1, 14)).payperiod_id, "2025-00")
+        self.assertEqual(index.find(date(2025, 1, 15)).payperiod_id, "2025-01")
+        self.assertEqual(index.find(date(2025, 2, 18)).payperiod_id, "2025-03")
+        self.assertIsNone(index.find(date(2024, 12, 31)))
+        self.assertIsNone(index.find(date(2025, 2, 1)))
+        self.assertIsNone(index.find(date(2025, 3, 1)))
+
+
+class BatchPostingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixtures = createFixtures("BATCH", Decimal("100000.00"), lineCount=2)
+        cls.fund = cls.fixtures["fund"]
+        cls.items = list(Item.objects.filter(line__lineType="Expense").select_related("line"))
+
+    def expenses(self, count, amount, prefix):
+        return [
+            Expense(
+                item=self.items[i % len(self.items)],
+                people=self.fixtures["people"],
+                amount=amount,
+                warrant=1,
+                comment="Batch",
+                ActivityList=self.fixtures["activity"],
+                employee=self.fixtures["employee"],
+                expenseFullID=f"{prefix}-{i}",
+            )
+            for i in range(count)
+        ]
+
+    def test_balances_move_once_per_fund_and_line(self):
+        with CaptureQueriesContext(connection) as queries:
+            posted = Expense.objects.postBatch(self.expenses(200, Decimal("2.50"), "batch"))
+        self.assertEqual(len(posted), 200)
+        self.assertLess(len(queries), 20)
+
+        #Posting the same IDs again changes nothing
+        self.assertEqual(Expense.objects.postBatch(self.expenses(200, Decimal("2.50"), "batch")), [])
+        self.fund.refresh_from_db()
+        self.assertEqual(self.fund.fund_cash_balance, Decimal("99500.00"))
+        for line in Line.objects.filter(lineType="Expense"):
+            self.assertEqual(line.line_budget_spent, Decimal("250.00"))
+
+    def test_deleting_an_expense_gives_the_money_back(self):
+        expense = self.expenses(1, Decimal("40.00"), "delete")[0]
+        expense.save()
+        expense.delete()
+        self.fund.refresh_from_db()
+        self.assertEqual(self.fund.fund_cash_balance, Decimal("100000.00"))
+        self.assertEqual(Line.objects.get(pk=expense.line_id).line_budget_spent, 0)
+
+    def test_batch_is_checked_against_limits_as_a_group(self):
+        #Each expense fits in the 25,000 line budget on its own, together they dont
+        expenses = self.expenses(3, Decimal("15000.00"), "group")
+        expenses[1].item = self.items[0]
+        with self.assertRaises(ValidationError) as caught:
+            Expense.objects.postBatch(expenses)
+        self.assertIn("more than the $25,000.00 remaining in the Line", caught.exception.messages[0])
+        self.assertFalse(Expense.objects.filter(comment="Batch").exists())
+
+    def test_conflicting_insert_rolls_the_whole_batch_back(self):
+        Expense.objects.postBatch(self.expenses(1, Decimal("10.00"), "conflict"))
+        #Something posted the same ID after the duplicate check, the unique index has to stop the batch
+        with mock.patch.object(ExpenseQuerySet, "filter", lambda queryset, **lookups: queryset.none()):
+            with self.assertRaises(IntegrityError):
+                Expense.objects.postBatch(self.expenses(3, Decimal("10.00"), "conflict"))
+        self.fund.refresh_from_db()
+        self.assertEqual(self.fund.fund_cash_balance, Decimal("99990.00"))
+        self.assertEqual(sum(line.line_budget_spent for line in Line.objects.filter(lineType="Expense")), Decimal("10.00"))
+
+
+@override_settings(JOB_WORKER=True)
+class JobRunnerTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="jobs")
+        cls.user.user_permissions.add(Permission.objects.get(codename="has_full_access"))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        temporarySettings(self, "MEDIA_ROOT", "REPORT_CACHE_ROOT")
+
+    def runWorker(self):
+        call_command("runjobs", "--once", stdout=StringIO())
+
+    def test_import_is_queued_then_run_by_the_worker(self):
+        csv = "people_id,name,address,city,state,zip_code,phone,email,primary_contact,ein,account_number\n"
+        csv += ",Queued Vendor,1 Main St,Marietta,OH,45750,740-000-0000,q@example.com,,,\n"
+        response = self.client.post(
+            reverse("imports"),
+            {"table": "People", "file": SimpleUploadedFile("people.csv", csv.encode())},
+        )
+        job = Job.objects.get()
+        self.assertRedirects(response, reverse("jobStatus", args=[job.pk]))
+        self.assertEqual(job.status, "queued")
+        self.assertFalse(People.objects.exists())
+
+        self.runWorker()
+        job.refresh_from_db()
+        self.assertEqual(job.status, "done")
+        self.assertEqual(job.progress, 1)
+        self.assertTrue(People.objects.filter(name="Queued Vendor").exists())
+        self.assertFalse(job.upload)
+
+        #Once finished the partial stops asking htmx to poll
+        partial = self.client.get(reverse("jobStatus", args=[job.pk]), HTTP_HX_REQUEST="true")
+        self.assertNotContains(partial, "hx-trigger")
+        self.assertContains(partial, "Imported 1 rows")
+
+    def test_without_a_worker_the_job_runs_in_the_request(self):
+        csv = "people_id,name,address,city,state,zip_code,phone,email,primary_contact,ein,account_number\n"
+        csv += ",Direct Vendor,1 Main St,Marietta,OH,45750,740-000-0000,d@example.com,,,\n"
+        with override_settings(JOB_WORKER=False):
+            response = self.client.post(
+                reverse("imports"),
+                {"table": "People", "file": SimpleUploadedFile("people.csv", csv.encode())},
+            )
+        job = Job.objects.get()
+        self.assertRedirects(response, reverse("jobStatus", args=[job.pk]))
+        self.assertEqual(job.status, "done")
+        self.assertTrue(People.objects.filter(name="Direct Vendor").exists())
+
+    def test_bad_import_fails_with_its_message(self):
+        response = self.client.post(
+            reverse("imports"),
+            {"table": "People", "file": SimpleUploadedFile("people.csv", b"wrong,columns\n1,2\n")},
+        )
+        self.runWorker()
+        job = Job.objects.get()
+        self.assertEqual(job.status, "failed")
+        self.assertIn("Bad File", job.message)
+
+    def test_imports_can_be_reversed_from_the_history_page(self):
+        fixtures = createFixtures("UNDO", Decimal("100000.00"))
+        expense = Expense(
+            item=fixtures["expenseItem"],
+            people=fixtures["people"],
+            amount=Decimal("10.00"),
+            warrant=1,
+            comment="Imported",
+            ActivityList=fixtures["activity"],
+            employee=fixtures["employee"],
+            expenseFullID="undo-1",
+            importBatch=ImportBatch.objects.create(source="Expense", user=self.user),
+        )
+        expense.save()
+
+        response = self.client.post(reverse("importBatches"), {"batch": expense.importBatch_id})
+        self.assertContains(response, "removed 1 expenses")
+        self.assertContains(response, "Reversed")
+        self.assertFalse(Expense.objects.filter(comment="Imported").exists())
+        fixtures["fund"].refresh_from_db()
+        self.assertEqual(fixtures["fund"].fund_cash_balance, Decimal("100000.00"))
+
+    def test_dry_run_job_returns_a_problem_report(self):
+        csv = "people_id,name,address,city,state,zip_code,phone,email,primary_contact,ein,account_number\n"
+        csv += "abc,Checked Vendor,1 Main St,Marietta,OH,45750,740-000-0000,c@example.com,,,\n"
+        self.client.post(
+            reverse("imports"),
+            {"table": "People", "dryRun": "on", "file": SimpleUploadedFile("people.csv", csv.encode())},
+        )
+        self.runWorker()
+        job = Job.objects.get()
+        self.assertEqual(job.status, "done")
+        self.assertIn("found 1 problems. Nothing was imported.", job.message)
+        self.assertFalse(People.objects.exists())
+
+        partial = self.client.get(reverse("jobStatus", args=[job.pk]), HTTP_HX_REQUEST="true")
+        self.assertContains(partial, "<td>Customer/Vendor</td>")
+        download = self.client.get(reverse("jobDownload", args=[job.pk]))
+        report = b"".join(download.streaming_content).decode()
+        self.assertTrue(report.startswith("Row,Column,Problem"))
+        self.assertIn("2,Customer/Vendor,'abc' is not a valid value", report)
+
+    def test_jobs_left_running_by_a_dead_worker_are_failed(self):
+        stale = Job.objects.create(kind="pdfReport", params={"table": "Dept"}, status="running")
+        Job.objects.filter(pk=stale.pk).update(started=timezone.now() - timedelta(hours=7))
+        running = Job.objects.create(kind="pdfReport", params={"table": "Dept"}, status="running", started=timezone.now())
+        self.assertIsNone(Job.objects.claimNext())
+
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, "failed")
+        self.assertIn("worker stopped", stale.message)
+        self.assertIsNotNone(stale.finished)
+        running.refresh_from_db()
+        self.assertEqual(running.status, "running")
+
+    def test_reports_need_full_access(self):
+        self.client.logout()
+        #handler403 shows the noPrivileges page
+        self.assertTemplateUsed(self.client.get(reverse("generate_pdf", args=["Dept"])), "WCHDApp/noPrivileges.html")
+        self.assertTemplateUsed(self.client.get(reverse("dailyReport")), "WCHDApp/noPrivileges.html")
+        self.assertFalse(Job.objects.exists())
+
+    def test_report_result_can_be_downloaded(self):
+        Dept.objects.create(dept_name="Nursing")
+        self.client.get(reverse("generate_pdf", args=["Dept"]))
+        job = Job.objects.get()
+        polling = self.client.get(reverse("jobStatus", args=[job.pk]))
+        self.assertContains(polling, 'hx-trigger="every 2s"')
+
+        self.runWorker()
+        job.refresh_from_db()
+        self.assertEqual(job.status, "done", job.message)
+        download = self.client.get(reverse("jobDownload", args=[job.pk]))
+        self.assertEqual(b"".join(download.streaming_content)[:4], b"%PDF")
+
+
+class ExportTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixtures = createFixtures("EXPORT", Decimal("100000.00"), expensesPerLine=5)
+        cls.user = User.objects.create(username="exports")
+        cls.user.user_permissions.add(Permission.objects.get(codename="has_full_access"))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        #Each test gets its own report cache, the data versions roll back with the test but the files would not
+        temporarySettings(self, "REPORT_CACHE_ROOT")
+
+    def test_table_is_streamed_in_chunks(self):
+        with mock.patch("WCHDApp.reports.exportChunkSize", 2):
+            response = self.client.post(reverse("exports"), {"table": "Expense", "fileName": "expenses"})
+            self.assertTrue(response.streaming)
+            self.assertEqual(response["Content-Disposition"], 'attachment; filename="expenses.csv"')
+            #The rows are queried while the body streams, a count taken before that would be wrong
+            self.assertFalse(response.has_header("X-Query-Count"))
+            pieces = list(response.streaming_content)
+
+        #Header, two full chunks and the last row
+        self.assertEqual(len(pieces), 4)
+        lines = b"".join(pieces).decode().splitlines()
+        self.assertEqual(lines[0].split(",")[:3], ["id", "item_id", "date"])
+        self.assertEqual(len(lines), 6)
+        self.assertIn(",1.25,", lines[1])
+
+    def export(self, table):
+        response = self.client.post(reverse("exports"), {"table": table, "fileName": table, "computed": "on"})
+        return list(csv.DictReader(StringIO(b"".join(response.streaming_content).decode())))
+
+    def test_calculated_columns_come_from_the_query(self):
+        lines = self.export("Line")
+        remaining = {line["line_id"]: line["budgetRemaining"] for line in lines}
+        self.assertEqual(remaining["2025-EXPORT-EXP0"], str(Line.objects.get(pk="2025-EXPORT-EXP0").budgetRemaining))
+
+        funds = self.export("Fund")
+        fund = Fund.objects.get(pk="2025-EXPORT")
+        self.assertEqual(funds[0]["calcRemaining"], str(fund.calcRemaining))
+        self.assertEqual(funds[0]["budgeted"], str(fund.budgeted))
+
+        #One query for the whole export however many rows there are
+        with CaptureQueriesContext(connection) as queries:
+            list(tableCsv(Line, computed=True))
+        self.assertEqual(len(queries), 1)
+
+    def test_plar_rounds_only_the_result(self):
+        #Rounding 0.125 years to 0.13 first would give 0.01
+        self.assertEqual(Benefits(employee=Employee(yos=0.125)).plar, Decimal("0.00"))
+        self.assertEqual(Benefits(employee=Employee(yos=20)).plar, Decimal("1.55"))
+
+    def test_benefits_figures_cost_no_query_per_row(self):
+        Variable.objects.create(name="insuranceRate1", value=Decimal("12.00"))
+        employee = self.fixtures["employee"]
+        for hours in ("40", "60", "80"):
+            Benefits.objects.create(
+                employee=employee, hrs_per_pay=hours, vac_elig=True, ins_type="Single",
+                board_ins_share=Decimal("500.00"), life_rate="Rate 1",
+            )
+        rows = self.export("Benefits")
+        self.assertEqual(len(rows), 3)
+        benefit = Benefits.objects.order_by("pk").first()
+        for name in ("life_hourly", "holiday", "total_comp"):
+            self.assertEqual(rows[0][name], str(getattr(benefit, name)))
+
+        #The rows with their employees, then the insurance rates once
+        with CaptureQueriesContext(connection) as queries:
+            list(tableCsv(Benefits, computed=True))
+        self.assertEqual(len(queries), 2)
+
+    def test_county_payroll_totals_hours_by_employee_and_paycode(self):
+        period = PayPeriod.objects.create(payperiod_id="2025-01", periodStart=date(2025, 1, 1), periodEnd=date(2025, 1, 14))
+        regular = self.fixtures["activity"]
+        sick = ActivityList.objects.create(
+            program="Sick Leave", dept=regular.dept, fund=regular.fund, item=regular.item, fphs="Admin", payType="general"
+        )
+        second = Employee.objects.create(
+            employee_id=2, first_name="Second", surname="Employee", hire_date=date(2020, 1, 1), yos=1,
+            job_title="Nurse", pay_rate=Decimal("25.00"), adminPayFund=regular.fund,
+            payItem=regular.item, specialPayItem=regular.item, specialFund=regular.fund, user=self.user,
+        )
+        for employee, activity, hours in [
+            (self.fixtures["employee"], regular, "4.00"),
+            (self.fixtures["employee"], regular, "3.50"),
+            (self.fixtures["employee"], sick, "8.00"),
+            (second, regular, "10.00"),
+        ]:
+            Payroll.objects.create(
+                beg_date=date(2025, 1, 6), end_date=date(2025, 1, 6), employee=employee, ActivityList=activity,
+                hours=Decimal(hours), pay_amount=Decimal("0"), payperiod=period,
+            )
+
+        with CaptureQueriesContext(connection) as queries:
+            rows = countyPayrollRows(period.pk)
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(
+            [(row["JobNumber"], row["Paycode"], row["Hours"], row["AccountDistribution"]) for row in rows],
+            [
+                (1, "R-REGULAR PA", Decimal("7.50"), "EXPORT50290EXP0"),
+                (2, "R-REGULAR PA", Decimal("10.00"), "EXPORT50290EXP0"),
+                (1, "S-SICK", Decimal("8.00"), "EXPORT50290EXP0"),
+            ],
+        )
+
+        response = self.client.post(reverse("countyPayrollExport"), {"payPeriod": period.pk, "fileName": "county"})
+        lines = response.content.decode().splitlines()
+        self.assertEqual(lines[0], "JobNumber,Paycode,Time Group/Description,Hours,HourlyRate,Salary,AccountDistribution")
+        self.assertEqual(lines[1], "1,R-REGULAR PA,,7.50,20.00,,EXPORT50290EXP0")
+
+    def test_pdf_report_pages_and_totals(self):
+        Dept.objects.bulk_create([Dept(dept_name=f"Dept {i}") for i in range(120)])
+        pdf = tablePdf("Dept")
+        self.assertTrue(pdf.startswith(b"%PDF"))
+        #The header row and 48 rows fit a page, so the 121 departments take three
+        self.assertEqual(len(re.findall(rb"/Type /Page\b", pdf)), 3)
+
+        self.assertEqual(pdfTotals(Expense), ["<b>Rows:</b> 5", "<b>Total Amount:</b> $6.25"])
+        widths = {attname: width for attname, label, width in pdfColumns(Expense)}
+        self.assertGreater(widths["comment"], widths["date"])
+
+    def test_unchanged_export_comes_from_the_cache(self):
+        first = self.export("Expense")
+        with mock.patch("WCHDApp.views.tableCsv") as tableCsvMock:
+            response = self.client.post(reverse("exports"), {"table": "Expense", "fileName": "cached", "computed": "on"})
+            self.assertEqual(response["Content-Disposition"], 'attachment; filename="cached.csv"')
+            cached = list(csv.DictReader(StringIO(b"".join(response.streaming_content).decode())))
+        tableCsvMock.assert_not_called()
+        self.assertEqual(cached, first)
+
+    def test_saving_a_source_table_invalidates_the_cache(self):
+        self.export("Expense")
+        expenses = list(Expense.objects.order_by("pk")[:2])
+        for expense in expenses:
+            expense.comment = "Changed"
+            expense.save()
+        #One stamp callback waits for the test transaction (opened before the fixtures) however many rows were saved
+        self.assertEqual(sum(callback[1] is saveDataVersions for callback in connection.run_on_commit), 1)
+        #The test transaction never commits, so the stamps are saved the way the commit would
+        saveDataVersions()
+        #Stamped once per transaction, not once per row
+        self.assertEqual(DataVersion.objects.get(table="Expense").version, 1)
+
+        rows = self.export("Expense")
+        self.assertEqual(rows[0]["comment"], "Changed")
+        #The new copy replaced the old one
+        self.assertEqual(len(os.listdir(settings.REPORT_CACHE_ROOT)), 1)
+
+        #Bulk writes stamp their table without signals
+        Expense.objects.filter(pk=expenses[0].pk)._raw_delete(connection.alias)
+        markChanged("Expense")
+        saveDataVersions()
+        self.assertEqual(len(self.export("Expense")), len(rows) - 1)
+
+    def test_a_new_day_replaces_the_cached_pdf(self):
+        with mock.patch("WCHDApp.reportcache.timezone.localdate", return_value=date(2025, 1, 1)):
+            cachedBytes(tablePdfPath("Dept"), lambda: b"yesterday")
+        path = tablePdfPath("Dept")
+        self.assertEqual(cachedBytes(path, lambda: b"today"), b"today")
+        self.assertEqual(os.listdir(settings.REPORT_CACHE_ROOT), [os.path.basename(path)])
+
+    def test_pdf_and_county_payroll_are_cached(self):
+        path = tablePdfPath("Dept")
+        self.assertFalse(os.path.exists(path))
+        Job.objects.create(kind="pdfReport", params={"table": "Dept"}, user=self.user)
+        with override_settings(MEDIA_ROOT=temporaryFolder(self)):
+            call_command("runjobs", "--once", stdout=StringIO())
+            self.assertTrue(os.path.exists(path))
+            #The next click is answered with the saved copy instead of queueing another job
+            response = self.client.get(reverse("generate_pdf", args=["Dept"]))
+        self.assertEqual(b"".join(response.streaming_content)[:4], b"%PDF")
+        self.assertEqual(Job.objects.count(), 1)
+
+        period = PayPeriod.objects.create(payperiod_id="2025-02", periodStart=date(2025, 1, 15), periodEnd=date(2025, 1, 28))
+        self.client.post(reverse("countyPayrollExport"), {"payPeriod": period.pk, "fileName": "county"})
+        with mock.patch("WCHDApp.views.countyPayrollRows") as rowsMock:
+            response = self.client.post(reverse("countyPayrollExport"), {"payPeriod": period.pk, "fileName": "county"})
+        rowsMock.assert_not_called()
+        self.assertTrue(response.content.startswith(b"JobNumber,Paycode"))
+
+    def test_daily_activity_totals_come_from_grouped_queries(self):
+        for payType, amount in [("Cash", "10.00"), ("Card", "2.50"), ("Cash", "5.00")]:
+            Revenue(
+                item=self.fixtures["revenueItem"], people=self.fixtures["people"], amount=Decimal(amount),
+                payType=payType, reference=1, comment="Daily", ActivityList=self.fixtures["activity"],
+                employee=self.fixtures["employee"],
+            ).save()
+        #Yesterday's expense is left out
+        Expense.objects.filter(pk=Expense.objects.order_by("pk").first().pk).update(date=date(2000, 1, 1))
+
+        with CaptureQueriesContext(connection) as queries:
+            activity = dailyActivity()
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(activity["expenseCount"], 4)
+        self.assertEqual(activity["expenseTotal"], Decimal("5.00"))
+        self.assertEqual(activity["revenueTotal"], Decimal("17.50"))
+        self.assertEqual(activity["byPayType"], {"Cash": Decimal("15.00"), "Card": Decimal("2.50")})
+        self.assertEqual(activity["byFund"]["2025-EXPORT"], {"expense": Decimal("5.00"), "revenue": Decimal("17.50")})
+        self.assertEqual(activity["byLine"]["2025-EXPORT-EXP0"]["expense"], Decimal("5.00"))
+
+        response = self.client.get(reverse("dailyReport"))
+        self.assertEqual(response.content[:4], b"%PDF")
+        dashboard = self.client.get(reverse("index"))
+        self.assertContains(dashboard, "$17.50</span> (3 entries)")
+
+    def test_nightly_report_set_is_listed_and_served(self):
+        with override_settings(PREBUILT_REPORTS_ROOT=temporaryFolder(self)):
+            os.makedirs(os.path.join(settings.PREBUILT_REPORTS_ROOT, "2025-01-01"))
+            output = StringIO()
+            with self.assertLogs("WCHDApp.management.commands.build_reports", "INFO") as logs:
+                call_command("build_reports", "--keep", "1", stdout=output)
+            self.assertIn("Built 4 reports", output.getvalue())
+            today = timezone.localdate().isoformat()
+            self.assertTrue(any(f"Built Fund Summary for {today} in" in line for line in logs.output))
+            #Only the newest day is kept
+            self.assertEqual(os.listdir(settings.PREBUILT_REPORTS_ROOT), [today])
+
+            page = self.client.get(reverse("reports"))
+            self.assertContains(page, reverse("prebuiltReport", args=[today, "payrollByPeriod"]))
+            response = self.client.get(reverse("prebuiltReport", args=[today, "fundSummary"]))
+            self.assertEqual(b"".join(response.streaming_content)[:4], b"%PDF")
+
+            #The summaries only show today's balances, an earlier day just gets its daily transactions
+            output = StringIO()
+            call_command("build_reports", "--date", "2025-01-15", stdout=output)
+            self.assertIn("Built 1 reports", output.getvalue())
+            self.assertEqual(os.listdir(prebuiltFolder(date(2025, 1, 15))), ["dailyTransactions.pdf"])
+            self.assertEqual(self.client.get(reverse("prebuiltReport", args=["2025-01-15", "..%2Fsecret"])).status_code, 404)
+            self.assertEqual(self.client.get(reverse("prebuiltReport", args=["2025-13-40", "fundSummary"])).status_code, 404)
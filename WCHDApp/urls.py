@@ -11,6 +11,7 @@ urlpatterns = [
     path("testing/", views.testing, name="testing"),
     path('generate_pdf/<str:tableName>/', views.generate_pdf, name='generate_pdf'),
     path('reports/', views.reports, name='reports'),
+    path('reports/<str:day>/<str:name>/', views.prebuiltReport, name='prebuiltReport'),
     path('imports/', views.imports, name='imports'),
     path('exports/', views.exports, name='exports'),
     path('countyPayrollExport/', views.countyPayrollExport, name='countyPayrollExport'),
@@ -18,6 +19,9 @@ urlpatterns = [
     path('transactionsView/', views.transactionsView, name='transactionsView'),
     path('noPrivileges/', views.noPrivileges, name='noPrivileges'),
     path('reconcile/', views.reconcile, name='reconcile'),
+    path('importBatches/', views.importBatches, name='importBatches'),
+    path('jobs/<int:jobID>/', views.jobStatus, name='jobStatus'),
+    path('jobs/<int:jobID>/download/', views.jobDownload, name='jobDownload'),
     path('dailyReport/', views.dailyReport, name='dailyReport'),
     path('logout/', LogoutView.as_view(next_page='/'), name='logout'),
     path('calculateActivitySelect/', views.calculateActivitySelect, name='calculateActivitySelect'),
@@ -1,205 +1,90 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import HttpResponse, JsonResponse
-from .models import Fund, Testing, Item, Grant, GrantLine, Revenue, Expense, Line, People
+from django.http import HttpResponse, JsonResponse, FileResponse, Http404, StreamingHttpResponse
+from .models import Fund, Testing, Item, Grant, GrantLine, Revenue, Expense, Line, People, Job, ImportBatch
 from django.db.models.fields.related import ForeignKey, ManyToManyField, OneToOneField
 from .forms import TableSelect, InputSelect, ExportSelect,reconcileForm, FileInput
 from django.forms import modelform_factory, Select
 from django import forms
 from django.apps import apps
-from django.db.models import DecimalField, AutoField
+from django.db.models import DecimalField, AutoField, Sum
 from django.db import models, transaction
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.decorators import permission_required
 from django.contrib import messages
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle
-from io import BytesIO
+from io import BytesIO, StringIO
 import pandas as pd
-from openpyxl import load_workbook
-from openpyxl.styles import PatternFill
 import numpy as np
 from datetime import datetime
+from decimal import Decimal
 import json
 from django.shortcuts import render
 from django.urls import reverse
-from django.utils.timezone import now
-from django.utils.dateparse import parse_datetime
+from django.utils.timezone import now, localdate
+from django.utils.dateparse import parse_datetime, parse_date
 from django.core.exceptions import ValidationError
+from .money import sumColumn, toMoney
+from .reports import tableCsv, calculatedProperties, countyPayrollRows, countyPayrollColumns, dailyActivity, dailyPdf
+from .jobs import queueJob
+from .reportcache import reportPath, tablePdfPath, exportSources, countyPayrollSources, dailySources, cachedFile, cachedBytes, savedStream, prebuiltReports, prebuiltFile
 import re
+import os
+import csv
 
+#Reports are built by the job worker (manage.py runjobs), this queues one and sends the user to its status page
+#If nothing in the table changed since the last one was built today the saved copy is sent straight away
+@permission_required('WCHDApp.has_full_access', raise_exception=True)
 def generate_pdf(request, tableName):
-    buffer = BytesIO()
-
-    # Create a PDF
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    elements = []
-    styles = getSampleStyleSheet()
-
-
-    title_style = ParagraphStyle(
-        "TitleStyle",
-        parent=styles["Title"],
-        fontSize=16,
-        spaceAfter=11,
-        fontName="Helvetica-Bold"
-    )
-
-    subtitle_style = ParagraphStyle(
-        "SubtitleStyle",
-        parent=styles["Normal"],
-        fontSize=11,
-        textColor=colors.black,
-        spaceAfter=6,
-        fontName="Helvetica-Oblique"
-    )
-
-
-    #logo = Image("logo.png", width=80, height=80)
-    #logo.hAlign = 'LEFT'
-    #elements.append(logo)
-
-    elements.append(Spacer(1, 12))
-
-    # Report Title
-    elements.append(Paragraph("Washington County Health Department", title_style))
-    elements.append(Paragraph(
-        "List of Active Grants. Active means they have been awarded and the final expenditure report has not yet been approved.",
-        subtitle_style
-    ))
-
-    elements.append(Spacer(1, 12))
-
-    #Same logic as tableView, needs updated to current 
-    model = apps.get_model('WCHDApp', tableName)
-    values = model.objects.all().values()
-    fields = model._meta.get_fields()
-    fieldNames = []
-    decimalFields = []
-    aliasNames = []
-    for field in fields:
-        if field.is_relation:
-            if field.auto_created:
-                continue
-            else:
-                parentModel = apps.get_model('WCHDApp', field.name)
-                fkName = parentModel._meta.pk.name
-                fkAlias = parentModel._meta.pk.verbose_name
-                aliasNames.append(fkAlias)
-                fieldNames.append(fkName)
-
-        else:
-            if isinstance(field, DecimalField):
-                decimalFields.append(field.name)
-            aliasNames.append(field.verbose_name)  
-            fieldNames.append(field.name)
-
-    data = [
-        aliasNames,
-    ]
-    
-    for row in values:
-        print(row)
-        line = []
-        for field in fieldNames:
-            line.append(row[field])
-        data.append(line)
-
-
-    # Table Styling
-    table = Table(data, colWidths=[80, 70, 70, 70, 70, 50, 100, 50, 90, 40])
-    table.setStyle(TableStyle([
-        ("BACKGROUND", (0, 0), (-1, 0), colors.darkgray),
-        ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
-        ("ALIGN", (0, 0), (-1, -1), "CENTER"),
-        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-        ("BOTTOMPADDING", (0, 0), (-1, 0), 5),
-        ("BACKGROUND", (0, 1), (-1, -1), colors.whitesmoke),
-        ("GRID", (0, 0), (-1, -1), 1, colors.black),
-        ("FONTSIZE", (0, 0), (-1, -1), 10),
-        ("TOPPADDING", (0, 0), (-1, 0), 10),
-    ]))
-
-    elements.append(table)
-
-    # Totals (below table)
-    elements.append(Spacer(1, 12))
-    elements.append(Paragraph("<b>Total Active Grants:</b> $571,880.00", styles["Normal"]))
-    elements.append(Paragraph("<b>Total Amount for Project:</b> $19,144.00", styles["Normal"]))
-
-    #Build PDF
-    doc.build(elements)
-
-    # Get the PDF value from buffer
-    buffer.seek(0)
-    pdf_data = buffer.getvalue()
-    buffer.close()
-
-    response = HttpResponse(pdf_data, content_type='application/pdf')
-    response['Content-Disposition'] = f'inline; filename="testing.pdf"'
-
-    return response
+    path = cachedFile(tablePdfPath(tableName))
+    if path:
+        return FileResponse(open(path, "rb"), as_attachment=True, filename=f"{tableName}.pdf")
+    job = queueJob(kind="pdfReport", params={"table": tableName}, user=request.user)
+    return redirect('jobStatus', job.pk)
 
 @permission_required('WCHDApp.has_full_access', raise_exception=True)
 def reconcile(request):
     if request.method == "POST":
         form = reconcileForm(request.POST, request.FILES)
         if form.is_valid():
-            firstFile = form.cleaned_data['firstFile'] 
-            secondFile = form.cleaned_data['secondFile'] 
-            
-            df1 = pd.read_csv(firstFile)
-            df2 = pd.read_csv(secondFile)
-
-            columnList = list(df1.columns)
-            for i in range(len(columnList)):
-                columnList[i] = columnList[i].strip()
-            # Merge the two lists and remove duplicates
-            merged_df = pd.concat([df1, df2]).drop_duplicates()
-
-            # Identify common entries (entries in both list1 and list2)
-            common_entries = df1.merge(df2, on=columnList, how="inner")
-
-            # Save merged data to an Excel file
-            output_file = "output.xlsx"
-            merged_df.to_excel(output_file, index=False)
-
-            # Load the saved Excel file for formatting
-            wb = load_workbook(output_file)
-            ws = wb.active
-
-            # Define highlight style
-            highlight_fill = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
-
-            # Convert common entries into a set for fast lookup
-            rows = common_entries[columnList].apply(tuple, axis=1)
-            common_set = set(rows)
-            print(common_set)
-
-            # Apply highlighting to rows that are NOT common (i.e., unique to either list1 or list2)
-            for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=1):
-                rowData = []
-                for column in row:
-                    rowData.append(column.value)
-                rowTuple = tuple(rowData)
-                print(rowTuple)
-                if rowTuple not in common_set:  # Highlight unique entries only
-                    for cell in row:
-                        cell.fill = highlight_fill
-            
-            #Saveing to stream in file attachment format
-            outputStream = BytesIO()
-            wb.save(outputStream)
-            outputStream.seek(0)
-            response = HttpResponse(outputStream.getvalue(),content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-            response['Content-Disposition'] = f'attachment; filename="reconciliation.xlsx"'
-
-            return response
+            job = queueJob(
+                kind="reconcile",
+                upload=form.cleaned_data['firstFile'],
+                secondUpload=form.cleaned_data['secondFile'],
+                user=request.user,
+            )
+            return redirect('jobStatus', job.pk)
     else:
         form = reconcileForm()
     return render(request, "WCHDApp/reconcile.html", {"form":form})
 
+#Status page for a queued job. The partial is what htmx polls every few seconds until the job is finished
+@permission_required('WCHDApp.has_full_access', raise_exception=True)
+def jobStatus(request, jobID):
+    job = get_object_or_404(Job, pk=jobID)
+    if request.headers.get("HX-Request"):
+        return render(request, "WCHDApp/partials/jobStatusPartial.html", {"job": job})
+    return render(request, "WCHDApp/jobStatus.html", {"job": job})
+
+@permission_required('WCHDApp.has_full_access', raise_exception=True)
+def jobDownload(request, jobID):
+    job = get_object_or_404(Job, pk=jobID)
+    if not job.result:
+        raise Http404("This job has no file")
+    return FileResponse(job.result.open("rb"), as_attachment=True, filename=os.path.basename(job.result.name))
+
+#Recent imports with a button to undo each one, for when a payroll was posted to the wrong period
+@permission_required('WCHDApp.has_full_access', raise_exception=True)
+def importBatches(request):
+    message = ""
+    if request.method == "POST":
+        batch = get_object_or_404(ImportBatch, pk=request.POST.get("batch"))
+        try:
+            deleted = batch.reverse(request.user)
+            message = f"Reversed {batch}: removed {deleted['expenses']} expenses, {deleted['revenues']} revenues and {deleted['payrolls']} payroll lines."
+        except ValidationError as e:
+            message = " ".join(e.messages)
+    batches = ImportBatch.objects.select_related("user", "reversedBy").order_by("-created")[:50]
+    return render(request, "WCHDApp/importBatches.html", {"batches": batches, "message": message})
+
 #This view is used to select what table we want to create a report from
 @permission_required('WCHDApp.has_full_access', raise_exception=True)
 def reports(request):
@@ -217,7 +102,19 @@ def reports(request):
                 return redirect('generate_pdf', tableName)
     else:
         form = TableSelect()
-    return render(request, "WCHDApp/reports.html", {'form': form})
+    #The nightly set from manage.py build_reports, served as files so nothing is built while the office is busy
+    return render(request, "WCHDApp/reports.html", {'form': form, "prebuilt": prebuiltReports()})
+
+@permission_required('WCHDApp.has_full_access', raise_exception=True)
+def prebuiltReport(request, day, name):
+    try:
+        day = parse_date(day)
+    except ValueError:
+        day = None
+    path = prebuiltFile(day, name) if day else None
+    if not path:
+        raise Http404("That report was not built")
+    return FileResponse(open(path, "rb"), filename=f"{name}-{day:%Y-%m-%d}.pdf", content_type='application/pdf')
 
 def index(request):
     # Set session start time if it's not already set
@@ -228,19 +125,8 @@ def index(request):
     session_start_str = request.session.get('session_start_time')
     duration_display = "0h 0m 0s"  # Default
 
-    todayDate = datetime.today()
-
-    #For displaying totals for the day
-    expenses = Expense.objects.filter(date=todayDate)
-    revenues = Revenue.objects.filter(date=todayDate)
-
-    expenseTotal = 0
-    revenueTotal = 0
-    for expense in expenses:
-        expenseTotal += expense.amount
-
-    for revenue in revenues:
-        revenueTotal += revenue.amount
+    #For displaying totals for the day, two grouped queries see reports.dailyActivity
+    activity = dailyActivity()
 
     if session_start_str:
         session_start = parse_datetime(session_start_str)
@@ -254,8 +140,10 @@ def index(request):
     
     context ={
         'duration': duration_display,
-        "revenueTotal": revenueTotal,
-        "expenseTotal": expenseTotal
+        "revenueTotal": activity["revenueTotal"],
+        "expenseTotal": activity["expenseTotal"],
+        "revenueCount": activity["revenueCount"],
+        "expenseCount": activity["expenseCount"],
     }
 
     # Pass formatted string to template
@@ -319,6 +207,10 @@ def viewTableSelect(request):
         form = TableSelect()
     return render(request, "WCHDApp/viewTableSelect.html", {'form': form})
 
+#Joins every foreign key shown as a column so rendering a row doesnt run a query per cell
+def withRelated(queryset, fields):
+    return queryset.select_related(*[field.name for field in fields if field.is_relation])
+
 #This function decides what data we use in our tables in tableView.html
 @permission_required('WCHDApp.has_full_access', raise_exception=True)
 def tableView(request, tableName):
@@ -327,21 +219,22 @@ def tableView(request, tableName):
     model = apps.get_model('WCHDApp', tableName)
 
     #Getting data from that model
-    values = model.objects.all()
+    #Lines get their spent/income/remaining totals from one annotated query instead of 2 queries per row
+    if tableName == "Line":
+        values = model.objects.with_rollups()
+    elif tableName == "Fund":
+        values = model.objects.with_budget_totals()
+    elif tableName == "Grant":
+        values = model.objects.with_stats()
+    else:
+        values = model.objects.all()
 
     #Getting just field names from model
     #Use .fields instead of .get_fields() because we do not want reverse relationships
     fields = model._meta.fields
+    values = withRelated(values, fields)
 
-    #Any property that we define in models need to go here so our logic can include them in the table
-    calculatedProperties = {
-        "Testing": [("fundBalanceMinus3", "Fund Balance Minus 3")],
-        "Benefits": [("pers", "Public Employee Retirement System"), ("medicare", "Medicare"),("wc", "Workers Comp"), ("plar", "Paid Leave Accumulation Rate"), ("vacation", "Vacation"), ("sick", "Sick Leave"), ("holiday", "Holiday Leave"), ("total_hrly", "Total Hourly Cost"), ("percent_leave", "Percent Leave"), ("monthly_hours", "Monthly Hours"), ("board_share_hrly", "Board Share Hourly"), ("life_hourly", "Life Hourly"), ("salary", "Salary"), ("fringes", "Fringes"), ("total_comp", "Total Compensation")],
-        "Payroll": [("pay_rate", "Pay Rate")],
-        "Fund":[("calcRemaining", "Remaining"), ("budgeted", "Budgeted")],
-        "GrantLine": [("budgetRemaining", "Budget Remaining"), ("budgetSpent", "Budget Spent"), ("totalIncome", "Total Income")],
-        "Grant": [("grantAwardAmountRemaining", "Grant Award Amount Remaining"),( "recieved","Recieved")]
-    }
+    #Any property that we define in models goes in calculatedProperties (reports.py) so our logic can include them in the table
 
     #This is used to decide which fields we want to show in the accumulator based on each model
     summedFields = {
@@ -370,9 +263,7 @@ def tableView(request, tableName):
     #Getting values based on if we defined them in summedFields in order to make accumulator
     if tableName in summedFields:
         field = summedFields[tableName]
-        accumulator = 0
-        for value in values:
-            accumulator += getattr(value, field)
+        accumulator = sumColumn(values, field)
         context = {"fields": fieldNames, "aliasNames": aliasNames, "data": values, "tableName": tableName, "decimalFields": decimalFields, "accumulator": accumulator}
     else:
         context = {"fields": fieldNames, "aliasNames": aliasNames, "data": values, "tableName": tableName, "decimalFields": decimalFields}
@@ -421,78 +312,14 @@ def imports(request):
             tableName = form.cleaned_data['table']
             if tableName == 'Payroll':
                 return redirect('clockifyImportPayroll')
-            selectedFile = form.cleaned_data['file']
-            file = pd.read_csv(selectedFile)
-            columns = file.columns
-            row = file.iloc[0]
-            data = []
-
-            #Grab slected model
-            model = apps.get_model('WCHDApp', tableName)
-            fields = model._meta.get_fields()
-
-            #Define what fields we want to look at from the file and model
-            neededFields = []
-            for field in fields:
-                if field.is_relation:
-                        #fks.append(field.name)
-                        if field.auto_created:
-                            continue
-                        else:
-                            #Grab related model. This is why foreign keys have to be named after the model 
-                            parentModel = apps.get_model('WCHDApp', field.name)
-
-                            #Get the related models primary key
-                            fkName = parentModel._meta.pk.name
-                            neededFields.append(fkName)
-                else:
-                    neededFields.append(field.name)
-            if neededFields != list(columns):
-                message = "Bad File. Please check your CSV format and try again."
-                return render(request, "WCHDApp/imports.html", {"form": form, "message": message})
-            lookUpFields = []
-            fks = []
-            #Same logic as above just for lookups and fk
-            for field in fields:
-                #Logic for foreign keys
-                if field.is_relation:
-                    fks.append(field.name)
-                    if field.auto_created:
-                        continue
-                    else:
-                        #Grab related model. This is why foreign keys have to be named after the model 
-                        parentModel = apps.get_model('WCHDApp', field.name)
-
-                        #Get the related models primary key
-                        fkName = parentModel._meta.pk.name
-                        #fks.append(fkName)
-                        #Primary keys verbose name
-                        fkAlias = parentModel._meta.pk.verbose_name
-                else:
-                    lookUpFields.append(field)
-            
-            #Creating a dictionary for each row in the file
-            for i in range(len(file)):
-                dict = {}
-                row = file.iloc[i]
-                for column in columns:
-                    dict[column] = row[column]
-                data.append(dict)
-                
-            #For each entry in the dictionary convert types and then create an object based on the dict
-            for line in data:
-                for key in line:
-                    if type(line[key]) == np.int64:
-                        line[key] = int(line[key])
-                    if key in fks:
-                        parentModel = apps.get_model('WCHDApp', key)
-                        print("Grab the object linked")
-                        line[key] = parentModel.objects.get(pk=line[key])
-                print(line)
-                obj, _ = model.objects.update_or_create(
-                    **line,
-                    defaults = line
-                )    
+            #The import itself runs in the job worker so big files dont tie up the web server
+            job = queueJob(
+                kind="tableImport",
+                params={"table": tableName, "dryRun": form.cleaned_data['dryRun']},
+                upload=form.cleaned_data['file'],
+                user=request.user,
+            )
+            return redirect('jobStatus', job.pk)
     else:
         form = InputSelect()
     
@@ -510,17 +337,20 @@ def exports(request):
             fileName = form.cleaned_data['fileName']
             
             model = apps.get_model('WCHDApp', tableName)
-            data = model.objects.all().values()
-            exportData = pd.DataFrame.from_records(data)
+            computed = form.cleaned_data['computed']
+
+            #An export of unchanged tables is sent from the copy saved the last time
+            path = reportPath("export", {"table": tableName, "computed": computed}, exportSources(tableName, computed), "csv")
+            if cachedFile(path):
+                return FileResponse(open(path, "rb"), as_attachment=True, filename=f"{fileName}.csv", content_type='text/csv')
 
+            #Streamed straight from the database cursor so big tables like Expense and Payroll dont have to fit in memory
             #From what I read the 2 commented lines are how we can show it in a new tab before download
             #However, its raw text apparently browsers dont like not immediately downloading csv, could be useful for our reports though
-            response = HttpResponse(content_type='text/csv')
+            response = StreamingHttpResponse(savedStream(path, tableCsv(model, computed)), content_type='text/csv')
             #response = HttpResponse(content_type='text/text')
             #response['Content-Disposition'] = f'inline; filename="{fileName}.csv"'
             response['Content-Disposition'] = f'attachment; filename="{fileName}.csv"'
-
-            exportData.to_csv(path_or_buf=response, index=False)
             return response
     else:
         form = ExportSelect()
@@ -536,74 +366,17 @@ def countyPayrollExport(request):
         payperiod = request.POST.get('payPeriod')
         fileName = request.POST.get('fileName')
 
-        payrollModel = apps.get_model('WCHDApp', "Payroll")
-        entries = payrollModel.objects.select_related('employee', "ActivityList").filter(payperiod__payperiod_id = payperiod)
-
-        #Values for mapping codes later in code
-        employeeHoursByActivity = {}
-        codeMappings = {
-            "SICK": "S",
-            "COMP": "C",
-            "VAC": "V",
-            "HOLIDAY": "H"
-        }
-
-        secondaryMapping = {
-            "S": "S-SICK",
-            "C":  "C-COMPTIME",
-            "V": "V-VACATION",
-            "H": "H-HOLIDAY",
-            "R": "R-REGULAR PA"
-        }
+        #Hours totalled per employee and paycode by the database, see reports.countyPayrollRows
+        def buildCsv():
+            stream = StringIO()
+            writer = csv.DictWriter(stream, fieldnames=countyPayrollColumns)
+            writer.writeheader()
+            writer.writerows(countyPayrollRows(payperiod))
+            return stream.getvalue().encode()
 
-        for entry in entries:
-            activityName = entry.ActivityList.program.upper()
-            #If the Activity contains a word that is present in codeMapping aka "SICK" it sets the paycode to the abbreviation
-            for keyword, code in codeMappings.items():
-                if keyword in activityName:
-                    paycode = code
-                    break
-                else:
-                    paycode = "R"
-            #Reverting back to a full name
-            paycodeName = secondaryMapping[paycode]
-
-            #Creating a dictionary that holds employees hours with paycodes as keys to make running totals
-            if paycodeName not in employeeHoursByActivity:
-                employeeHoursByActivity[paycodeName] = {}
-
-            if entry.employee in employeeHoursByActivity[paycodeName]:
-                employeeHoursByActivity[paycodeName][entry.employee] += entry.hours
-            else:
-                employeeHoursByActivity[paycodeName][entry.employee] = entry.hours
-
-        #Creating the csv export
-        exportData = []
-        for activity, employeeDict in employeeHoursByActivity.items():
-            for employee, hours in employeeDict.items():
-                line = employee.payItem.line
-                fullID = line.line_id
-                splitID = fullID.split("-")
-                if len(splitID)==3:
-                    year, fundID, lineID = splitID[0], splitID[1], splitID[2]
-                else:
-                    fundID, lineID = splitID[0], splitID[1]
-                
-                accountDistribution = f"{fundID}50290{lineID}"
-                exportData.append({
-                    "JobNumber": employee.employee_id,
-                    "Paycode": activity,
-                    "Time Group/Description": "",
-                    "Hours": hours,
-                    "HourlyRate": employee.pay_rate,
-                    "Salary": "",
-                    "AccountDistribution": accountDistribution
-                })
-        exportData = pd.DataFrame(exportData)
-        response = HttpResponse(content_type='text/csv')
+        path = reportPath("countyPayroll", {"payperiod": payperiod}, countyPayrollSources, "csv")
+        response = HttpResponse(cachedBytes(path, buildCsv), content_type='text/csv')
         response['Content-Disposition'] = f'attachment; filename="{fileName}.csv"'
-        exportData.to_csv(path_or_buf=response, index=False)
-
         return response
 
     context = {
@@ -812,7 +585,7 @@ def transactionsExpenseTableUpdate(request):
 
 @permission_required('WCHDApp.has_full_access', raise_exception=True)
 def lineView(request):
-    funds = Fund.objects.all()
+    funds = Fund.objects.with_budget_totals()
     
     context = {
         "funds": funds
@@ -825,10 +598,11 @@ def lineTableUpdate(request):
     fund = Fund.objects.get(pk=fundID)
     
     Line = apps.get_model('WCHDApp', "line")
-    lines = Line.objects.filter(fund=fund)
+    lines = Line.objects.with_rollups().filter(fund=fund)
 
     #Getting just field names from model
     fields = Line._meta.fields
+    lines = withRelated(lines, fields)
 
     #Lists to sort fields for styling
     fieldNames = []
@@ -840,7 +614,7 @@ def lineTableUpdate(request):
         "Benefits": [("pers", "Public Employee Retirement System"), ("medicare", "Medicare"),("wc", "Workers Comp"), ("plar", "Paid Leave Accumulation Rate"), ("vacation", "Vacation"), ("sick", "Sick Leave"), ("holiday", "Holiday Leave"), ("total_hrly", "Total Hourly Cost"), ("percent_leave", "Percent Leave"), ("monthly_hours", "Monthly Hours"), ("board_share_hrly", "Board Share Hourly"), ("life_hourly", "Life Hourly"), ("salary", "Salary"), ("fringes", "Fringes"), ("total_comp", "Total Compensation")],
         "Payroll": [("pay_rate", "Pay Rate")],
         "Fund":[("calcRemaining", "Remaining"), ("budgeted", "Budgeted")],
-        "Line": [("budgetRemaining", "Budget Remaining"), ("budgetSpent", "Budget Spent"), ("totalIncome", "Total Income")]
+        "Line": [("budgetRemaining", "Budget Remaining")]
     }
 
     #Fields that should be accumulated
@@ -889,14 +663,15 @@ def lineTableUpdate(request):
         "form": form,
         "fund": fund,
         "message": message,
-        "remainingToBudget": fund.totalAvailable
+        #Loaded after the form is handled so a line created in this request is counted
+        "remainingToBudget": Fund.objects.with_budget_totals().get(pk=fundID).totalAvailable
     }
 
     return render(request, "WCHDApp/partials/lineTableUpdate.html", context)
 
 @permission_required('WCHDApp.has_full_access', raise_exception=True)
 def itemView(request):
-    lines = Line.objects.all()
+    lines = Line.objects.with_rollups()
     context = {
         "lines": lines,
     }
@@ -911,6 +686,7 @@ def itemTableUpdate(request):
 
     #Getting just field names from model
     fields = Item._meta.fields
+    items = withRelated(items, fields)
 
     #Lists to sort fields for styling
     fieldNames = []
@@ -922,8 +698,8 @@ def itemTableUpdate(request):
         "Benefits": [("pers", "Public Employee Retirement System"), ("medicare", "Medicare"),("wc", "Workers Comp"), ("plar", "Paid Leave Accumulation Rate"), ("vacation", "Vacation"), ("sick", "Sick Leave"), ("holiday", "Holiday Leave"), ("total_hrly", "Total Hourly Cost"), ("percent_leave", "Percent Leave"), ("monthly_hours", "Monthly Hours"), ("board_share_hrly", "Board Share Hourly"), ("life_hourly", "Life Hourly"), ("salary", "Salary"), ("fringes", "Fringes"), ("total_comp", "Total Compensation")],
         "Payroll": [("pay_rate", "Pay Rate")],
         "Fund":[("calcRemaining", "Remaining"), ("budgeted", "Budgeted")],
-        "Line": [("budgetRemaining", "Budget Remaining"), ("budgetSpent", "Budget Spent"), ("totalIncome", "Total Income")],
-        "GrantLine": [("budgetRemaining", "Budget Remaining"), ("budgetSpent", "Budget Spent"), ("totalIncome", "Total Income")]
+        "Line": [("budgetRemaining", "Budget Remaining")],
+        "GrantLine": [("budgetRemaining", "Budget Remaining")]
     }
 
     #Fields that should be accumulated
@@ -978,117 +754,14 @@ def itemTableUpdate(request):
 
     return render(request, "WCHDApp/partials/itemTableUpdate.html", context)
 
+#Today's expenses and revenue with their totals by fund, line and payment type
+#Kept until one of the tables it reads changes, like the other reports
+@permission_required('WCHDApp.has_full_access', raise_exception=True)
 def dailyReport(request):
-    buffer = BytesIO()
-
-    # Create a PDF
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    elements = []
-    styles = getSampleStyleSheet()
-
-
-    title_style = ParagraphStyle(
-        "TitleStyle",
-        parent=styles["Title"],
-        fontSize=16,
-        spaceAfter=11,
-        fontName="Helvetica-Bold"
-    )
-
-    subtitle_style = ParagraphStyle(
-        "SubtitleStyle",
-        parent=styles["Normal"],
-        fontSize=11,
-        textColor=colors.black,
-        spaceAfter=6,
-        fontName="Helvetica-Oblique"
-    )
-
-
-    #logo = Image("logo.png", width=80, height=80)
-    #logo.hAlign = 'LEFT'
-    #elements.append(logo)
-
-    elements.append(Spacer(1, 12))
-
-    # Report Title
-    elements.append(Paragraph("Washington County Health Department", title_style))
-    elements.append(Paragraph(
-        "List of Active Grants. Active means they have been awarded and the final expenditure report has not yet been approved.",
-        subtitle_style
-    ))
-
-    elements.append(Spacer(1, 12))
-
-    #Same logic as tableView, needs updated to current 
-    model = apps.get_model('WCHDApp', 'transaction')
-    today = datetime.today().strftime('%Y-%m-%d')
-    values = model.objects.filter(date=today).values()
-    fields = model._meta.get_fields()
-    fieldNames = []
-    decimalFields = []
-    aliasNames = []
-    for field in fields:
-        if field.is_relation:
-            if field.auto_created:
-                continue
-            else:
-                parentModel = apps.get_model('WCHDApp', field.name)
-                fkName = parentModel._meta.pk.name
-                fkAlias = parentModel._meta.pk.verbose_name
-                aliasNames.append(fkAlias)
-                fieldNames.append(fkName)
-
-        else:
-            if isinstance(field, DecimalField):
-                decimalFields.append(field.name)
-            aliasNames.append(field.verbose_name)  
-            fieldNames.append(field.name)
-
-    data = [
-        aliasNames,
-    ]
-    
-    for row in values:
-        print(row)
-        line = []
-        for field in fieldNames:
-            line.append(row[field])
-        data.append(line)
-
-
-    # Table Styling
-    table = Table(data, colWidths=[80, 70, 70, 70, 70, 50, 100, 50, 90, 40])
-    table.setStyle(TableStyle([
-        ("BACKGROUND", (0, 0), (-1, 0), colors.darkgray),
-        ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
-        ("ALIGN", (0, 0), (-1, -1), "CENTER"),
-        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-        ("BOTTOMPADDING", (0, 0), (-1, 0), 5),
-        ("BACKGROUND", (0, 1), (-1, -1), colors.whitesmoke),
-        ("GRID", (0, 0), (-1, -1), 1, colors.black),
-        ("FONTSIZE", (0, 0), (-1, -1), 10),
-        ("TOPPADDING", (0, 0), (-1, 0), 10),
-    ]))
-
-    elements.append(table)
-
-    # Totals (below table)
-    elements.append(Spacer(1, 12))
-    elements.append(Paragraph("<b>Total Active Grants:</b> $571,880.00", styles["Normal"]))
-    elements.append(Paragraph("<b>Total Amount for Project:</b> $19,144.00", styles["Normal"]))
-
-    #Build PDF
-    doc.build(elements)
-
-    # Get the PDF value from buffer
-    buffer.seek(0)
-    pdf_data = buffer.getvalue()
-    buffer.close()
-
-    response = HttpResponse(pdf_data, content_type='application/pdf')
-    response['Content-Disposition'] = f'inline; filename="testing.pdf"'
-
+    day = localdate()
+    path = reportPath("dailyReport", {}, dailySources, "pdf", day)
+    response = HttpResponse(cachedBytes(path, lambda: dailyPdf(day)), content_type='application/pdf')
+    response['Content-Disposition'] = f'inline; filename="dailyReport-{day:%Y-%m-%d}.pdf"'
     return response
 
 def testing(request):
@@ -1124,213 +797,17 @@ def noPrivileges(request, exception):
 def clockifyImportPayroll(request, *args, **kwargs):
     message = ""
 
-    #Making an id to make payroll is like 2025-01
-    idTracker = 0
-    year = datetime.now().year
-    #Mapping fields from clockify to fields our models use
-    fieldMap = {
-        "Project": "ActivityList",
-        #"Department": "dept",
-        "User": "employee",
-        "Start Date": "beg_date",
-        "End Date": "end_date",
-        #"Billable Rate (USD)": "billableRate",
-        "Billable Amount (USD)": "pay_amount",
-        "Duration (decimal)": "hours"
-    }
-
     if request.method == 'POST':
         form = FileInput(request.POST, request.FILES)
         if form.is_valid():
-            selectedFile = form.cleaned_data['file']
-            dateInputted = request.POST.get("date")
-            print(f"DATE INPUTTED: {dateInputted}")
-            file = pd.read_csv(selectedFile)
-            file.dropna(how='all', inplace=True)
-            columns = file.columns
-            row = file.iloc[0]
-            data = []
-            
-            model = apps.get_model('WCHDApp', 'Payroll')
-            fields = model._meta.get_fields()
-            neededFields = []
-            #Exclude autocreated fields like id
-            for field in fields:
-                if not field.auto_created:
-                    neededFields.append(field.name)
-
-            columns = list(columns)
-            
-            #Creating a list of indices that we want from columns
-            neededIndexes = []
-            for i in range(len(columns)):
-                if columns[i] in fieldMap:
-                    #updated columns[i] to the name we need for the model
-                    columns[i] = fieldMap[columns[i]]
-                    neededIndexes.append(i)
-
-            #Creating a list of dictionaries for each row with the values we need
-            for i in range(len(file)):
-                dict = {}
-                row = file.iloc[i]
-                startTime = row["Start Time"]
-                startTimeHour = startTime.split(" ")[0]
-                for j in neededIndexes:
-                    column = columns[j]
-                    if column == "beg_date" or column == "end_date":
-                        payPeriodModel = apps.get_model('WCHDApp', 'PayPeriod')
-                        periods = payPeriodModel.objects.all()
-                        date = row[j]
-                        newDate = datetime.strptime(date, "%m/%d/%Y").date()
-                        dict[column] = newDate
-                        payPeriodFound = False
-                        for period in periods:
-                            if period.periodStart <= newDate <= period.periodEnd:
-                                dict['payperiod'] = period   
-                                payPeriodFound = True   
-                    else:
-                        dict[column] = row[j]
-                dict["startTime"] = startTimeHour
-                #dict['payroll_id'] = str(year)+"-"+str(idTracker)
-                idTracker += 1
-                data.append(dict)
-
-            lookUpFields = []
-            fks = []
-            for field in fields:
-                #Logic for foreign keys
-                if field.is_relation:
-                    fks.append(field.name)
-                else:
-                    lookUpFields.append(field)
-            try:
-                #transaction so that if something fails everything leading up to it is rolled back, no half imports
-                with transaction.atomic():
-                    
-                    for line in data:
-                        if 'payperiod' not in line:
-                            raise ValidationError({"payperiod": "No payperiod for this date range"}) 
-                        for key in line:
-                            if type(line[key]) == np.int64:
-                                line[key] = int(line[key])
-                            if key in fks:
-                                #Linking objects with the fields we have
-                                parentModel = apps.get_model('WCHDApp', key)
-                                if key == "employee":
-                                    names = line[key].split(" ")
-                                    try:
-                                        line[key] = parentModel.objects.get(first_name=names[0], surname=names[1])
-                                    except:
-                                        raise ValidationError({"employee": "No employee with this name"})
-                                elif key == "ActivityList":
-                                    try:
-                                        line[key] = parentModel.objects.get(program=line[key])
-                                    except:
-                                        raise ValidationError({"ActivityList": "Activity does not exist"})
-                                elif key == "dept":
-                                    try:
-                                        line[key] = parentModel.objects.get(dept_name=line[key])
-                                    except:
-                                        raise ValidationError({"dept": "Department does not exist"})
-                        #print(line)
-                        activity = line['ActivityList']
-
-                        payType = activity.payType
-                        if payType == "special":
-                            employee = line['employee']
-                            item = employee.specialPayItem
-                        elif payType == "admin":
-                            employee = line['employee']
-                            item = employee.payItem
-                        else:
-                            item = activity.item
-                        
-
-                        payRate = float(line['employee'].pay_rate)
-                        hours = line['hours']
-                        amount = payRate*hours
-                        user  = request.user
-                        try:
-                            employeeModel = apps.get_model('WCHDApp', "employee")
-                            employee = employeeModel.objects.get(user=user)
-                            #employeeEmail = employee.email
-                        except:
-                            raise ValidationError({"employee":"No employee with signed in user"})
-
-                        try:
-                            paidEmployee = line['employee']
-                        except:
-                            raise ValidationError({"employee": "No employee with this name"})
-                        try:
-                            people = People.objects.get(name=line['employee'])
-                        except:
-                            raise ValidationError({"people":"No People object with this name"})
-                        
-                        #Need a full id in order to tell if we are trying to reenter lines
-                        expenseFullID = f"{paidEmployee.employee_id}-{activity.ActivityList_id}-{line["beg_date"]}-{line["startTime"]}"
-                        duplicate = Expense.objects.filter(expenseFullID=expenseFullID).exists()
-                        if duplicate == False:
-                            #Whether or not we entered a posting date
-                            if dateInputted == "":
-                                expense = Expense(
-                                    item=item,
-                                    amount=amount,
-                                    people=people,
-                                    warrant=1,
-                                    comment="Payroll",
-                                    ActivityList=activity,
-                                    line=item.line,
-                                    employee=employee,
-                                    expenseFullID=expenseFullID)
-                            else:
-                                expense = Expense(
-                                    item=item,
-                                    date=dateInputted,
-                                    amount=amount,
-                                    people=people,
-                                    warrant=1,
-                                    comment="Payroll",
-                                    ActivityList=activity,
-                                    line=item.line,
-                                    employee=employee,
-                                    expenseFullID=expenseFullID)
-                            try:
-                                expense.full_clean()
-                                expense.save()
-                                message = "Posted"
-                            except ValidationError as e:
-                                raise ValidationError(e)
-                                
-                        else:
-                            print("Expense already posted")
-                   
-                        #Deleting start time from dictionary because its not a value in our payroll object
-                        line.pop("startTime", None)
-                        obj, _ = model.objects.update_or_create(
-                            **line,
-                            defaults = line
-                        )
-            except ValidationError as e:
-                #Setting messages for the frontend to the error messages from both view or model
-                message = e.message_dict
-                if message.get("warrant"):
-                    message = message['warrant'][0]
-                elif message.get("item"):
-                    message = message['item'][0]
-                elif message.get("amount"):
-                    message = message['amount'][0]
-                elif message.get("comment"):
-                    message = message['comment'][0] 
-                elif message.get("ActivityList"):
-                    message = message['ActivityList'][0]
-                elif message.get("people"):
-                    message = message['people'][0] 
-                elif message.get("employee"):
-                    message = message['employee'][0]
-                elif message.get("payperiod"):
-                    message = message['payperiod'][0]
-                elif message.get("dept"):
-                    message = message['dept'][0]
+            #Posting runs in the job worker, the status page shows progress and any errors
+            job = queueJob(
+                kind="clockifyImport",
+                params={"date": request.POST.get("date", ""), "dryRun": form.cleaned_data['dryRun']},
+                upload=form.cleaned_data['file'],
+                user=request.user,
+            )
+            return redirect('jobStatus', job.pk)
     else:
         form = FileInput()
     
@@ -1460,11 +937,9 @@ def fundSummary(request):
         #Have to use double underscore instead of dot here for whatever reason
         filteredRows = payrollModel.objects.filter(ActivityList__fund__fund_id=fundID, payperiod__payperiod_id=payperiodID)
 
-        totalPay = 0
-        totalHours = 0
-        for row in filteredRows:
-            totalPay += row.pay_amount
-            totalHours += row.hours
+        totals = filteredRows.aggregate(totalPay=Sum("pay_amount"), totalHours=Sum("hours"))
+        totalPay = totals["totalPay"] or 0
+        totalHours = totals["totalHours"] or 0
 
         context = {
             "specifiedField": "Fund Name",
@@ -1489,11 +964,9 @@ def activitySummary(request):
         #Have to use double underscore instead of dot here for whatever reason
         filteredRows = payrollModel.objects.filter(ActivityList__ActivityList_id=activityID, payperiod__payperiod_id=payperiodID)
 
-        totalPay = 0
-        totalHours = 0
-        for row in filteredRows:
-            totalPay += row.pay_amount
-            totalHours += row.hours
+        totals = filteredRows.aggregate(totalPay=Sum("pay_amount"), totalHours=Sum("hours"))
+        totalPay = totals["totalPay"] or 0
+        totalHours = totals["totalHours"] or 0
 
         context = {
             "specifiedField": "Activity Name",
@@ -1518,23 +991,23 @@ def employeeSummary(request):
         #Have to use double underscore instead of dot here for whatever reason
         filteredRows = payrollModel.objects.filter(employee__employee_id=employeeID, payperiod__payperiod_id=payperiodID)
 
-        totalPay = 0
-        totalHours = 0
-        for row in filteredRows:
-            totalPay += row.pay_amount
-            totalHours += row.hours
+        totals = filteredRows.aggregate(totalPay=Sum("pay_amount"), totalHours=Sum("hours"))
+        totalPay = totals["totalPay"] or 0
+        totalHours = totals["totalHours"] or 0
 
         activityModel = apps.get_model("WCHDApp", "ActivityList")
         activities = activityModel.objects.all()
 
+        #One grouped query for every activity instead of one query per activity
+        activityTotals = {}
+        for row in filteredRows.values("ActivityList").annotate(activityPay=Sum("pay_amount"), activityHours=Sum("hours")):
+            activityTotals[row["ActivityList"]] = row
+
         activitiesDict = {}
         for activity in activities:
-            activityFilteredRows = payrollModel.objects.filter(ActivityList=activity, payperiod__payperiod_id=payperiodID, employee__employee_id=employeeID)
-            activityPay = 0
-            activityHours = 0
-            for activityRow in activityFilteredRows:
-                activityPay += activityRow.pay_amount
-                activityHours += activityRow.hours
+            activityRow = activityTotals.get(activity.ActivityList_id, {})
+            activityPay = activityRow.get("activityPay", 0)
+            activityHours = activityRow.get("activityHours", 0)
             
             activitiesDict[activity.program] = {"name":activity.program, "sum":activityPay, "hours":activityHours}
 
@@ -1555,32 +1028,21 @@ def transactionCustomView(request):
 @permission_required('WCHDApp.has_full_access', raise_exception=True)
 def grantStats(request):
     grantModel = apps.get_model("WCHDApp", "Grant")
-    grants = grantModel.objects.all()
-
-    grantLineModel = apps.get_model("WCHDApp", "GrantLine")
+    #Every grants totals come from one grouped query, see GrantQuerySet.with_stats
+    grants = grantModel.objects.with_stats()
 
     #Going to be a list of dictionaries. Each grant will have a dictionary
     grantList = []
 
     for grant in grants:
-        grantLines = grantLineModel.objects.filter(grant = grant)
-
-        totalBudgeted = 0
-        totalSpent = 0
-        totalRemaining = 0
-        for grantLine in grantLines:
-            totalRemaining += grantLine.line_budget_remaining
-            totalSpent += grantLine.line_budget_spent
-            totalBudgeted += grantLine.line_budgeted
-
         grantDict = {
             "grantID": grant.grant_id,
             "grantName": grant.grant_name,
             "awardAmount": grant.award_amount,
-            "spent": totalSpent,
-            "remaining": totalRemaining,
-            "budgeted": totalBudgeted,
-            "received": grant.received
+            "spent": grant.spentTotal,
+            "remaining": grant.remainingTotal,
+            "budgeted": grant.budgetedTotal,
+            "received": grant.receivedTotal
         }
 
         grantList.append(grantDict)
@@ -1594,29 +1056,25 @@ def grantBreakdown(request):
     grantID = request.GET.get("grantID")
 
     grantModel = apps.get_model("WCHDApp", "Grant")
-    grant = grantModel.objects.get(pk=grantID)
+    grant = grantModel.objects.with_stats().get(pk=grantID)
 
     grantLineModel = apps.get_model("WCHDApp", "GrantLine")
-    grantLines = grantLineModel.objects.filter(grant__grant_id=grantID)
+    grantLines = grantLineModel.objects.with_rollups().filter(grant__grant_id=grantID)
 
     linesList = []
-    total = 0
     for line in grantLines:
-        total += line.line_budgeted
         lineDict = {
             "lineName": line.line_name,
             "budgeted": line.line_budgeted,
-            "remaining": line.line_budget_remaining,
-            "spent": line.line_budget_spent,
-            "income":line.line_total_income
+            "remaining": line.remainingTotal,
+            "spent": line.spentTotal,
+            "income":line.incomeTotal
         }
         linesList.append(lineDict)
 
-    unbudgeted = grant.award_amount - total
-
     context = {
         "linesList": linesList,
-        "unbudgeted": unbudgeted
+        "unbudgeted": grant.unbudgetedTotal
     }
 
     return render(request, "WCHDApp/partials/grantBreakdownTable.html", context)
@@ -1633,8 +1091,6 @@ def grantLineTableUpdate(request):
     message = ""
     grantID = request.GET.get("grant")
     grant = Grant.objects.get(pk=grantID)
-    
-    grantLines = GrantLine.objects.filter(grant=grant)
 
     #Getting just field names from model
     fields = GrantLine._meta.fields
@@ -1649,8 +1105,8 @@ def grantLineTableUpdate(request):
         "Benefits": [("pers", "Public Employee Retirement System"), ("medicare", "Medicare"),("wc", "Workers Comp"), ("plar", "Paid Leave Accumulation Rate"), ("vacation", "Vacation"), ("sick", "Sick Leave"), ("holiday", "Holiday Leave"), ("total_hrly", "Total Hourly Cost"), ("percent_leave", "Percent Leave"), ("monthly_hours", "Monthly Hours"), ("board_share_hrly", "Board Share Hourly"), ("life_hourly", "Life Hourly"), ("salary", "Salary"), ("fringes", "Fringes"), ("total_comp", "Total Compensation")],
         "Payroll": [("pay_rate", "Pay Rate")],
         "Fund":[("calcRemaining", "Remaining"), ("budgeted", "Budgeted")],
-        "Line": [("budgetRemaining", "Budget Remaining"), ("budgetSpent", "Budget Spent"), ("totalIncome", "Total Income")],
-        "GrantLine": [("budgetRemaining", "Budget Remaining"), ("budgetSpent", "Budget Spent"), ("totalIncome", "Total Income")]
+        "Line": [("budgetRemaining", "Budget Remaining")],
+        "GrantLine": [("budgetRemaining", "Budget Remaining")]
     }
 
     #Fields that should be accumulated
@@ -1690,7 +1146,7 @@ def grantLineTableUpdate(request):
     else:
         form = modelform_factory(GrantLine, exclude=["grant", "fund_year"])()
     
-    grantLines = GrantLine.objects.filter(grant=grant)
+    grantLines = withRelated(GrantLine.objects.filter(grant=grant), fields)
 
     context = {
         "fields": fieldNames, 
@@ -1700,7 +1156,8 @@ def grantLineTableUpdate(request):
         "form": form,
         "grant": grant,
         "message": message,
-        "grantAwardAmountRemaining":grant.grantAwardAmountRemaining
+        #Loaded after the form is handled so a line created in this request is counted
+        "grantAwardAmountRemaining": Grant.objects.with_stats().get(pk=grantID).unbudgetedTotal
     }
 
     return render(request, "WCHDApp/partials/grantLineTableUpdate.html", context)
@@ -1755,7 +1212,8 @@ def viewByYearPartial(request):
         "Testing": [("fundBalanceMinus3", "Fund Balance Minus 3")],
         "Benefits": [("pers", "Public Employee Retirement System"), ("medicare", "Medicare"),("wc", "Workers Comp"), ("plar", "Paid Leave Accumulation Rate"), ("vacation", "Vacation"), ("sick", "Sick Leave"), ("holiday", "Holiday Leave"), ("total_hrly", "Total Hourly Cost"), ("percent_leave", "Percent Leave"), ("monthly_hours", "Monthly Hours"), ("board_share_hrly", "Board Share Hourly"), ("life_hourly", "Life Hourly"), ("salary", "Salary"), ("fringes", "Fringes"), ("total_comp", "Total Compensation")],
         "Payroll": [("pay_rate", "Pay Rate")],
-        "Fund":[("calcRemaining", "Remaining")]
+        "Fund":[("calcRemaining", "Remaining")],
+        "Line": [("budgetRemaining", "Budget Remaining")]
     }
 
     #Requests come in as both get and post request whether it is the form being submitted or the htmx triggering the rendering
@@ -1763,7 +1221,7 @@ def viewByYearPartial(request):
     year = request.GET.get("yearDropdown") or request.POST.get("yearDropdown")
     model = apps.get_model('WCHDApp', modelName)
     if modelName == "Fund":
-        values = Fund.objects.filter(fund_id__startswith=year)
+        values = Fund.objects.with_budget_totals().filter(fund_id__startswith=year)
         fields = Fund._meta.fields 
         if request.method == "POST":
             form = modelform_factory(model, exclude=["fund_total"])(request.POST)
@@ -1774,7 +1232,7 @@ def viewByYearPartial(request):
         else:
             form = modelform_factory(model, exclude=["fund_total"])()
     if modelName == "Line":
-        values = Line.objects.filter(fund__fund_id__startswith=year)
+        values = Line.objects.with_rollups().filter(fund__fund_id__startswith=year)
         fields = Line._meta.fields
         if request.method == 'POST':
             form = modelform_factory(Line, exclude=["fund_year"])(request.POST)
@@ -1808,6 +1266,7 @@ def viewByYearPartial(request):
             form = modelform_factory(Item, exclude=["fund", "fund_year", "fund_type"])()
         
 
+    values = withRelated(values, fields)
     fieldNames = []
     aliasNames = []
     decimalFields = []
@@ -1854,7 +1313,7 @@ def testingTableViewFunction(request, tableName):
         "Benefits": [("pers", "Public Employee Retirement System"), ("medicare", "Medicare"),("wc", "Workers Comp"), ("plar", "Paid Leave Accumulation Rate"), ("vacation", "Vacation"), ("sick", "Sick Leave"), ("holiday", "Holiday Leave"), ("total_hrly", "Total Hourly Cost"), ("percent_leave", "Percent Leave"), ("monthly_hours", "Monthly Hours"), ("board_share_hrly", "Board Share Hourly"), ("life_hourly", "Life Hourly"), ("salary", "Salary"), ("fringes", "Fringes"), ("total_comp", "Total Compensation")],
         "Payroll": [("pay_rate", "Pay Rate")],
         "Fund":[("calcRemaining", "Remaining"), ("budgeted", "Budgeted")],
-        "GrantLine": [("budgetRemaining", "Budget Remaining"), ("budgetSpent", "Budget Spent"), ("totalIncome", "Total Income")],
+        "GrantLine": [("budgetRemaining", "Budget Remaining")],
         "Grant": [("grantAwardAmountRemaining", "Grant Award Amount Remaining"),( "recieved","Recieved")]
     }
 
@@ -55,6 +55,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'WCHDApp.middleware.QueryBudgetMiddleware',
 ]
 
 ROOT_URLCONF = 'WCHDProject.urls'
@@ -123,6 +124,27 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Logging
+# Per view query counts and timings from WCHDApp.middleware.QueryBudgetMiddleware go to the console
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'WCHDApp': {
+            'handlers': ['console'],
+            'level': os.getenv('WCHD_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
 
@@ -143,6 +165,20 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
+# Uploads waiting for the job worker and the files it produces. Not served directly, jobDownload checks permissions
+# The web and worker containers need to share this folder
+MEDIA_ROOT = os.getenv('WCHD_MEDIA_ROOT', os.path.join(BASE_DIR, 'media'))
+
+# True when a manage.py runjobs worker is running next to the web server (compose.yml). Without one the views
+# run imports, reconciles and reports in the request instead of leaving them queued
+JOB_WORKER = bool(os.getenv("WCHD_JOB_WORKER", "False") == "True")
+
+# Saved copies of reports and exports, see WCHDApp/reportcache.py. Safe to empty at any time
+REPORT_CACHE_ROOT = os.getenv('WCHD_REPORT_CACHE_ROOT', os.path.join(MEDIA_ROOT, 'reportCache'))
+
+# The nightly report set from manage.py build_reports, listed and served on the Reports page
+PREBUILT_REPORTS_ROOT = os.getenv('WCHD_PREBUILT_REPORTS_ROOT', os.path.join(MEDIA_ROOT, 'prebuiltReports'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 